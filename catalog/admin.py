@@ -1,6 +1,7 @@
 from django.contrib import admin
 
 from .models import Author, Book, BookInstance, Genre, Language
+from .pagination import EstimatedCountPaginator
 
 
 class BooksInline(admin.TabularInline):
@@ -20,14 +21,27 @@ class BooksInstanceInline(admin.TabularInline):
 
 @admin.register(Book)
 class BookAdmin(admin.ModelAdmin):
-    list_display = ('title', 'author', 'display_genre')
+    list_display = ('title', 'author', 'display_genre', 'copies_total', 'copies_available', 'copies_on_loan')
+    list_select_related = ('author',)
+    list_per_page = 100
     inlines = [BooksInstanceInline]
 
+    def get_queryset(self, request):
+        # display_genre reads the prefetched genres instead of querying per row
+        return super(BookAdmin, self).get_queryset(request).prefetch_related('genre')
+
 
 @admin.register(BookInstance)
 class BookInstanceAdmin(admin.ModelAdmin):
     list_display = ('book', 'status', 'borrower', 'due_back', 'id')
     list_filter = ('status', 'due_back')
+    list_select_related = ('book', 'borrower')
+    list_per_page = 100
+    # matches the (due_back, id) and (status, due_back) indexes
+    ordering = ('due_back', 'id')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    raw_id_fields = ('book', 'borrower')
     fieldsets = (
         (None, {
             'fields': ('book','imprint', 'id')
@@ -1,5 +1,15 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate, pre_migrate
 
 
 class CatalogConfig(AppConfig):
     name = 'catalog'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from . import search, timing
+
+        pre_migrate.connect(search.drop_triggers, sender=self)
+        post_migrate.connect(search.create_triggers, sender=self)
+        connection_created.connect(timing.install_cursors)
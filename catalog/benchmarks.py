@@ -0,0 +1,954 @@
+"""
+Benchmark scenarios run by ``manage.py benchmark <scenario>``.
+
+Every scenario runs against a throwaway test database and returns a
+JSON-serializable report.
+"""
+import collections
+import datetime
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth.models import Permission, User
+from django.db import OperationalError, connection, connections
+from django.db.backends import utils
+from django.db.models import Case, IntegerField, Sum, When
+from django.template import engines
+from django.template.backends.django import DjangoTemplates, Template
+from django.http import HttpResponse
+from django.test import Client, RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from . import counters, generate, holds, jobs, search, timing, visits
+from .models import Author, Book, BookInstance, Genre, Hold, Job, Language
+
+
+SCENARIOS = {}
+
+
+def scenario(name, file_database=False):
+    """
+    Register a scenario; ``file_database`` asks for an on-disk test database
+    that forked processes can share.
+    """
+    def register(func):
+        func.file_database = file_database
+        SCENARIOS[name] = func
+        return func
+    return register
+
+
+def _is_write(sql):
+    return sql.lstrip().split(' ', 1)[0].upper() in ('INSERT', 'UPDATE', 'DELETE')
+
+
+@scenario('visits')
+def visits_write_amplification(visitors=20, visits_per_visitor=50, **options):
+    """
+    Write statements per index page view for every visit counting mode.
+    """
+    report = {}
+    url = reverse('index')
+    for mode in visits.MODES:
+        visits.buffer.reset()
+        with override_settings(VISITS_MODE=mode, VISITS_FLUSH_INTERVAL=3600):
+            clients = [Client() for _ in range(visitors)]
+            started = time.time()
+            with CaptureQueriesContext(connection) as context:
+                for _ in range(visits_per_visitor):
+                    for client in clients:
+                        client.get(url)
+                visits.buffer.flush()
+            elapsed = time.time() - started
+
+        total_visits = visitors * visits_per_visitor
+        writes = sum(1 for query in context.captured_queries if _is_write(query['sql']))
+        report[mode] = {
+            'visits': total_visits,
+            'write_statements': writes,
+            'writes_per_visit': round(writes / total_visits, 4),
+            'requests_per_second': round(total_visits / elapsed, 1),
+        }
+    return report
+
+
+@scenario('bulk')
+def bulk_instances_throughput(copies=2000, **options):
+    """
+    Copies created per second: one POST per copy versus one bulk POST.
+    """
+    book = Book.objects.create(title='Benchmark title')
+    payload = [
+        {'book': book.pk, 'imprint': 'Imprint {}'.format(num), 'status': BookInstance.AVAILABLE_STATUS}
+        for num in range(copies)
+    ]
+    client = Client()
+    report = {}
+
+    started = time.time()
+    for item in payload:
+        client.post('/api/catalog/book-instances/', data=json.dumps(item), content_type='application/json')
+    elapsed = time.time() - started
+    report['one_at_a_time'] = {
+        'copies': copies,
+        'seconds': round(elapsed, 3),
+        'copies_per_second': round(copies / elapsed, 1),
+    }
+
+    BookInstance.objects.all().delete()
+    started = time.time()
+    with override_settings(BULK_MAX_BATCH_SIZE=max(copies, 1)):
+        response = client.post(
+            '/api/catalog/book-instances/bulk/',
+            data=json.dumps(payload),
+            content_type='application/json',
+        )
+    elapsed = time.time() - started
+    assert response.status_code == 201, response.content
+    report['bulk'] = {
+        'copies': copies,
+        'seconds': round(elapsed, 3),
+        'copies_per_second': round(copies / elapsed, 1),
+    }
+    report['speedup'] = round(report['bulk']['copies_per_second'] / report['one_at_a_time']['copies_per_second'], 1)
+    return report
+
+
+def _percentile(samples, percent):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100.0))]
+
+
+@scenario('search')
+def search_latency(books=100000, queries=200, **options):
+    """
+    Full-text search latency versus an ``icontains`` scan of the summaries.
+    """
+    rng = random.Random(0)
+    vocabulary = ['word{}x'.format(num) for num in range(5000)]
+    authors = Author.objects.bulk_create([
+        Author(first_name='First{}'.format(num), last_name='Last{}'.format(num))
+        for num in range(100)
+    ])
+    batch = []
+    for num in range(books):
+        batch.append(Book(
+            title=' '.join(rng.choice(vocabulary) for _ in range(4)),
+            summary=' '.join(rng.choice(vocabulary) for _ in range(40)),
+            author=authors[num % len(authors)],
+            isbn='{:013d}'.format(num),
+        ))
+        if len(batch) == 5000:
+            Book.objects.bulk_create(batch)
+            batch = []
+    Book.objects.bulk_create(batch)
+
+    # every other query looks for a word no book contains, the worst case for a scan
+    terms = [
+        rng.choice(vocabulary) if num % 2 else 'absent{}x'.format(num)
+        for num in range(queries)
+    ]
+    report = {'books': books, 'queries': queries}
+    strategies = [
+        ('icontains', lambda term: list(Book.objects.filter(summary__icontains=term).order_by('title')[:10])),
+    ]
+    if search.is_indexed():
+        strategies.append(('fts5', lambda term: list(search.search(term)[:10])))
+    for name, run in strategies:
+        timings = []
+        for term in terms:
+            started = time.time()
+            run(term)
+            timings.append((time.time() - started) * 1000)
+        report[name] = {
+            'p50_ms': round(_percentile(timings, 50), 2),
+            'p95_ms': round(_percentile(timings, 95), 2),
+            'max_ms': round(max(timings), 2),
+        }
+    return report
+
+
+@scenario('availability')
+def availability_latency(books=100000, copies_per_book=5, queries=20, **options):
+    """
+    The first page of books with a copy available, most available first,
+    grouped over the copies versus read from the book counters, and the
+    time a full ``reconcile_copy_counts --check`` takes.
+    """
+    generate.generate_library(books, copies_per_book, seed=0)
+    available_copies = Sum(Case(
+        When(bookinstance__status=BookInstance.AVAILABLE_STATUS, then=1),
+        default=0,
+        output_field=IntegerField(),
+    ))
+    strategies = [
+        ('grouped', lambda: list(
+            Book.objects.annotate(available_copies=available_copies)
+                        .filter(available_copies__gt=0)
+                        .order_by('-available_copies', 'title', 'id')[:10]
+        )),
+        ('counters', lambda: list(Book.objects.available().order_by(*Book.AVAILABILITY_ORDERING)[:10])),
+    ]
+    report = {'books': books, 'copies': books * copies_per_book, 'queries': queries}
+    for name, run in strategies:
+        timings = []
+        for _ in range(queries):
+            started = time.time()
+            run()
+            timings.append((time.time() - started) * 1000)
+        report[name] = {
+            'p50_ms': round(_percentile(timings, 50), 2),
+            'p95_ms': round(_percentile(timings, 95), 2),
+        }
+    started = time.time()
+    report['drifted_books'] = counters.drifted_books().count()
+    report['check_seconds'] = round(time.time() - started, 2)
+    return report
+
+
+def _hammer(request, seconds, results):
+    """
+    Call ``request()`` for ``seconds`` and put (ok, errors, timings) on ``results``.
+    """
+    ok = errors = 0
+    timings = []
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        started = time.time()
+        try:
+            response = request()
+        except OperationalError:
+            errors += 1
+        else:
+            if response.status_code in (200, 302):
+                ok += 1
+            else:
+                errors += 1
+        timings.append((time.time() - started) * 1000)
+    connections.close_all()
+    results.put((ok, errors, timings))
+
+
+def _summary(outcomes, seconds):
+    ok = sum(outcome[0] for outcome in outcomes)
+    timings = [timing for outcome in outcomes for timing in outcome[2]]
+    return {
+        'ok': ok,
+        'errors': sum(outcome[1] for outcome in outcomes),
+        'per_second': round(ok / seconds, 1),
+        'p50_ms': round(_percentile(timings, 50), 2) if timings else None,
+        'p95_ms': round(_percentile(timings, 95), 2) if timings else None,
+    }
+
+
+@scenario('concurrency', file_database=True)
+def sqlite_concurrency(readers=4, seconds=5, loans=200, **options):
+    """
+    Loan list reads per second from ``readers`` processes while one process
+    keeps renewing loans, with the configured SQLite PRAGMAs and without.
+    """
+    borrower = User.objects.create_user(username='borrower', password='12345')
+    librarian = User.objects.create_user(username='librarian', password='12345')
+    librarian.user_permissions.add(Permission.objects.get(codename='can_mark_returned'))
+    book = Book.objects.create(title='Benchmark title')
+    BookInstance.objects.bulk_create([
+        BookInstance(
+            book=book, imprint='Imprint', borrower=borrower,
+            status=BookInstance.ON_LOAN_STATUS,
+            due_back=datetime.date.today() + datetime.timedelta(days=num % 30),
+        )
+        for num in range(loans)
+    ])
+    copy_ids = list(BookInstance.objects.values_list('pk', flat=True))
+
+    tuned = connection.settings_dict['OPTIONS']
+    configurations = [
+        ('configured', tuned),
+        ('sqlite_defaults', {'pragmas': {'journal_mode': 'delete'}}),
+    ]
+    report = {'readers': readers, 'seconds': seconds, 'loans': loans}
+    context = multiprocessing.get_context('fork')
+    try:
+        for name, db_options in configurations:
+            connection.close()
+            connection.settings_dict['OPTIONS'] = db_options
+            clients = {}
+            for username in ('librarian', 'borrower'):
+                clients[username] = Client()
+                clients[username].login(username=username, password='12345')
+            # children must open their own connections
+            connections.close_all()
+
+            views = itertools.cycle([
+                (clients['librarian'], reverse('borrowed')),
+                (clients['borrower'], reverse('my-borrowed')),
+            ])
+
+            def read():
+                client, url = next(views)
+                return client.get(url)
+
+            rng = random.Random(0)
+
+            def write(client=clients['librarian']):
+                renewal = datetime.date.today() + datetime.timedelta(days=rng.randint(1, 27))
+                return client.post(
+                    reverse('renew-book-librarian', kwargs={'pk': rng.choice(copy_ids)}),
+                    {'renewal_date': renewal.isoformat()},
+                )
+
+            read_results, write_results = context.Queue(), context.Queue()
+            processes = [
+                context.Process(target=_hammer, args=(read, seconds, read_results))
+                for _ in range(readers)
+            ]
+            processes.append(context.Process(target=_hammer, args=(write, seconds, write_results)))
+            for process in processes:
+                process.start()
+            reads = [read_results.get() for _ in range(readers)]
+            writes = [write_results.get()]
+            for process in processes:
+                process.join()
+
+            report[name] = {
+                'pragmas': db_options.get('pragmas', {}),
+                'transaction_mode': db_options.get('transaction_mode'),
+                'reads': _summary(reads, seconds),
+                'writes': _summary(writes, seconds),
+            }
+    finally:
+        connection.close()
+        connection.settings_dict['OPTIONS'] = tuned
+    return report
+
+
+def _claim_copy(mode, borrower_id, copy_ids, barrier, results):
+    """
+    Try the copies in random order until one is lent to ``borrower_id``
+    and put (claimed, conflicts, errors) on ``results``.
+    """
+    client = Client()
+    rng = random.Random(borrower_id)
+    rng.shuffle(copy_ids)
+    claimed = conflicts = errors = 0
+    barrier.wait()
+    for pk in copy_ids:
+        url = '/api/catalog/book-instances/{}/'.format(pk)
+        try:
+            if mode == 'conditional_update':
+                response = client.post(url + 'checkout/', {'borrower': borrower_id})
+            else:
+                # the old read-modify-write through the generic endpoint
+                response = client.get(url)
+                if response.data['status'] != BookInstance.AVAILABLE_STATUS:
+                    conflicts += 1
+                    continue
+                response = client.patch(
+                    url,
+                    json.dumps({'status': BookInstance.ON_LOAN_STATUS, 'borrower': borrower_id}),
+                    content_type='application/json',
+                )
+        except OperationalError:
+            errors += 1
+            continue
+        if response.status_code == 200:
+            claimed = 1
+            break
+        if response.status_code == 409:
+            conflicts += 1
+        else:
+            errors += 1
+    connections.close_all()
+    results.put((claimed, conflicts, errors))
+
+
+@scenario('checkout', file_database=True)
+def checkout_contention(clients=50, copies=10, **options):
+    """
+    ``clients`` processes race to borrow one of ``copies`` copies, with the
+    conditional checkout endpoint and with a read-then-PATCH client.
+    """
+    User.objects.bulk_create([
+        User(username='borrower{}'.format(num)) for num in range(clients)
+    ])
+    borrower_ids = list(User.objects.order_by('pk').values_list('pk', flat=True))
+    book = Book.objects.create(title='Benchmark title')
+    context = multiprocessing.get_context('fork')
+    report = {'clients': clients, 'copies': copies}
+    for mode in ('conditional_update', 'read_modify_write'):
+        BookInstance.objects.all().delete()
+        BookInstance.objects.bulk_create([
+            BookInstance(book=book, imprint='Imprint', status=BookInstance.AVAILABLE_STATUS)
+            for _ in range(copies)
+        ])
+        copy_ids = [str(pk) for pk in BookInstance.objects.values_list('pk', flat=True)]
+        # children must open their own connections
+        connections.close_all()
+
+        barrier, results = context.Barrier(clients), context.Queue()
+        processes = [
+            context.Process(target=_claim_copy, args=(mode, borrower_id, list(copy_ids), barrier, results))
+            for borrower_id in borrower_ids
+        ]
+        started = time.time()
+        for process in processes:
+            process.start()
+        outcomes = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+        elapsed = time.time() - started
+
+        claimed = sum(outcome[0] for outcome in outcomes)
+        lent = BookInstance.objects.filter(status=BookInstance.ON_LOAN_STATUS).count()
+        report[mode] = {
+            'clients_told_success': claimed,
+            'copies_on_loan': lent,
+            # successes that another client silently overwrote
+            'lost_updates': claimed - lent,
+            'conflicts': sum(outcome[1] for outcome in outcomes),
+            'errors': sum(outcome[2] for outcome in outcomes),
+            'seconds': round(elapsed, 2),
+        }
+    return report
+
+
+@jobs.task('benchmark_mark')
+def _mark(path, token, ms=0):
+    """
+    Sleep ``ms`` and append ``token`` to ``path``, one line per run.
+    """
+    time.sleep(ms / 1000.0)
+    with open(path, 'a') as marks:
+        marks.write('{}\n'.format(token))
+
+
+def _drain(poll_interval):
+    jobs.Worker(poll_interval=poll_interval).run(burst=True)
+    connections.close_all()
+
+
+@scenario('jobs', file_database=True)
+def job_throughput(queued=500, workers=4, task_ms=5, **options):
+    """
+    ``queued`` short jobs drained by one worker and by ``workers`` worker
+    processes sharing the jobs table; every job must run exactly once.
+    """
+    context = multiprocessing.get_context('fork')
+    report = {'queued': queued, 'task_ms': task_ms}
+    for concurrency in (1, workers):
+        marks_path = os.path.join(
+            os.path.dirname(connection.settings_dict['NAME']), 'marks-{}.txt'.format(concurrency),
+        )
+        Job.objects.all().delete()
+        Job.objects.bulk_create([
+            Job(name='benchmark_mark', kwargs=json.dumps({'path': marks_path, 'token': num, 'ms': task_ms}))
+            for num in range(queued)
+        ])
+        # children must open their own connections
+        connections.close_all()
+
+        processes = [context.Process(target=_drain, args=(0.05,)) for _ in range(concurrency)]
+        started = time.time()
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        elapsed = time.time() - started
+
+        with open(marks_path) as marks:
+            runs = marks.read().split()
+        report['workers_{}'.format(concurrency)] = {
+            'seconds': round(elapsed, 2),
+            'jobs_per_second': round(queued / elapsed, 1),
+            'done': Job.objects.filter(status=Job.DONE_STATUS).count(),
+            'runs': len(runs),
+            'duplicate_runs': len(runs) - len(set(runs)),
+            'retried': Job.objects.filter(attempts__gt=1).count(),
+        }
+    return report
+
+
+Endpoint = collections.namedtuple('Endpoint', 'name method path user data setup status')
+
+
+def _endpoint(name, path, method='get', user=None, data=None, setup=None, status=200):
+    """
+    A request to time. ``path`` and a callable ``data`` get the value of
+    ``setup()``, which runs untimed before every request, e.g. to create
+    the row a DELETE removes.
+    """
+    return Endpoint(name, method, path, user, data, setup, status)
+
+
+def _route_endpoints(book, author, genre, language, on_loan, available, borrower, held_book):
+    """
+    One or more requests for every URL pattern of the catalog and its API.
+    """
+    librarian, patron = 'librarian', 'borrower'
+    today = datetime.date.today()
+    renewal = (today + datetime.timedelta(weeks=2)).isoformat()
+
+    def new_author():
+        return Author.objects.create(first_name='New', last_name='Author').pk
+
+    def new_book():
+        return Book.objects.create(title='New book', author=author).pk
+
+    genre_names = ('New genre {}'.format(num) for num in itertools.count())
+
+    def new_genre():
+        return Genre.objects.create(name=next(genre_names)).pk
+
+    def new_job():
+        return jobs.enqueue('rebuild_counters').pk
+
+    def new_copies():
+        copies = [BookInstance(book=book, imprint='New') for _ in range(100)]
+        BookInstance.objects.bulk_create(copies)
+        return [str(copy.pk) for copy in copies]
+
+    def make_available():
+        BookInstance.objects.filter(pk=available.pk).update(
+            status=BookInstance.AVAILABLE_STATUS, borrower=None, due_back=None,
+        )
+        return available.pk
+
+    def lend():
+        BookInstance.objects.filter(pk=available.pk).update(
+            status=BookInstance.ON_LOAN_STATUS, borrower=borrower, due_back=today,
+        )
+        return available.pk
+
+    def leave_queue():
+        Hold.objects.filter(book=held_book, patron=borrower).delete()
+
+    def join_queue():
+        leave_queue()
+        return holds.place(held_book, borrower).pk
+
+    copy_fields = {'book': book.pk, 'imprint': 'New', 'status': BookInstance.MAINTENANCE_STATUS}
+    bulk_update = [{'id': str(copy.pk), 'imprint': copy.imprint} for copy in BookInstance.objects.all()[:100]]
+    return [
+        # catalog/urls.py
+        _endpoint('index', '/catalog/'),
+        _endpoint('book-list', '/catalog/books/'),
+        _endpoint('book-list available', '/catalog/books/?available=1&sort=available'),
+        _endpoint('book-search', '/catalog/search/?q=secret+sea'),
+        _endpoint('book-detail', '/catalog/books/{}'.format(book.pk)),
+        _endpoint('author-list', '/catalog/authors/'),
+        _endpoint('author-detail', '/catalog/authors/{}'.format(author.pk)),
+        _endpoint('my-borrowed', '/catalog/mybooks/', user=patron),
+        _endpoint('borrowed', '/catalog/borrowed/', user=librarian),
+        _endpoint('renew-book-librarian', '/catalog/book/{}/renew/'.format(on_loan.pk), user=librarian),
+        _endpoint('renew-book-librarian POST', '/catalog/book/{}/renew/'.format(on_loan.pk), 'post',
+                  librarian, {'renewal_date': renewal}, status=302),
+        _endpoint('cache-stats', '/catalog/cache-stats/', user=librarian),
+        _endpoint('metrics', '/metrics'),
+        _endpoint('catalog-export', '/catalog/export/books.ndjson', user=librarian),
+        _endpoint('author-create', '/catalog/author/create/', user=librarian),
+        _endpoint('author-create POST', '/catalog/author/create/', 'post', librarian,
+                  {'first_name': 'New', 'last_name': 'Author'}, status=302),
+        _endpoint('author_update', '/catalog/author/{}/update/'.format(author.pk), user=librarian),
+        _endpoint('author_update POST', '/catalog/author/{}/update/'.format(author.pk), 'post', librarian,
+                  {'first_name': author.first_name, 'last_name': author.last_name}, status=302),
+        _endpoint('author_delete', '/catalog/author/{}/delete/'.format(author.pk), user=librarian),
+        _endpoint('author_delete POST', '/catalog/author/{}/delete/', 'post', librarian,
+                  setup=new_author, status=302),
+        _endpoint('book-create', '/catalog/book/create/', user=librarian),
+        _endpoint('book-update', '/catalog/book/{}/update/'.format(book.pk), user=librarian),
+        _endpoint('book-delete', '/catalog/book/{}/delete/'.format(book.pk), user=librarian),
+        _endpoint('book-delete POST', '/catalog/book/{}/delete/', 'post', librarian,
+                  setup=new_book, status=302),
+        # catalog/urls_api.py
+        _endpoint('api-root', '/api/catalog/'),
+        _endpoint('api-genres-list', '/api/catalog/genres/'),
+        _endpoint('api-genres-detail', '/api/catalog/genres/{}/'.format(genre.pk)),
+        _endpoint('api-genres-detail DELETE', '/api/catalog/genres/{}/', 'delete',
+                  setup=new_genre, status=204),
+        _endpoint('api-languages-list', '/api/catalog/languages/'),
+        _endpoint('api-languages-detail', '/api/catalog/languages/{}/'.format(language.pk)),
+        _endpoint('api-books-list', '/api/catalog/books/'),
+        _endpoint('api-books-list cursor', '/api/catalog/books/?cursor='),
+        _endpoint('api-books-list available', '/api/catalog/books/?available=true&sort=available&cursor='),
+        _endpoint('api-books-search', '/api/catalog/books/search/?q=secret+sea'),
+        _endpoint('api-books-detail', '/api/catalog/books/{}/'.format(book.pk)),
+        _endpoint('api-books-detail PATCH', '/api/catalog/books/{}/'.format(book.pk), 'patch',
+                  data={'title': book.title}),
+        _endpoint('api-book-instances-list', '/api/catalog/book-instances/'),
+        _endpoint('api-book-instances-list POST', '/api/catalog/book-instances/', 'post',
+                  data=copy_fields, status=201),
+        _endpoint('api-book-instances-detail', '/api/catalog/book-instances/{}/'.format(on_loan.pk)),
+        _endpoint('api-book-instances-bulk PATCH', '/api/catalog/book-instances/bulk/', 'patch',
+                  data=bulk_update),
+        _endpoint('api-book-instances-bulk DELETE', '/api/catalog/book-instances/bulk/', 'delete',
+                  data=lambda ids: ids, setup=new_copies, status=204),
+        _endpoint('api-book-instances-checkout', '/api/catalog/book-instances/{}/checkout/', 'post',
+                  data={'borrower': borrower.pk}, setup=make_available),
+        _endpoint('api-book-instances-return', '/api/catalog/book-instances/{}/return/', 'post',
+                  setup=lend),
+        _endpoint('api-book-instances-renew', '/api/catalog/book-instances/{}/renew/'.format(on_loan.pk),
+                  'post', data={'due_back': renewal}),
+        _endpoint('api-authors-list', '/api/catalog/authors/'),
+        _endpoint('api-authors-detail', '/api/catalog/authors/{}/'.format(author.pk)),
+        _endpoint('api-holds-list', '/api/catalog/holds/?book={}'.format(held_book.pk)),
+        _endpoint('api-holds-list POST', '/api/catalog/holds/', 'post',
+                  data={'book': held_book.pk, 'patron': borrower.pk}, setup=leave_queue, status=201),
+        _endpoint('api-holds-detail', '/api/catalog/holds/{}/', setup=join_queue),
+        _endpoint('api-holds-detail DELETE', '/api/catalog/holds/{}/', 'delete',
+                  setup=join_queue, status=204),
+        _endpoint('api-jobs-list', '/api/catalog/jobs/', user=librarian),
+        _endpoint('api-jobs-list POST', '/api/catalog/jobs/', 'post', librarian,
+                  {'name': 'rebuild_counters'}, status=202),
+        _endpoint('api-jobs-detail', '/api/catalog/jobs/{}/', user=librarian, setup=new_job),
+    ]
+
+
+def _route_patterns():
+    """
+    (prefix, pattern) for every URL pattern of the catalog and its API,
+    leaving out the API's ``.json``-style format suffix variants.
+    """
+    from .urls import urlpatterns
+    from .urls_api import router
+
+    patterns = [('/catalog/', pattern) for pattern in urlpatterns]
+    patterns += [
+        ('/api/catalog/', pattern) for pattern in router.urls
+        if '(?P<format>' not in pattern.regex.pattern
+    ]
+    return patterns
+
+
+def _uncovered_routes(endpoints):
+    paths = [endpoint.path.split('?')[0] for endpoint in endpoints]
+    uncovered = []
+    for prefix, pattern in _route_patterns():
+        if not any(
+            path.startswith(prefix) and pattern.regex.search(path[len(prefix):].replace('{}', '1'))
+            for path in paths
+        ):
+            uncovered.append(prefix + pattern.regex.pattern)
+    return uncovered
+
+
+def _send(client, endpoint, context):
+    path = endpoint.path.format(context)
+    data = endpoint.data(context) if callable(endpoint.data) else endpoint.data
+    if endpoint.method == 'get' or data is None:
+        response = getattr(client, endpoint.method)(path)
+    elif endpoint.method == 'post' and not isinstance(data, list):
+        response = client.post(path, data)
+    else:
+        response = getattr(client, endpoint.method)(path, json.dumps(data), content_type='application/json')
+    if response.streaming:
+        b''.join(response.streaming_content)
+    return response
+
+
+@scenario('routes')
+def route_latency(books=2000, copies_per_book=5, borrowers=100, requests=20, **options):
+    """
+    Latency, queries per request and memory of every catalog and API route
+    against a synthetic library of ``books`` books with ``copies_per_book``
+    copies each.
+    """
+    generate.generate_library(books, copies_per_book, seed=0, borrowers=borrowers)
+    User.objects.create_superuser('librarian', 'librarian@example.com', '12345')
+    borrower = User.objects.filter(username__startswith='patron').first()
+    book = Book.objects.order_by('pk').first()
+    on_loan = BookInstance.objects.filter(borrower=borrower).first()
+    available = BookInstance.objects.filter(status=BookInstance.AVAILABLE_STATUS).first()
+    held_book = Book.objects.create(title='Held book', author=book.author)
+    endpoints = _route_endpoints(
+        book, book.author, Genre.objects.first(), Language.objects.first(),
+        on_loan, available, borrower, held_book,
+    )
+    clients = {None: Client(), 'librarian': Client(), 'borrower': Client()}
+    clients['librarian'].force_login(User.objects.get(username='librarian'))
+    clients['borrower'].force_login(borrower)
+
+    report = {
+        'books': books,
+        'copies': books * copies_per_book,
+        'requests': requests,
+        'uncovered_routes': _uncovered_routes(endpoints),
+        'endpoints': {},
+    }
+    for endpoint in endpoints:
+        client = clients[endpoint.user]
+        timings, queries, unexpected = [], [], set()
+        # the first request warms caches and is not counted
+        for iteration in range(requests + 1):
+            context = endpoint.setup() if endpoint.setup else None
+            started = time.time()
+            with CaptureQueriesContext(connection) as captured:
+                response = _send(client, endpoint, context)
+            elapsed = (time.time() - started) * 1000
+            if response.status_code != endpoint.status:
+                unexpected.add(response.status_code)
+            if iteration:
+                timings.append(elapsed)
+                queries.append(len(captured))
+
+        context = endpoint.setup() if endpoint.setup else None
+        tracemalloc.start()
+        _send(client, endpoint, context)
+        peak_alloc = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        report['endpoints'][endpoint.name] = {
+            'method': endpoint.method.upper(),
+            'path': endpoint.path,
+            'p50_ms': round(_percentile(timings, 50), 2),
+            'p95_ms': round(_percentile(timings, 95), 2),
+            'p99_ms': round(_percentile(timings, 99), 2),
+            'queries': max(queries),
+            'peak_alloc_kb': peak_alloc // 1024,
+            'unexpected_statuses': sorted(unexpected),
+        }
+    return report
+
+
+@contextmanager
+def _request_timing(enabled):
+    """
+    Leave out the request timing middleware, template backend and cursors
+    unless ``enabled``.
+    """
+    if enabled:
+        yield
+        return
+    middleware = [name for name in settings.MIDDLEWARE if name != 'catalog.timing.TimingMiddleware']
+    templates = [
+        dict(engine, BACKEND='django.template.backends.django.DjangoTemplates')
+        if engine['BACKEND'] == 'catalog.timing.TimedDjangoTemplates' else engine
+        for engine in settings.TEMPLATES
+    ]
+    installed = {name: vars(connection).pop(name, None) for name in ('make_cursor', 'make_debug_cursor')}
+    try:
+        with override_settings(MIDDLEWARE=middleware, TEMPLATES=templates):
+            yield
+    finally:
+        for name, method in installed.items():
+            if method is not None:
+                setattr(connection, name, method)
+
+
+# what request timing may add to the latency of any page
+TIMING_BUDGET_PERCENT = 2.0
+
+
+def _best_of(func, loops, repeats=5):
+    """
+    Microseconds per call of ``func``, from the fastest of ``repeats`` runs
+    of ``loops`` calls.
+    """
+    best = None
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for _ in range(loops):
+            func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best / loops * 10 ** 6
+
+
+@contextmanager
+def _timed_request():
+    """
+    Make the timed cursors and templates record, as during a timed request.
+    """
+    timing._local.timings = timing.RequestTimings()
+    try:
+        yield
+    finally:
+        timing._local.timings = None
+
+
+@contextmanager
+def _counting_renders(renders):
+    render = timing.TimedTemplate.render
+
+    def counted(self, *args, **kwargs):
+        renders.append(self)
+        return render(self, *args, **kwargs)
+
+    timing.TimedTemplate.render = counted
+    try:
+        yield
+    finally:
+        timing.TimedTemplate.render = render
+
+
+def _instrumentation_costs(loops):
+    """
+    Microseconds that request timing adds per request (the middleware),
+    per query and per template render, over the code it wraps.
+    """
+    request = RequestFactory().get('/')
+    request.resolver_match = None
+    response = HttpResponse()
+
+    def plain_view(request):
+        return response
+
+    def timed_view(request):
+        middleware.process_view(request, timed_view, (), {})
+        return response
+
+    middleware = timing.TimingMiddleware(timed_view)
+    plain_request = _best_of(lambda: plain_view(request), loops)
+    timed_request = _best_of(lambda: middleware(request), loops)
+
+    with connection.cursor() as cursor:
+        plain_cursor = utils.CursorWrapper(cursor.cursor, connection)
+        timed_cursor = timing.TimedCursorWrapper(cursor.cursor, connection)
+        plain_query = _best_of(lambda: plain_cursor.execute('SELECT 1'), loops)
+        with _timed_request():
+            timed_query = _best_of(lambda: timed_cursor.execute('SELECT 1'), loops)
+
+    # each render includes wrapping the template, as get_template() does
+    backend = next(engine for engine in engines.all() if isinstance(engine, DjangoTemplates))
+    compiled = backend.from_string('{{ value }}').template
+    plain_render = _best_of(lambda: Template(compiled, backend).render({'value': 1}), loops)
+    with _timed_request():
+        timed_render = _best_of(
+            lambda: timing.TimedTemplate(Template(compiled, backend).template, backend).render({'value': 1}),
+            loops,
+        )
+
+    # drop the routes observed above from this process's metrics
+    timing.registry.reset()
+    return {
+        'request': max(timed_request - plain_request, 0.0),
+        'query': max(timed_query - plain_query, 0.0),
+        'render': max(timed_render - plain_render, 0.0),
+    }
+
+
+@scenario('timing')
+def timing_overhead(books=500, copies_per_book=5, blocks=20, requests=20, loops=20000, **options):
+    """
+    Latency that request timing (Server-Timing header and per-route
+    histograms) adds to a mix of catalog and API pages, against the
+    TIMING_BUDGET_PERCENT budget.
+
+    End to end, blocks of ``requests`` requests per page alternate between
+    timing on and off; switching recompiles templates, so each block starts
+    with an uncounted warm-up request per page. Each pair of blocks gives
+    one overhead sample, reported as a mean with a 95% confidence interval,
+    which is a few percent wide on a busy machine. ``overhead_bound_percent``
+    is the tighter figure: the costs timing adds per request, query and
+    template render, measured in isolation, times the queries and renders
+    of each page, over its untimed median latency, for the worst page.
+    """
+    generate.generate_library(books, copies_per_book, seed=0)
+    book = Book.objects.order_by('pk').first()
+    paths = [
+        reverse('index'),
+        reverse('book-list'),
+        reverse('book-detail', args=[book.pk]),
+        reverse('author-list'),
+        '/api/catalog/books/',
+        '/api/catalog/books/{}/'.format(book.pk),
+    ]
+    samples = []
+    for block in range(blocks * 2):
+        timed = block % 2 == 0
+        block_samples = collections.defaultdict(list)
+        with _request_timing(timed):
+            client = Client()
+            for path in paths:
+                client.get(path)
+            for _ in range(requests):
+                for path in paths:
+                    started = time.perf_counter()
+                    client.get(path)
+                    block_samples[path].append((time.perf_counter() - started) * 1000)
+        samples.append(block_samples)
+
+    costs = _instrumentation_costs(loops)
+    report = {
+        'blocks': blocks,
+        'requests': requests,
+        'costs_us': {name: round(cost, 3) for name, cost in costs.items()},
+        'bookkeeping_us_per_request': round(costs['request'], 2),
+        'pages': {},
+    }
+    client = Client()
+    bounds = []
+    for path in paths:
+        timed_samples = [sample for block in samples[0::2] for sample in block[path]]
+        untimed_samples = [sample for block in samples[1::2] for sample in block[path]]
+        medians = {True: _percentile(timed_samples, 50), False: _percentile(untimed_samples, 50)}
+        renders = []
+        with CaptureQueriesContext(connection) as queries, _counting_renders(renders):
+            client.get(path)
+        added_us = costs['request'] + len(queries) * costs['query'] + len(renders) * costs['render']
+        bound = added_us / 1000 / medians[False] * 100
+        bounds.append(bound)
+        report['pages'][path] = {
+            'p50_ms': round(medians[False], 3),
+            'p50_timed_ms': round(medians[True], 3),
+            'overhead_percent': round((medians[True] / medians[False] - 1) * 100, 2),
+            'queries': len(queries),
+            'renders': len(renders),
+            'overhead_bound_percent': round(bound, 3),
+        }
+
+    pairs = [
+        (
+            sum(_percentile(timed[path], 50) for path in paths) /
+            sum(_percentile(untimed[path], 50) for path in paths) - 1
+        ) * 100
+        for timed, untimed in zip(samples[0::2], samples[1::2])
+    ]
+    mean = statistics.mean(pairs)
+    margin = 1.96 * statistics.stdev(pairs) / len(pairs) ** 0.5 if len(pairs) > 1 else None
+    report['overhead_percent'] = round(mean, 2)
+    report['overhead_ci95_percent'] = None if margin is None else [round(mean - margin, 2), round(mean + margin, 2)]
+    report['overhead_bound_percent'] = round(max(bounds), 3)
+    report['within_budget'] = max(bounds) < TIMING_BUDGET_PERCENT
+    return report
+
+
+COMPARED_METRICS = ('p50_ms', 'p95_ms', 'p99_ms', 'queries', 'peak_alloc_kb')
+# latency differences below this are noise, whatever the percentage
+NOISE_FLOOR_MS = 1.0
+
+
+def compare(report, baseline, threshold):
+    """
+    Return the metrics of ``report`` that are more than ``threshold``
+    percent worse than the same metric in ``baseline``.
+    """
+    regressions = []
+
+    def walk(current, previous, path):
+        for key, value in current.items():
+            if key not in previous:
+                continue
+            if isinstance(value, dict) and isinstance(previous[key], dict):
+                walk(value, previous[key], path + [key])
+            elif key in COMPARED_METRICS and value is not None and previous[key] is not None:
+                limit = previous[key] * (1 + threshold / 100.0)
+                if key.endswith('_ms'):
+                    limit = max(limit, previous[key] + NOISE_FLOOR_MS)
+                if value > limit:
+                    regressions.append({
+                        'metric': '.'.join(path + [key]),
+                        'baseline': previous[key],
+                        'current': value,
+                    })
+
+    walk(report, baseline, [])
+    return regressions
@@ -0,0 +1,137 @@
+"""
+Batch create, update and delete of BookInstance rows.
+
+Every operation runs in a single transaction, issues a bounded number of
+statements per batch and accounts for its changes in the catalog counters
+once instead of per row. It also bumps the table version for conditional
+GETs and drops the cached copies sections of the affected books.
+"""
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from . import counters, fragments, holds, signals, versions
+from .models import BookInstance
+
+
+QUERY_BATCH_SIZE = 500
+UPDATE_BATCH_SIZE = 100
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def in_bulk(queryset, pks):
+    """
+    QuerySet.in_bulk() that stays under the database's query parameter limit.
+    """
+    objects = {}
+    for chunk in chunked(pks, QUERY_BATCH_SIZE):
+        objects.update(queryset.in_bulk(chunk))
+    return objects
+
+
+def _available(status):
+    return int(status == BookInstance.AVAILABLE_STATUS)
+
+
+def create_instances(items):
+    """
+    Insert validated items and return the new BookInstance objects.
+    """
+    instances = [BookInstance(**item) for item in items]
+    with transaction.atomic():
+        BookInstance.objects.bulk_create(instances, batch_size=QUERY_BATCH_SIZE)
+        counters.adjust(
+            num_instances=len(instances),
+            num_instances_available=sum(_available(instance.status) for instance in instances),
+        )
+        counters.adjust_books(added=[(instance.book_id, instance.status) for instance in instances])
+        versions.bump(BookInstance)
+        fragments.invalidate(*{instance.book_id for instance in instances})
+        holds.allocate([instance for instance in instances if _available(instance.status)])
+    return instances
+
+
+def update_instances(instances, items):
+    """
+    Apply validated partial ``items`` to the matching ``instances``.
+
+    Rows are updated in batches with one ``UPDATE ... SET f = CASE pk ...``
+    statement per batch.
+    """
+    fields = {field.name: field for field in BookInstance._meta.concrete_fields}
+    available_delta = 0
+    released = []
+    book_ids = {instance.book_id for instance in instances}
+    before = [(instance.book_id, instance.status) for instance in instances]
+    for instance, item in zip(instances, items):
+        was_available = _available(instance.status)
+        for name, value in item.items():
+            setattr(instance, name, value)
+        available_delta += _available(instance.status) - was_available
+        if _available(instance.status) and not was_available:
+            released.append(instance)
+
+    changed = sorted({
+        name for item in items for name in item
+        if name in fields and not fields[name].primary_key
+    })
+    now = timezone.now()
+    with transaction.atomic():
+        for batch in chunked(zip(instances, items), UPDATE_BATCH_SIZE):
+            updates = {}
+            for name in changed:
+                field = fields[name]
+                whens = [
+                    When(pk=instance.pk, then=Value(getattr(instance, field.attname), output_field=field))
+                    for instance, item in batch
+                    if name in item
+                ]
+                if whens:
+                    updates[field.attname] = Case(*whens, default=F(field.attname), output_field=field)
+            if updates:
+                BookInstance.objects \
+                            .filter(pk__in=[instance.pk for instance, _ in batch]) \
+                            .update(updated_at=now, **updates)
+                for instance, _ in batch:
+                    instance.updated_at = now
+        counters.adjust(num_instances_available=available_delta)
+        counters.adjust_books(
+            added=[(instance.book_id, instance.status) for instance in instances],
+            removed=before,
+        )
+        versions.bump(BookInstance)
+        fragments.invalidate(*book_ids | {instance.book_id for instance in instances})
+        holds.allocate(released)
+    return instances
+
+
+def delete_instances(pks):
+    """
+    Delete the given rows and return how many were removed.
+    """
+    with transaction.atomic():
+        removed = []
+        for chunk in chunked(pks, QUERY_BATCH_SIZE):
+            removed.extend(BookInstance.objects.filter(pk__in=chunk).values_list('book_id', 'status'))
+            with signals.muted():
+                BookInstance.objects.filter(pk__in=chunk).delete()
+        counters.adjust(
+            num_instances=-len(removed),
+            num_instances_available=-sum(_available(status) for _, status in removed),
+        )
+        # also touches the books, whose pages list their copies
+        counters.adjust_books(removed=removed)
+        versions.bump(BookInstance)
+        fragments.invalidate(*{book_id for book_id, _ in removed})
+        holds.requeue(book_id for book_id, status in removed if status == BookInstance.RESERVED_STATUS)
+    return len(removed)
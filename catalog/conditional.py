@@ -0,0 +1,103 @@
+"""
+Conditional GET support: ETag and Last-Modified validators computed from
+``updated_at`` columns and table versions, checked before any template or
+serializer work.
+"""
+import hashlib
+from calendar import timegm
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from . import versions
+from .models import Author, Book, BookInstance, Genre, Language
+
+
+def make_etag(*parts):
+    return '"{}"'.format(hashlib.md5(repr(parts).encode('utf-8')).hexdigest())
+
+
+def latest(*values):
+    values = [value for value in values if value is not None]
+    return max(values) if values else None
+
+
+def respond(request, validators, render):
+    """
+    Return 304 (or 412) when the validators match the request, otherwise
+    call ``render()`` and attach ETag and Last-Modified to its response.
+
+    ``validators`` is ``(parts, last_modified)`` or None when unknown, e.g.
+    because the object does not exist.
+    """
+    if validators is None:
+        return render()
+
+    parts, last_modified = validators
+    user = getattr(request, 'user', None)
+    etag = make_etag(getattr(user, 'pk', None), *parts)
+    timestamp = timegm(last_modified.utctimetuple()) if last_modified else None
+
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is None:
+        response = render()
+    if 200 <= response.status_code < 300 or response.status_code == 304:
+        if timestamp and not response.has_header('Last-Modified'):
+            response['Last-Modified'] = http_date(timestamp)
+        if not response.has_header('ETag'):
+            response['ETag'] = etag
+    return response
+
+
+def book_validators(pk):
+    """
+    A book page shows the book, its author, genres, language and copies.
+
+    Copy updates show up in the newest copy ``updated_at``; deleting a copy
+    or changing the book's genres touches the book itself.
+    """
+    row = Book.objects \
+              .filter(pk=pk) \
+              .annotate(copies_updated_at=Max('bookinstance__updated_at'), copies=Count('bookinstance')) \
+              .values_list('updated_at', 'author_id', 'author__updated_at', 'copies_updated_at', 'copies') \
+              .first()
+    if row is None:
+        return None
+    updated_at, author_id, author_updated_at, copies_updated_at, copies = row
+    lookups, lookups_updated_at = versions.stamp(Genre, Language)
+    parts = (updated_at, author_id, author_updated_at, copies_updated_at, copies, lookups)
+    return parts, latest(updated_at, author_updated_at, copies_updated_at, lookups_updated_at)
+
+
+def author_validators(pk):
+    """
+    An author page lists the author's books with their copy counts.
+    """
+    updated_at = Author.objects.filter(pk=pk).values_list('updated_at', flat=True).first()
+    if updated_at is None:
+        return None
+    tables, tables_updated_at = versions.stamp(Book, BookInstance)
+    return (updated_at, tables), latest(updated_at, tables_updated_at)
+
+
+def table_validators(*models):
+    tables, updated_at = versions.stamp(*models)
+    return (tables,), updated_at
+
+
+class ConditionalGetMixin(object):
+    """
+    Answer conditional GETs of a class-based view from ``get_validators()``
+    without rendering it.
+    """
+
+    def get_validators(self):
+        return None
+
+    def get(self, request, *args, **kwargs):
+        return respond(
+            request,
+            self.get_validators(),
+            lambda: super(ConditionalGetMixin, self).get(request, *args, **kwargs),
+        )
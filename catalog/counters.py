@@ -0,0 +1,174 @@
+import collections
+
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Author, Book, BookInstance, CatalogCounters, Genre
+
+
+COUNTERS_PK = 1
+QUERY_BATCH_SIZE = 500
+COUNTER_FIELDS = (
+    'num_books',
+    'num_instances',
+    'num_instances_available',
+    'num_authors',
+    'num_genres',
+)
+BOOK_COUNTER_FIELDS = Book.COUNTER_FIELDS
+
+
+def count_all():
+    """
+    Compute the totals from the real tables.
+    """
+    return {
+        'num_books': Book.objects.count(),
+        'num_instances': BookInstance.objects.count(),
+        'num_instances_available': BookInstance.objects.filter(
+            status__exact=BookInstance.AVAILABLE_STATUS
+        ).count(),
+        'num_authors': Author.objects.count(),
+        'num_genres': Genre.objects.count(),
+    }
+
+
+def rebuild():
+    with transaction.atomic():
+        counters, _ = CatalogCounters.objects.update_or_create(
+            pk=COUNTERS_PK,
+            defaults=count_all(),
+        )
+    return counters
+
+
+def read():
+    """
+    Return the counters row, building it on first use.
+    """
+    try:
+        return CatalogCounters.objects.get(pk=COUNTERS_PK)
+    except CatalogCounters.DoesNotExist:
+        return rebuild()
+
+
+def adjust(**deltas):
+    """
+    Atomically add deltas to the stored totals, e.g. adjust(num_books=1).
+
+    Nothing is written while the row does not exist yet; it is built from
+    the real tables on the next read.
+    """
+    changes = {
+        field: F(field) + delta
+        for field, delta in deltas.items()
+        if delta
+    }
+    unknown = set(changes) - set(COUNTER_FIELDS)
+    if unknown:
+        raise ValueError('Unknown counters: {}'.format(', '.join(sorted(unknown))))
+    if changes:
+        CatalogCounters.objects.filter(pk=COUNTERS_PK).update(**changes)
+
+
+def check():
+    """
+    Compare stored totals against real counts.
+
+    Return a dict of {field: (stored, actual)} for every counter that drifted.
+    """
+    stored = read()
+    actual = count_all()
+    return {
+        field: (getattr(stored, field), actual[field])
+        for field in COUNTER_FIELDS
+        if getattr(stored, field) != actual[field]
+    }
+
+
+def copy_counts(status):
+    """
+    What one copy in ``status`` adds to the counters of its book.
+    """
+    return {
+        'copies_total': 1,
+        'copies_available': int(status == BookInstance.AVAILABLE_STATUS),
+        'copies_on_loan': int(status == BookInstance.ON_LOAN_STATUS),
+    }
+
+
+def adjust_books(added=(), removed=()):
+    """
+    Atomically count copies into and out of the counters of their books.
+
+    ``added`` and ``removed`` are (book_id, status) pairs; a copy changing
+    status or book is removed as it was and added as it is. Books with the
+    same deltas are updated by one statement, which also moves their
+    ``updated_at`` for conditional GETs.
+    """
+    deltas = collections.defaultdict(collections.Counter)
+    for sign, copies in ((1, added), (-1, removed)):
+        for book_id, status in copies:
+            if book_id is not None:
+                for field, count in copy_counts(status).items():
+                    deltas[book_id][field] += sign * count
+
+    books = collections.defaultdict(list)
+    for book_id, counts in deltas.items():
+        changes = tuple(sorted((field, delta) for field, delta in counts.items() if delta))
+        if changes:
+            books[changes].append(book_id)
+    now = timezone.now()
+    for changes, book_ids in sorted(books.items()):
+        # ascending ids, so concurrent adjustments lock books in the same order
+        book_ids.sort()
+        for start in range(0, len(book_ids), QUERY_BATCH_SIZE):
+            Book.objects.filter(pk__in=book_ids[start:start + QUERY_BATCH_SIZE]).update(
+                updated_at=now, **{field: F(field) + delta for field, delta in changes}
+            )
+
+
+def _counted_copies(**filters):
+    copies = BookInstance.objects.filter(book=OuterRef('pk'), **filters) \
+                                 .order_by() \
+                                 .values('book') \
+                                 .annotate(count=Count('pk')) \
+                                 .values('count')
+    return Coalesce(Subquery(copies, output_field=IntegerField()), Value(0))
+
+
+def count_books():
+    """
+    Expressions computing the book counters from the copies table.
+    """
+    return {
+        'copies_total': _counted_copies(),
+        'copies_available': _counted_copies(status=BookInstance.AVAILABLE_STATUS),
+        'copies_on_loan': _counted_copies(status=BookInstance.ON_LOAN_STATUS),
+    }
+
+
+def drifted_books():
+    """
+    Books whose stored counters differ from their copies, annotated with
+    the actual values as ``actual_<field>``.
+    """
+    actual = {'actual_' + field: expression for field, expression in count_books().items()}
+    drifted = Q()
+    for field in BOOK_COUNTER_FIELDS:
+        drifted |= ~Q(**{field: F('actual_' + field)})
+    return Book.objects.annotate(**actual).filter(drifted)
+
+
+def reconcile_books():
+    """
+    Rewrite the counters of every drifted book and return how many were fixed.
+    """
+    with transaction.atomic():
+        book_ids = list(drifted_books().order_by('pk').values_list('pk', flat=True))
+        for start in range(0, len(book_ids), QUERY_BATCH_SIZE):
+            Book.objects.filter(pk__in=book_ids[start:start + QUERY_BATCH_SIZE]) \
+                        .update(updated_at=timezone.now(), **count_books())
+    return len(book_ids)
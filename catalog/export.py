@@ -0,0 +1,138 @@
+"""
+Streaming export of catalog tables as NDJSON or CSV.
+
+Rows are read in primary key order in chunks of ``chunk_size`` with
+``values_list()``, so memory use stays flat whatever the table size. The
+``Book.genre`` many-to-many is resolved with one query per chunk.
+"""
+import csv
+import logging
+import time
+from collections import OrderedDict
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Author, Book, BookInstance
+
+
+logger = logging.getLogger(__name__)
+
+DATASETS = OrderedDict([
+    ('books', (Book, ('id', 'title', 'author_id', 'summary', 'isbn', 'language_id'))),
+    ('authors', (Author, ('id', 'first_name', 'last_name', 'date_of_birth', 'date_of_death'))),
+    ('book-instances', (BookInstance, ('id', 'book_id', 'imprint', 'due_back', 'status', 'borrower_id'))),
+])
+FORMATS = ('ndjson', 'csv')
+DEFAULT_CHUNK_SIZE = 2000
+
+
+class ExportStats(object):
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self.rows = 0
+        self.started = time.time()
+        self.finished = None
+
+    @property
+    def seconds(self):
+        return (self.finished or time.time()) - self.started
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return 'Exported {} {} rows in {:.2f}s ({:.0f} rows/s)'.format(
+            self.rows, self.dataset, self.seconds, self.rows_per_second
+        )
+
+
+def columns(dataset):
+    model, fields = DATASETS[dataset]
+    if model is Book:
+        return fields + ('genre',)
+    return fields
+
+
+def _genres_by_book(book_ids):
+    genres = {}
+    through = Book.genre.through.objects \
+                                .filter(book_id__in=book_ids) \
+                                .order_by('book_id', 'genre_id') \
+                                .values_list('book_id', 'genre_id')
+    for book_id, genre_id in through:
+        genres.setdefault(book_id, []).append(genre_id)
+    return genres
+
+
+def iter_rows(dataset, chunk_size=DEFAULT_CHUNK_SIZE, stats=None):
+    """
+    Yield every row of ``dataset`` as an OrderedDict of column values.
+    """
+    model, fields = DATASETS[dataset]
+    queryset = model.objects.order_by('pk').values_list(*fields)
+    last_pk = None
+    while True:
+        chunk_queryset = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        chunk = list(chunk_queryset[:chunk_size])
+        if not chunk:
+            break
+        last_pk = chunk[-1][0]
+
+        genres = _genres_by_book([row[0] for row in chunk]) if model is Book else None
+        for values in chunk:
+            row = OrderedDict(zip(fields, values))
+            if genres is not None:
+                row['genre'] = genres.get(row['id'], [])
+            if stats is not None:
+                stats.rows += 1
+            yield row
+
+
+def render_ndjson(rows):
+    encoder = DjangoJSONEncoder()
+    for row in rows:
+        yield encoder.encode(row) + '\n'
+
+
+class _Echo(object):
+    """
+    File-like object handing back what csv.writer writes to it.
+    """
+
+    def write(self, value):
+        return value
+
+
+def render_csv(rows, header):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow([
+            ';'.join(str(item) for item in value) if isinstance(value, list) else
+            '' if value is None else value
+            for value in row.values()
+        ])
+
+
+def export(dataset, fmt, chunk_size=DEFAULT_CHUNK_SIZE, stats=None):
+    """
+    Return an iterator of text lines for ``dataset`` in format ``fmt``.
+    """
+    if dataset not in DATASETS:
+        raise ValueError('Unknown dataset: {}'.format(dataset))
+    if fmt not in FORMATS:
+        raise ValueError('Unknown format: {}'.format(fmt))
+
+    rows = iter_rows(dataset, chunk_size=chunk_size, stats=stats)
+    if fmt == 'ndjson':
+        lines = render_ndjson(rows)
+    else:
+        lines = render_csv(rows, columns(dataset))
+
+    for line in lines:
+        yield line
+    if stats is not None:
+        stats.finished = time.time()
+        logger.info('%s', stats)
@@ -0,0 +1,109 @@
+"""
+Cached rendering of the copies section of book pages.
+
+Every book has a generation number in the cache and its rendered copies
+are stored under a key containing it. Saving or deleting a copy or its
+book moves the generation on (right away and again on commit), so a
+section rendered from data read before the write is never served after it.
+Sections are shared by all clients, so the copies are always read from the
+primary database, never from a replica that may lag behind the write.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .models import BookInstance
+
+
+TEMPLATE = 'catalog/includes/book_copies.html'
+HITS_KEY = 'catalog:copies:hits'
+MISSES_KEY = 'catalog:copies:misses'
+
+
+def _generation_key(book_id):
+    return 'catalog:copies:generation:{}'.format(book_id)
+
+
+def _fragment_key(book_id, generation):
+    return 'catalog:copies:{}:{}'.format(book_id, generation)
+
+
+def _new_generation():
+    # time based, so an evicted generation is never reused while old fragments live
+    return int(time.time() * 1000000)
+
+
+def _generation(book_id):
+    key = _generation_key(book_id)
+    generation = cache.get(key)
+    if generation is None:
+        generation = _new_generation()
+        if not cache.add(key, generation, None):
+            generation = cache.get(key, generation)
+    return generation
+
+
+def _count(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, None):
+            cache.incr(key)
+
+
+def render_copies(book):
+    """
+    Return the HTML listing the copies of ``book``, from the cache when it
+    is still valid.
+    """
+    generation = _generation(book.pk)
+    key = _fragment_key(book.pk, generation)
+    html = cache.get(key)
+    if html is None:
+        _count(MISSES_KEY)
+        copies = BookInstance.objects \
+                             .using(DEFAULT_DB_ALIAS) \
+                             .filter(book=book) \
+                             .order_by('status', 'due_back', 'id')
+        html = render_to_string(TEMPLATE, {'copies': copies})
+        cache.set(key, html, settings.COPIES_CACHE_TIMEOUT)
+    else:
+        _count(HITS_KEY)
+    return mark_safe(html)
+
+
+def invalidate(*book_ids):
+    """
+    Drop the cached copies sections of the given books.
+    """
+    book_ids = {pk for pk in book_ids if pk is not None}
+    if not book_ids:
+        return
+
+    def bump():
+        generation = _new_generation()
+        cache.set_many({_generation_key(pk): generation for pk in book_ids}, None)
+
+    bump()
+    # readers inside the window before commit may have cached the old copies
+    transaction.on_commit(bump)
+
+
+def stats():
+    counts = cache.get_many([HITS_KEY, MISSES_KEY])
+    hits = counts.get(HITS_KEY, 0)
+    misses = counts.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / total, 4) if total else None,
+    }
+
+
+def reset_stats():
+    cache.delete_many([HITS_KEY, MISSES_KEY])
@@ -0,0 +1,267 @@
+"""
+Deterministic synthetic library for load testing and reproducing
+production-scale problems.
+
+The same ``seed`` and ``today`` always produce the same rows. Small
+tables (languages, genres, authors, borrowers) are written with
+``bulk_create``. Books, their genres and their copies are written in
+chunks, one transaction per chunk, with ``executemany`` INSERTs: building
+a model instance per row costs more than the INSERT itself, and at ten
+million copies that is the difference between minutes and an hour.
+"""
+import datetime
+import itertools
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import counters, versions
+from .models import Author, Book, BookInstance, Genre, Language
+
+
+GENRES = (
+    'Fantasy', 'Science Fiction', 'Mystery', 'Thriller', 'Romance', 'Horror',
+    'Historical Fiction', 'Literary Fiction', 'Poetry', 'Drama', 'Biography',
+    'History', 'Philosophy', 'Science', 'Travel', 'Cooking', 'Children',
+    'Young Adult', 'Graphic Novel', 'Essays',
+)
+# (name, weight)
+LANGUAGES = (
+    ('English', 60), ('Spanish', 10), ('French', 8), ('German', 7),
+    ('Italian', 5), ('Portuguese', 4), ('Japanese', 3), ('Russian', 3),
+)
+FIRST_NAMES = (
+    'Ada', 'Alan', 'Alice', 'Anna', 'Arthur', 'Carlos', 'Chiara', 'Clara', 'Daniel',
+    'Elena', 'Emil', 'Emma', 'Felix', 'Grace', 'Hana', 'Hugo', 'Ines', 'Ivan', 'Jane',
+    'Jorge', 'Karl', 'Kenji', 'Lena', 'Leo', 'Lucia', 'Marta', 'Mary', 'Nora', 'Olga',
+    'Omar', 'Paul', 'Pierre', 'Rosa', 'Ruth', 'Sofia', 'Tomas', 'Ursula', 'Victor',
+    'Yuki', 'Zora',
+)
+LAST_NAMES = (
+    'Abe', 'Alvarez', 'Baker', 'Bauer', 'Bianchi', 'Brown', 'Costa', 'Dubois', 'Evans',
+    'Fischer', 'Garcia', 'Hansen', 'Ivanova', 'Jensen', 'Kato', 'Klein', 'Kowalski',
+    'Larsen', 'Lopez', 'Martin', 'Meyer', 'Moreau', 'Novak', 'Okafor', 'Petrov',
+    'Rossi', 'Santos', 'Schmidt', 'Silva', 'Smith', 'Suzuki', 'Taylor', 'Tanaka',
+    'Valdez', 'Wagner', 'Weber', 'Wilson', 'Yilmaz', 'Zimmer', 'Zhang',
+)
+ADJECTIVES = (
+    'Silent', 'Broken', 'Golden', 'Hidden', 'Last', 'Lost', 'Midnight', 'Northern',
+    'Burning', 'Distant', 'Glass', 'Iron', 'Quiet', 'Scarlet', 'Secret', 'Winter',
+    'Wild', 'Forgotten', 'Endless', 'Hollow',
+)
+NOUNS = (
+    'River', 'Garden', 'House', 'Kingdom', 'Road', 'Sea', 'City', 'Island', 'Mountain',
+    'Forest', 'Letter', 'Promise', 'Shadow', 'Storm', 'Song', 'Tower', 'Bridge',
+    'Library', 'Machine', 'Orchard', 'Harbor', 'Station', 'Crown', 'Mirror',
+)
+WORDS = (
+    'a', 'the', 'of', 'and', 'in', 'story', 'family', 'war', 'love', 'journey', 'secret',
+    'young', 'old', 'town', 'life', 'death', 'friend', 'stranger', 'world', 'time',
+    'memory', 'truth', 'power', 'home', 'letter', 'night', 'summer', 'winter', 'sea',
+    'city', 'village', 'daughter', 'son', 'mother', 'father', 'king', 'queen', 'detective',
+    'murder', 'ship', 'island', 'river', 'discovers', 'returns', 'loses', 'finds',
+    'must', 'between', 'after', 'before', 'across', 'against', 'during', 'forgotten',
+)
+PUBLISHERS = (
+    'Penguin', 'Vintage', 'Faber', 'Gallimard', 'Anagrama', 'Suhrkamp', 'Einaudi',
+    'Shinchosha', 'Tor', 'Orbit', 'Picador', 'Bloomsbury',
+)
+
+# (status, weight); copies on loan are overdue OVERDUE_PERCENT of the time
+STATUSES = (
+    (BookInstance.AVAILABLE_STATUS, 60),
+    (BookInstance.ON_LOAN_STATUS, 30),
+    (BookInstance.MAINTENANCE_STATUS, 10),
+)
+OVERDUE_PERCENT = 15
+
+
+class GenerateStats(object):
+
+    def __init__(self):
+        self.started = time.time()
+        self.books = 0
+        self.copies = 0
+        self.authors = 0
+        self.borrowers = 0
+
+    @property
+    def copies_per_second(self):
+        elapsed = time.time() - self.started
+        return self.copies / elapsed if elapsed else 0.0
+
+    def __str__(self):
+        return (
+            '{books} books, {copies} copies, {authors} authors, {borrowers} borrowers '
+            'at {rate:.0f} copies/s'
+        ).format(rate=self.copies_per_second, **self.__dict__)
+
+
+def isbn13(number):
+    """
+    A valid ISBN-13 in the 978 range for ``number``.
+    """
+    digits = '978{:09d}'.format(number % 10 ** 9)
+    total = sum(int(digit) * (3 if index % 2 else 1) for index, digit in enumerate(digits))
+    return digits + str((10 - total % 10) % 10)
+
+
+def _weighted(rng, choices):
+    values = [value for value, _ in choices]
+    cumulative = list(itertools.accumulate(weight for _, weight in choices))
+    return lambda: rng.choices(values, cum_weights=cumulative)[0]
+
+
+def insert_rows(model, columns, rows, batch_size=5000):
+    """
+    INSERT ``rows`` (tuples of database-ready values for ``columns``) with
+    one ``executemany`` per batch.
+    """
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        connection.ops.quote_name(model._meta.db_table),
+        ', '.join(connection.ops.quote_name(column) for column in columns),
+        ', '.join(['%s'] * len(columns)),
+    )
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            cursor.executemany(sql, rows[start:start + batch_size])
+
+
+class LibraryGenerator(object):
+    """
+    Fill an empty catalog with ``books`` books of ``copies_per_book`` copies each.
+    """
+
+    def __init__(self, books, copies_per_book, seed=0, borrowers=None, today=None, chunk_size=10000):
+        self.books = books
+        self.copies_per_book = copies_per_book
+        self.borrowers = borrowers if borrowers is not None else max(books // 10, 1)
+        self.today = today or datetime.date.today()
+        self.chunk_size = chunk_size
+        self.rng = random.Random(seed)
+        # every generated row is stamped with midnight of ``today``
+        self.now = timezone.make_aware(datetime.datetime.combine(self.today, datetime.time()), timezone.utc)
+        self.stats = GenerateStats()
+
+    def run(self, progress=None):
+        if Book.objects.exists():
+            raise ValueError('The catalog is not empty; generate a library into an empty database.')
+        with transaction.atomic():
+            self.create_lookups()
+        first_id = 1
+        for start in range(0, self.books, self.chunk_size):
+            size = min(self.chunk_size, self.books - start)
+            with transaction.atomic():
+                self.write_chunk(first_id + start, size)
+            if progress:
+                progress(self.stats)
+        # explicit ids do not advance PostgreSQL's sequences
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [Book]):
+                cursor.execute(sql)
+        counters.rebuild()
+        versions.bump(Author, Language, Genre, Book, BookInstance)
+        return self.stats
+
+    def create_lookups(self):
+        rng = self.rng
+        Language.objects.bulk_create([Language(name=name) for name, _ in LANGUAGES])
+        Genre.objects.bulk_create([Genre(name=name) for name in GENRES])
+
+        authors = []
+        for _ in range(max(self.books // 8, 1)):
+            born = datetime.date(rng.randint(1850, 1995), rng.randint(1, 12), rng.randint(1, 28))
+            died = None
+            if born.year < 1950 and rng.random() < 0.7:
+                died = born + datetime.timedelta(days=rng.randint(40 * 365, 95 * 365))
+                died = died if died < self.today else None
+            authors.append(Author(
+                first_name=rng.choice(FIRST_NAMES),
+                last_name=rng.choice(LAST_NAMES),
+                date_of_birth=born,
+                date_of_death=died,
+            ))
+        Author.objects.bulk_create(authors)
+
+        User.objects.bulk_create([
+            User(
+                username='patron{:07d}'.format(num),
+                email='patron{:07d}@example.com'.format(num),
+                password='!',  # unusable
+                date_joined=self.now,
+            )
+            for num in range(self.borrowers)
+        ])
+
+        self.language_ids = {language.name: language.pk for language in Language.objects.all()}
+        self.genre_ids = list(Genre.objects.order_by('pk').values_list('pk', flat=True))
+        self.author_ids = list(Author.objects.order_by('pk').values_list('pk', flat=True))
+        self.borrower_ids = list(
+            User.objects.filter(username__startswith='patron').order_by('pk').values_list('pk', flat=True)
+        )
+        self.language = _weighted(rng, LANGUAGES)
+        self.stats.authors = len(self.author_ids)
+        self.stats.borrowers = len(self.borrower_ids)
+
+    def write_chunk(self, first_id, size):
+        rng = self.rng
+        now = Book._meta.get_field('updated_at').get_db_prep_value(self.now, connection)
+        date_field = BookInstance._meta.get_field('due_back')
+        due_dates = {
+            days: date_field.get_db_prep_value(self.today + datetime.timedelta(days=days), connection)
+            for days in range(-60, 29)
+        }
+        statuses, cum_weights = zip(*STATUSES)
+        cum_weights = list(itertools.accumulate(cum_weights))
+
+        books, genres, copies = [], [], []
+        for book_id in range(first_id, first_id + size):
+            # a few authors write most of the books
+            author_id = self.author_ids[int(len(self.author_ids) * rng.random() ** 2)]
+            title = 'The {} {}'.format(rng.choice(ADJECTIVES), rng.choice(NOUNS))
+            summary = ' '.join(rng.choices(WORDS, k=rng.randint(20, 60))).capitalize() + '.'
+            language_id = self.language_ids[self.language()]
+            for genre_id in rng.sample(self.genre_ids, rng.randint(1, 3)):
+                genres.append((book_id, genre_id))
+            imprint = '{}, {}'.format(rng.choice(PUBLISHERS), rng.randint(1950, self.today.year))
+            book_statuses = rng.choices(statuses, cum_weights=cum_weights, k=self.copies_per_book)
+            books.append((
+                book_id, title, author_id, summary, isbn13(book_id), language_id, now,
+                len(book_statuses),
+                book_statuses.count(BookInstance.AVAILABLE_STATUS),
+                book_statuses.count(BookInstance.ON_LOAN_STATUS),
+            ))
+            for status in book_statuses:
+                borrower_id = due_back = None
+                if status == BookInstance.ON_LOAN_STATUS:
+                    borrower_id = rng.choice(self.borrower_ids)
+                    if rng.randint(1, 100) <= OVERDUE_PERCENT:
+                        due_back = due_dates[-rng.randint(1, 60)]
+                    else:
+                        due_back = due_dates[rng.randint(0, 28)]
+                # the 32 hex digit form is accepted by every backend's UUID column
+                copy_id = '{:032x}'.format(rng.getrandbits(128))
+                copies.append((copy_id, book_id, imprint, due_back, status, borrower_id, now))
+
+        insert_rows(
+            Book,
+            ('id', 'title', 'author_id', 'summary', 'isbn', 'language_id', 'updated_at')
+            + counters.BOOK_COUNTER_FIELDS,
+            books,
+        )
+        insert_rows(Book.genre.through, ('book_id', 'genre_id'), genres)
+        insert_rows(
+            BookInstance,
+            ('id', 'book_id', 'imprint', 'due_back', 'status', 'borrower_id', 'updated_at'),
+            copies,
+        )
+        self.stats.books += len(books)
+        self.stats.copies += len(copies)
+
+
+def generate_library(books, copies_per_book, seed=0, **kwargs):
+    return LibraryGenerator(books, copies_per_book, seed=seed, **kwargs).run()
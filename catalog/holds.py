@@ -0,0 +1,190 @@
+"""
+Per-book FIFO hold queues.
+
+A patron places a hold on a book and waits in line. Whenever a copy of
+the book becomes available it is reserved for the patron at the head of
+the queue, in the transaction that made it available, and stays reserved
+until that patron checks it out (see ``catalog.loans.checkout``) or
+cancels the hold. Making a reserved copy available by hand withdraws its
+reservation, and a hold whose reserved copy is deleted goes back to the
+head of the queue.
+
+Waiting holds of a book carry consecutive ``sequence`` numbers: joining
+takes the largest of all the book's holds plus one, allocation takes the
+smallest, and a cancellation shifts the holds behind it down by one. A
+position is then ``sequence - smallest sequence + 1``, two index lookups
+however long the queue is.
+"""
+from django.db import transaction
+from django.db.models import F, Max, Min, OuterRef, Subquery
+from django.utils import timezone
+
+from . import counters, fragments, versions
+from .models import Book, BookInstance, Hold
+
+
+QUERY_BATCH_SIZE = 500
+
+
+class HoldError(Exception):
+    pass
+
+
+def waiting(book_id):
+    return Hold.objects.filter(book_id=book_id, copy__isnull=True)
+
+
+def with_positions(queryset):
+    """
+    Annotate holds with the sequence at the head of their queue, which
+    position() uses instead of querying per hold.
+    """
+    head = waiting(OuterRef('book_id')).order_by('sequence').values('sequence')[:1]
+    return queryset.annotate(queue_head=Subquery(head))
+
+
+def position(hold):
+    """
+    Return the 1-based place of ``hold`` in its queue, or 0 if a copy is reserved for it.
+    """
+    if hold.copy_id is not None:
+        return 0
+    head = getattr(hold, 'queue_head', None)
+    if head is None:
+        head = waiting(hold.book_id).aggregate(head=Min('sequence'))['head']
+    return hold.sequence - head + 1
+
+
+def place(book, patron):
+    """
+    Put ``patron`` at the end of the queue for ``book`` and return the hold.
+
+    A copy that is already available is reserved for the patron right away.
+    """
+    with transaction.atomic():
+        # serializes joins to the same queue where the database supports it
+        list(Book.objects.select_for_update().filter(pk=book.pk).values_list('pk'))
+        if Hold.objects.filter(book=book, patron=patron).exists():
+            raise HoldError('This patron already holds this book.')
+        # over allocated holds too, which may rejoin the queue (see requeue())
+        tail = Hold.objects.filter(book=book).aggregate(tail=Max('sequence'))['tail'] or 0
+        hold = Hold.objects.create(book=book, patron=patron, sequence=tail + 1)
+        copy = BookInstance.objects.filter(book=book, status=BookInstance.AVAILABLE_STATUS).first()
+        if copy is not None:
+            allocate([copy])
+            hold.refresh_from_db()
+    return hold
+
+
+def cancel(hold):
+    """
+    Drop ``hold``; a copy reserved for it goes to the next patron in line.
+    """
+    with transaction.atomic():
+        deleted, _ = Hold.objects.filter(pk=hold.pk).delete()
+        if not deleted:
+            return
+        if hold.copy_id is None:
+            waiting(hold.book_id).filter(sequence__gt=hold.sequence).update(sequence=F('sequence') - 1)
+            return
+        released = BookInstance.objects \
+                               .filter(pk=hold.copy_id, status=BookInstance.RESERVED_STATUS) \
+                               .update(status=BookInstance.AVAILABLE_STATUS, updated_at=timezone.now())
+        if released:
+            copy = BookInstance.objects.get(pk=hold.copy_id)
+            counters.adjust(num_instances_available=1)
+            counters.adjust_books(
+                added=[(copy.book_id, BookInstance.AVAILABLE_STATUS)],
+                removed=[(copy.book_id, BookInstance.RESERVED_STATUS)],
+            )
+            versions.bump(BookInstance)
+            fragments.invalidate(hold.book_id)
+            allocate([copy])
+
+
+def allocate(copies):
+    """
+    Reserve each of the available ``copies`` for the head of its book's
+    queue and return the holds that got a copy.
+
+    Call it in the transaction that made the copies available. A hold
+    that still has one of the copies reserved is cancelled first.
+    """
+    copy_ids = sorted(copy.pk for copy in copies)
+    for start in range(0, len(copy_ids), QUERY_BATCH_SIZE):
+        Hold.objects.filter(copy_id__in=copy_ids[start:start + QUERY_BATCH_SIZE]).delete()
+
+    copies = [copy for copy in copies if copy.book_id is not None]
+    book_ids = sorted({copy.book_id for copy in copies})
+    queued = set()
+    for start in range(0, len(book_ids), QUERY_BATCH_SIZE):
+        queued.update(
+            Hold.objects
+                .filter(book_id__in=book_ids[start:start + QUERY_BATCH_SIZE], copy__isnull=True)
+                .values_list('book_id', flat=True)
+                .distinct()
+        )
+
+    now = timezone.now()
+    allocated = []
+    for copy in copies:
+        if copy.book_id not in queued:
+            continue
+        with transaction.atomic():
+            hold = waiting(copy.book_id).select_for_update().order_by('sequence').first()
+            if hold is None:
+                continue
+            reserved = BookInstance.objects \
+                                   .filter(pk=copy.pk, status=BookInstance.AVAILABLE_STATUS) \
+                                   .update(status=BookInstance.RESERVED_STATUS, updated_at=now)
+            if not reserved:
+                continue
+            Hold.objects.filter(pk=hold.pk).update(copy=copy, allocated_at=now)
+        hold.copy, hold.allocated_at = copy, now
+        copy.status = BookInstance.RESERVED_STATUS
+        allocated.append(hold)
+    if allocated:
+        counters.adjust(num_instances_available=-len(allocated))
+        counters.adjust_books(
+            added=[(hold.copy.book_id, BookInstance.RESERVED_STATUS) for hold in allocated],
+            removed=[(hold.copy.book_id, BookInstance.AVAILABLE_STATUS) for hold in allocated],
+        )
+        versions.bump(BookInstance)
+        fragments.invalidate(*{hold.book_id for hold in allocated})
+    return allocated
+
+
+def requeue(book_ids):
+    """
+    Put the holds of ``book_ids`` whose reserved copy was deleted back at
+    the head of their queue, and allocate them available copies if any.
+
+    Deleting a copy only clears ``Hold.copy``, which leaves such holds
+    waiting with the ``allocated_at`` and stale ``sequence`` of their old
+    allocation. Call it in the transaction that deleted the copies.
+    """
+    book_ids = sorted({pk for pk in book_ids if pk is not None})
+    requeued = {}
+    for start in range(0, len(book_ids), QUERY_BATCH_SIZE):
+        orphans = Hold.objects.filter(
+            book_id__in=book_ids[start:start + QUERY_BATCH_SIZE],
+            copy__isnull=True,
+            allocated_at__isnull=False,
+        )
+        for hold in orphans.order_by('book_id', 'sequence'):
+            requeued.setdefault(hold.book_id, []).append(hold)
+
+    copies = []
+    for book_id, orphans in sorted(requeued.items()):
+        queue = waiting(book_id).filter(allocated_at__isnull=True)
+        head = queue.aggregate(head=Min('sequence'))['head']
+        if head is None:
+            head = (Hold.objects.filter(book_id=book_id).aggregate(tail=Max('sequence'))['tail'] or 0) + 1
+        for num, hold in enumerate(orphans):
+            Hold.objects.filter(pk=hold.pk).update(sequence=head - len(orphans) + num, allocated_at=None)
+        copies.extend(
+            BookInstance.objects
+                        .filter(book_id=book_id, status=BookInstance.AVAILABLE_STATUS)
+                        .order_by('pk')[:len(orphans)]
+        )
+    allocate(copies)
@@ -0,0 +1,358 @@
+"""
+Bulk import of books, their authors, languages, genres and copies.
+
+Input is CSV (with a header row) or JSON lines, one book per record::
+
+    title, summary, isbn, author_first_name, author_last_name,
+    language, genres, copies, imprint, status
+
+``genres`` is a list in JSON and a ``;`` separated string in CSV. Authors,
+languages and genres are resolved through in-memory maps and created on
+first use. Records are written in chunks, each chunk in its own
+transaction, using ``bulk_create`` for every table. A checkpoint file,
+saved as each chunk commits, lets an interrupted import resume.
+"""
+import csv
+import json
+import os
+import time
+import uuid
+
+from django.db import connection, transaction
+from django.db.models import Max
+
+from . import bulk, counters, versions
+from .models import Author, Book, BookInstance, Genre, Language
+
+
+class ImportStats(object):
+
+    def __init__(self, skipped=0):
+        self.started = time.time()
+        self.records = skipped
+        self.skipped = skipped
+        self.books = 0
+        self.copies = 0
+        self.authors = 0
+        self.languages = 0
+        self.genres = 0
+        self.invalid = 0
+
+    @property
+    def records_per_second(self):
+        elapsed = time.time() - self.started
+        return (self.records - self.skipped) / elapsed if elapsed else 0.0
+
+    def __str__(self):
+        return (
+            '{records} records ({books} books, {copies} copies, {authors} new authors, '
+            '{languages} new languages, {genres} new genres, {invalid} invalid) '
+            'at {rate:.0f} records/s'
+        ).format(rate=self.records_per_second, **self.__dict__)
+
+
+def read_records(path, fmt=None):
+    """
+    Yield (line number, record) pairs from a CSV or JSON lines file.
+    """
+    fmt = fmt or ('csv' if path.endswith('.csv') else 'jsonl')
+    with open(path, newline='') as source:
+        if fmt == 'csv':
+            reader = csv.DictReader(source)
+            for record in reader:
+                yield reader.line_num, record
+        else:
+            for line_number, line in enumerate(source, 1):
+                if not line.strip():
+                    continue
+                try:
+                    yield line_number, json.loads(line)
+                except ValueError as e:
+                    yield line_number, {'_error': 'invalid JSON: {}'.format(e)}
+
+
+def _text(record, name, max_length, required=False):
+    value = record.get(name)
+    value = '' if value is None else str(value).strip()
+    if required and not value:
+        raise ValueError('{} is required'.format(name))
+    if len(value) > max_length:
+        raise ValueError('{} is longer than {} characters'.format(name, max_length))
+    return value
+
+
+def clean_record(record):
+    """
+    Validate a raw record and return it normalized; raise ValueError.
+    """
+    if not isinstance(record, dict):
+        raise ValueError('record must be an object')
+    if '_error' in record:
+        raise ValueError(record['_error'])
+
+    genres = record.get('genres') or []
+    if isinstance(genres, str):
+        genres = genres.split(';')
+    genres = [str(name).strip() for name in genres if str(name).strip()]
+    if any(len(name) > 200 for name in genres):
+        raise ValueError('genre names are limited to 200 characters')
+
+    try:
+        copies = int(record.get('copies') or 0)
+    except (TypeError, ValueError):
+        raise ValueError('copies must be an integer')
+    if copies < 0:
+        raise ValueError('copies must not be negative')
+
+    status = _text(record, 'status', 1) or BookInstance.AVAILABLE_STATUS
+    if status not in dict(BookInstance.LOAN_STATUS):
+        raise ValueError('unknown status {!r}'.format(status))
+
+    return {
+        'title': _text(record, 'title', 200, required=True),
+        'summary': _text(record, 'summary', 1000),
+        'isbn': _text(record, 'isbn', 13),
+        'author': (
+            _text(record, 'author_first_name', 100),
+            _text(record, 'author_last_name', 100),
+        ),
+        'language': _text(record, 'language', 100),
+        'genres': genres,
+        'copies': copies,
+        'imprint': _text(record, 'imprint', 200),
+        'status': status,
+    }
+
+
+class Checkpoint(object):
+    """
+    Number of records committed so far, kept in a small JSON file.
+
+    A chunk saves the checkpoint inside its transaction, along with the
+    first book it inserted and the count before it; the chunk only counts
+    on load if that book exists, i.e. if its transaction committed.
+    """
+
+    def __init__(self, path, source):
+        self.path = path
+        self.source = os.path.abspath(source)
+        self.committed = 0
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return 0
+        with open(self.path) as checkpoint:
+            state = json.load(checkpoint)
+        if state.get('source') != self.source:
+            raise ValueError('Checkpoint {} belongs to {}'.format(self.path, state.get('source')))
+        self.committed = state['records']
+        if state.get('book') is not None and not Book.objects.filter(pk=state['book']).exists():
+            self.committed = state['committed']
+        return self.committed
+
+    def save(self, records, book=None):
+        """
+        Record that ``records`` were imported, pending the commit of the
+        chunk that inserted ``book`` if given.
+        """
+        if not self.path:
+            return
+        state = {'source': self.source, 'records': records}
+        if book is None:
+            self.committed = records
+        else:
+            state.update(book=book, committed=self.committed)
+        temporary = self.path + '.tmp'
+        with open(temporary, 'w') as checkpoint:
+            json.dump(state, checkpoint)
+        os.replace(temporary, self.path)
+
+
+class CatalogImporter(object):
+
+    def __init__(self, batch_size=1000, chunk_size=10000):
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+        self.authors = {}
+        self.languages = {}
+        self.genres = {}
+
+    def load_lookups(self):
+        self.authors = {
+            (first_name, last_name): pk
+            for pk, first_name, last_name in Author.objects.values_list('pk', 'first_name', 'last_name').iterator()
+        }
+        self.languages = dict((name, pk) for pk, name in Language.objects.values_list('pk', 'name'))
+        self.genres = dict((name, pk) for pk, name in Genre.objects.values_list('pk', 'name'))
+
+    def _create_missing(self, model, lookup, keys, build, key_of, field, field_value):
+        """
+        Bulk create the objects for ``keys`` missing from ``lookup`` and
+        record their primary keys in it. The new rows are read back by
+        ``field``, whose value for a key is ``field_value(key)``.
+        """
+        missing = sorted(set(key for key in keys if key not in lookup))
+        if not missing:
+            return 0
+        model.objects.bulk_create([build(key) for key in missing], batch_size=self.batch_size)
+        values = sorted(set(field_value(key) for key in missing))
+        for chunk in bulk.chunked(values, bulk.QUERY_BATCH_SIZE):
+            for obj in model.objects.filter(**{field + '__in': chunk}).order_by('pk'):
+                lookup.setdefault(key_of(obj), obj.pk)
+        return len(missing)
+
+    def _assign_book_ids(self, books):
+        if connection.features.can_return_ids_from_bulk_insert:
+            return
+        if connection.vendor == 'sqlite':
+            # AUTOINCREMENT never hands out the ids of deleted rows again; nor should we
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = %s', [Book._meta.db_table])
+                row = cursor.fetchone()
+            last = row[0] if row else 0
+        else:
+            last = Book.objects.aggregate(last=Max('pk'))['last'] or 0
+        next_id = last + 1
+        for offset, book in enumerate(books):
+            book.pk = next_id + offset
+
+    def _transaction(self):
+        # the write lock must be held before _assign_book_ids reads the last id
+        if hasattr(connection, 'immediate_transaction'):
+            return connection.immediate_transaction()
+        return transaction.atomic()
+
+    def write_chunk(self, records, stats, checkpoint=None):
+        with self._transaction():
+            authors = self._create_missing(
+                Author, self.authors,
+                [record['author'] for record in records if any(record['author'])],
+                lambda key: Author(first_name=key[0], last_name=key[1]),
+                lambda obj: (obj.first_name, obj.last_name),
+                'last_name', lambda key: key[1],
+            )
+            languages = self._create_missing(
+                Language, self.languages,
+                [record['language'] for record in records if record['language']],
+                lambda key: Language(name=key),
+                lambda obj: obj.name,
+                'name', lambda key: key,
+            )
+            genres = self._create_missing(
+                Genre, self.genres,
+                [name for record in records for name in record['genres']],
+                lambda key: Genre(name=key),
+                lambda obj: obj.name,
+                'name', lambda key: key,
+            )
+
+            books = [
+                Book(
+                    title=record['title'],
+                    summary=record['summary'],
+                    isbn=record['isbn'],
+                    author_id=self.authors.get(record['author']),
+                    language_id=self.languages.get(record['language']),
+                    # every copy of a record has its status
+                    **{
+                        field: count * record['copies']
+                        for field, count in counters.copy_counts(record['status']).items()
+                    }
+                )
+                for record in records
+            ]
+            self._assign_book_ids(books)
+            Book.objects.bulk_create(books, batch_size=self.batch_size)
+
+            Book.genre.through.objects.bulk_create([
+                Book.genre.through(book_id=book.pk, genre_id=self.genres[name])
+                for book, record in zip(books, records)
+                for name in sorted(set(record['genres']))
+            ], batch_size=self.batch_size)
+
+            copies = [
+                BookInstance(
+                    id=uuid.uuid4(),
+                    book_id=book.pk,
+                    imprint=record['imprint'],
+                    status=record['status'],
+                )
+                for book, record in zip(books, records)
+                for _ in range(record['copies'])
+            ]
+            BookInstance.objects.bulk_create(copies, batch_size=self.batch_size)
+
+            counters.adjust(
+                num_books=len(books),
+                num_instances=len(copies),
+                num_instances_available=sum(
+                    1 for copy in copies if copy.status == BookInstance.AVAILABLE_STATUS
+                ),
+                num_authors=authors,
+                num_genres=genres,
+            )
+            versions.bump(Author, Language, Genre, Book, BookInstance)
+            if checkpoint:
+                checkpoint.save(stats.records, book=books[0].pk)
+        if checkpoint:
+            checkpoint.save(stats.records)
+
+        stats.books += len(books)
+        stats.copies += len(copies)
+        stats.authors += authors
+        stats.languages += languages
+        stats.genres += genres
+
+    def run(self, records, checkpoint=None, dry_run=False, skip_invalid=False, progress=None):
+        """
+        Import ``records`` (an iterable of (line, raw record) pairs).
+
+        Return (stats, errors) where errors is a list of (line, message).
+        """
+        skip = checkpoint.load() if checkpoint else 0
+        stats = ImportStats(skipped=skip)
+        errors = []
+        if not dry_run:
+            self.load_lookups()
+
+        chunk = []
+        chunk_errors = []
+        for index, (line, record) in enumerate(records):
+            if index < skip:
+                continue
+            try:
+                chunk.append(clean_record(record))
+            except ValueError as e:
+                stats.invalid += 1
+                chunk_errors.append((line, str(e)))
+            stats.records += 1
+
+            if stats.records - stats.skipped and (stats.records - stats.skipped) % self.chunk_size == 0:
+                self._finish_chunk(chunk, chunk_errors, errors, stats, checkpoint, dry_run, skip_invalid)
+                if progress:
+                    progress(stats)
+                chunk, chunk_errors = [], []
+
+        self._finish_chunk(chunk, chunk_errors, errors, stats, checkpoint, dry_run, skip_invalid)
+        if progress:
+            progress(stats)
+        return stats, errors
+
+    def _finish_chunk(self, chunk, chunk_errors, errors, stats, checkpoint, dry_run, skip_invalid):
+        errors.extend(chunk_errors)
+        if dry_run:
+            return
+        if chunk_errors and not skip_invalid:
+            raise InvalidRecords(errors, stats)
+        if chunk:
+            self.write_chunk(chunk, stats, checkpoint)
+        elif checkpoint:
+            checkpoint.save(stats.records)
+
+
+class InvalidRecords(Exception):
+
+    def __init__(self, errors, stats):
+        super(InvalidRecords, self).__init__('{} invalid records'.format(len(errors)))
+        self.errors = errors
+        self.stats = stats
@@ -0,0 +1,283 @@
+"""
+Background jobs stored in the database, run by ``manage.py run_workers``.
+
+Views ``enqueue()`` a registered task by name and return; a worker claims
+the job, runs it and records its result. Enqueueing inside a transaction
+is atomic with it: workers only see the job once it commits.
+
+Claiming leases a job to one worker until ``locked_until``. Where the
+database supports it (PostgreSQL) the oldest ready job is locked with
+``SELECT ... FOR UPDATE SKIP LOCKED``. SQLite has no row locks but runs
+every write under one database lock, so there a single ``UPDATE ...
+WHERE id IN (SELECT id ... ORDER BY run_at LIMIT 1)`` picks and leases
+the job: concurrent workers take turns and each gets a different job.
+
+A job whose task raises is retried after an exponential backoff with
+jitter until ``max_attempts`` is used up. A job whose worker died is
+claimed again once its lease expires, so tasks must be safe to rerun.
+"""
+import inspect
+import json
+import logging
+import os
+import random
+import socket
+import threading
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DatabaseError, close_old_connections, connection, transaction
+from django.db.models import Case, DateTimeField, F, Value, When
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from . import counters, export, overdue, search
+from .models import Job
+
+
+logger = logging.getLogger(__name__)
+
+# name -> (function, lease seconds or None for JOBS_VISIBILITY_TIMEOUT)
+TASKS = {}
+
+
+class JobError(Exception):
+    pass
+
+
+def task(name, lease=None):
+    """
+    Register the decorated function as the task ``name``; ``lease``
+    overrides JOBS_VISIBILITY_TIMEOUT for tasks that run longer.
+    """
+    def register(func):
+        TASKS[name] = (func, lease)
+        return func
+    return register
+
+
+def enqueue(name, kwargs=None, run_at=None, max_attempts=None):
+    """
+    Queue task ``name`` with a dict of JSON-serializable ``kwargs`` and
+    return the job.
+    """
+    if name not in TASKS:
+        raise JobError('Unknown task {!r}.'.format(name))
+    kwargs = kwargs or {}
+    try:
+        inspect.signature(TASKS[name][0]).bind(**kwargs)
+    except TypeError as exc:
+        raise JobError('Invalid arguments for {}: {}.'.format(name, exc))
+    return Job.objects.create(
+        name=name,
+        kwargs=json.dumps(kwargs, cls=DjangoJSONEncoder),
+        run_at=run_at or timezone.now(),
+        max_attempts=max_attempts or settings.JOBS_MAX_ATTEMPTS,
+    )
+
+
+def lease_for(name):
+    _, lease = TASKS.get(name, (None, None))
+    return timedelta(seconds=lease or settings.JOBS_VISIBILITY_TIMEOUT)
+
+
+def _custom_leases():
+    return sorted(name for name, (_, lease) in TASKS.items() if lease)
+
+
+def backoff(attempts):
+    """
+    Seconds to wait before retrying a job that failed ``attempts`` times.
+    """
+    delay = min(settings.JOBS_RETRY_DELAY * 2 ** (attempts - 1), settings.JOBS_RETRY_MAX_DELAY)
+    # jitter keeps jobs that failed together from retrying together
+    return random.uniform(delay / 2.0, delay)
+
+
+def _ready(now):
+    """
+    Claimable jobs, oldest first: expired leases with attempts left, then
+    queued jobs that are due. Each is read in the order of its index.
+    """
+    return (
+        Job.objects.filter(status=Job.RUNNING_STATUS, locked_until__lt=now, attempts__lt=F('max_attempts'))
+                   .order_by('locked_until', 'id'),
+        Job.objects.filter(status=Job.QUEUED_STATUS, run_at__lte=now).order_by('run_at', 'id'),
+    )
+
+
+def claim(worker):
+    """
+    Lease the oldest ready job to ``worker`` and return it, or None.
+    """
+    now = timezone.now()
+    for ready in _ready(now):
+        if connection.features.has_select_for_update_skip_locked:
+            with transaction.atomic():
+                job = ready.select_for_update(skip_locked=True).first()
+                if job is not None:
+                    Job.objects.filter(pk=job.pk).update(
+                        status=Job.RUNNING_STATUS,
+                        attempts=job.attempts + 1,
+                        locked_by=worker,
+                        locked_until=now + lease_for(job.name),
+                    )
+                    return Job.objects.get(pk=job.pk)
+        else:
+            # a per-claim token tells this claim's row apart from older ones of the worker
+            token = '{} {}'.format(worker, uuid.uuid4().hex[:12])
+            leases = [When(name=name, then=Value(now + lease_for(name))) for name in _custom_leases()]
+            claimed = Job.objects.filter(pk__in=ready.values('pk')[:1]).update(
+                status=Job.RUNNING_STATUS,
+                attempts=F('attempts') + 1,
+                locked_by=token,
+                locked_until=Case(*leases, default=Value(now + lease_for(None)), output_field=DateTimeField()),
+            )
+            if claimed:
+                return Job.objects.get(status=Job.RUNNING_STATUS, locked_by=token)
+    expire(now)
+    return None
+
+
+def expire(now=None):
+    """
+    Fail running jobs whose lease expired on their last attempt.
+    """
+    return Job.objects.filter(
+        status=Job.RUNNING_STATUS,
+        locked_until__lt=now or timezone.now(),
+        attempts__gte=F('max_attempts'),
+    ).update(
+        status=Job.FAILED_STATUS,
+        last_error='The worker running the last attempt stopped responding.',
+        locked_until=None,
+        finished_at=timezone.now(),
+    )
+
+
+def _finish(job, **changes):
+    # a worker whose lease expired must not overwrite the next attempt
+    finished = Job.objects.filter(
+        pk=job.pk, status=Job.RUNNING_STATUS, locked_by=job.locked_by, attempts=job.attempts,
+    ).update(locked_until=None, **changes)
+    if not finished:
+        logger.warning('Lost the lease of %s before it finished.', job)
+    return bool(finished)
+
+
+def run(job):
+    """
+    Run a claimed job and record its result, a retry or its failure.
+    """
+    func, _ = TASKS.get(job.name, (None, None))
+    try:
+        if func is None:
+            raise JobError('Unknown task {!r}.'.format(job.name))
+        result = func(**json.loads(job.kwargs))
+    except Exception:
+        error = traceback.format_exc()
+        now = timezone.now()
+        if job.attempts < job.max_attempts and func is not None:
+            logger.warning('%s failed on attempt %s, retrying.', job, job.attempts)
+            _finish(
+                job, status=Job.QUEUED_STATUS, last_error=error,
+                run_at=now + timedelta(seconds=backoff(job.attempts)),
+            )
+        else:
+            logger.error('%s failed on attempt %s, giving up.', job, job.attempts)
+            _finish(job, status=Job.FAILED_STATUS, last_error=error, finished_at=now)
+        return False
+    return _finish(
+        job, status=Job.DONE_STATUS, result=json.dumps(result, cls=DjangoJSONEncoder),
+        finished_at=timezone.now(),
+    )
+
+
+class Worker(object):
+    """
+    Claim and run jobs one at a time until stopped.
+    """
+
+    def __init__(self, name=None, poll_interval=1.0):
+        self.name = name or '{}:{}'.format(socket.gethostname(), os.getpid())
+        self.poll_interval = poll_interval
+        self.stopping = threading.Event()
+        self.processed = 0
+
+    def run_once(self):
+        # as between requests, drop connections past CONN_MAX_AGE or broken
+        close_old_connections()
+        job = claim(self.name)
+        if job is None:
+            return False
+        run(job)
+        self.processed += 1
+        return True
+
+    def run(self, burst=False):
+        """
+        Work until stop() is called, or until the queue is empty if ``burst``.
+        """
+        while not self.stopping.is_set():
+            try:
+                busy = self.run_once()
+            except DatabaseError:
+                # e.g. a lock timeout; a job left running is retried when its lease expires
+                logger.exception('Worker %s could not claim or finish a job.', self.name)
+                busy = False
+            if not busy:
+                if burst:
+                    break
+                self.stopping.wait(self.poll_interval)
+        return self.processed
+
+    def stop(self, *args):
+        self.stopping.set()
+
+
+@task('rebuild_counters')
+def rebuild_counters():
+    totals = counters.rebuild()
+    return {field: getattr(totals, field) for field in counters.COUNTER_FIELDS}
+
+
+@task('reconcile_copy_counts')
+def reconcile_copy_counts():
+    return {'books': counters.reconcile_books()}
+
+
+@task('rebuild_search_index')
+def rebuild_search_index():
+    return {'books': search.rebuild()}
+
+
+@task('scan_overdue', lease=3600)
+def scan_overdue(date=None):
+    stats = overdue.scan(today=parse_date(date) if date else None)
+    return {
+        'borrowers': stats.borrowers,
+        'copies': stats.copies,
+        'reminded': stats.reminded,
+        'skipped': stats.skipped,
+    }
+
+
+@task('export_catalog', lease=3600)
+def export_catalog(dataset, fmt='ndjson'):
+    """
+    Write a table export under EXPORT_ROOT and return its path.
+    """
+    if dataset not in export.DATASETS or fmt not in export.FORMATS:
+        raise JobError('Unknown export {}.{}.'.format(dataset, fmt))
+    os.makedirs(settings.EXPORT_ROOT, exist_ok=True)
+    path = os.path.join(
+        settings.EXPORT_ROOT,
+        '{}-{}.{}'.format(dataset, timezone.now().strftime('%Y%m%d%H%M%S%f'), fmt),
+    )
+    stats = export.ExportStats(dataset)
+    with open(path, 'w', newline='') as output:
+        output.writelines(export.export(dataset, fmt, stats=stats))
+    return {'path': path, 'rows': stats.rows}
@@ -0,0 +1,117 @@
+"""
+Race-free checkout, return and renewal of book copies.
+
+Each action is a single conditional ``UPDATE ... WHERE status = ...``, so
+when two librarians act on the same copy at once exactly one of them
+changes it and the other gets a ``LoanConflict`` instead of silently
+overwriting the first. The counters, table version and cached copies
+section are adjusted in the same transaction, as in ``catalog.bulk``.
+On SQLite the transaction takes the write lock up front, so racing
+actions wait for each other instead of failing with "database is locked".
+"""
+import datetime
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import counters, fragments, holds, versions
+from .models import BookInstance, Hold
+
+
+LOAN_PERIOD = datetime.timedelta(weeks=3)
+
+
+class LoanConflict(Exception):
+    """
+    The copy is not in the state the action needs, e.g. it is already on loan.
+    """
+
+    def __init__(self, message, copy):
+        super(LoanConflict, self).__init__(message)
+        self.copy = copy
+
+
+def _transaction():
+    # checkout reads the hold before it writes; a deferred SQLite transaction
+    # cannot upgrade that read lock while another checkout holds the write lock
+    if hasattr(connection, 'immediate_transaction'):
+        return connection.immediate_transaction()
+    return transaction.atomic()
+
+
+def _transition(pk, expected, conflict_message, **changes):
+    """
+    Apply ``changes`` to copy ``pk`` if it still matches ``expected`` and
+    return the updated copy; raise LoanConflict (or DoesNotExist) otherwise.
+    """
+    with _transaction():
+        updated = BookInstance.objects \
+                              .filter(pk=pk, **expected) \
+                              .update(updated_at=timezone.now(), **changes)
+        copy = BookInstance.objects.get(pk=pk)
+        if not updated:
+            raise LoanConflict(conflict_message, copy)
+        was, now = expected['status'], copy.status
+        if was != now:
+            available = BookInstance.AVAILABLE_STATUS
+            counters.adjust(num_instances_available=int(now == available) - int(was == available))
+            counters.adjust_books(added=[(copy.book_id, now)], removed=[(copy.book_id, was)])
+        versions.bump(BookInstance)
+        fragments.invalidate(copy.book_id)
+    return copy
+
+
+def checkout(pk, borrower, due_back=None):
+    """
+    Lend an available copy, or the copy reserved for ``borrower`` by their
+    hold, to ``borrower`` until ``due_back`` (default in three weeks).
+    """
+    if due_back is None:
+        due_back = datetime.date.today() + LOAN_PERIOD
+    with _transaction():
+        hold = Hold.objects.filter(copy_id=pk, patron=borrower).first()
+        if hold is None:
+            expected = {'status': BookInstance.AVAILABLE_STATUS}
+        else:
+            expected = {'status': BookInstance.RESERVED_STATUS}
+        copy = _transition(
+            pk,
+            expected,
+            'This copy is not available.',
+            status=BookInstance.ON_LOAN_STATUS,
+            borrower=borrower,
+            due_back=due_back,
+        )
+        if hold is not None:
+            hold.delete()
+    return copy
+
+
+def return_copy(pk):
+    """
+    Take back a copy that is on loan; it is reserved for the next hold on
+    its book, if any, or becomes available.
+    """
+    with _transaction():
+        copy = _transition(
+            pk,
+            {'status': BookInstance.ON_LOAN_STATUS},
+            'This copy is not on loan.',
+            status=BookInstance.AVAILABLE_STATUS,
+            borrower=None,
+            due_back=None,
+        )
+        holds.allocate([copy])
+    return copy
+
+
+def renew(pk, due_back, borrower=None):
+    """
+    Move the due date of a copy on loan, optionally only if ``borrower`` still has it.
+    """
+    expected = {'status': BookInstance.ON_LOAN_STATUS}
+    message = 'This copy is not on loan.'
+    if borrower is not None:
+        expected['borrower'] = borrower
+        message = 'This copy is not on loan to this borrower.'
+    return _transition(pk, expected, message, due_back=due_back)
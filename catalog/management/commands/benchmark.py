@@ -0,0 +1,82 @@
+import json
+import os
+import shutil
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.utils import (
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+    teardown_test_environment,
+)
+
+from catalog.benchmarks import SCENARIOS, compare
+
+
+class Command(BaseCommand):
+    help = 'Run a benchmark scenario against a throwaway test database and print a JSON report.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenario', help='One of: {}'.format(', '.join(sorted(SCENARIOS))))
+        parser.add_argument(
+            '--option',
+            action='append',
+            default=[],
+            metavar='NAME=VALUE',
+            help='Integer option passed to the scenario, e.g. --option visitors=50.',
+        )
+        parser.add_argument(
+            '--baseline',
+            metavar='FILE',
+            help='A report saved from an earlier run; fail if a latency, query or memory metric regressed.',
+        )
+        parser.add_argument(
+            '--threshold',
+            type=int,
+            default=20,
+            metavar='PERCENT',
+            help='How much worse than the baseline a metric may get (default 20).',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            run = SCENARIOS[options['scenario']]
+        except KeyError:
+            raise CommandError('Unknown scenario "{}".'.format(options['scenario']))
+
+        scenario_options = {}
+        for option in options['option']:
+            name, _, value = option.partition('=')
+            try:
+                scenario_options[name.replace('-', '_')] = int(value)
+            except ValueError:
+                raise CommandError('Option "{}" must be NAME=INTEGER.'.format(option))
+
+        tempdir = None
+        if getattr(run, 'file_database', False):
+            # several processes cannot share an in-memory test database
+            tempdir = tempfile.mkdtemp(prefix='benchmark-')
+            for alias, settings_dict in connections.databases.items():
+                settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(tempdir, alias + '.sqlite3')
+
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            report = run(**scenario_options)
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+            if tempdir:
+                shutil.rmtree(tempdir, ignore_errors=True)
+
+        if options['baseline']:
+            with open(options['baseline']) as baseline:
+                report['regressions'] = compare(report, json.load(baseline), options['threshold'])
+
+        self.stdout.write(json.dumps(report, indent=2, sort_keys=True))
+        if report.get('regressions'):
+            raise CommandError('{} metrics regressed by more than {}% against {}.'.format(
+                len(report['regressions']), options['threshold'], options['baseline'],
+            ))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from catalog import export
+
+
+class Command(BaseCommand):
+    help = 'Stream a catalog table as NDJSON or CSV.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=list(export.DATASETS))
+        parser.add_argument('--format', dest='fmt', choices=export.FORMATS, default='ndjson')
+        parser.add_argument('--output', help='File to write to; defaults to standard output.')
+        parser.add_argument('--chunk-size', type=int, default=export.DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        stats = export.ExportStats(options['dataset'])
+        lines = export.export(
+            options['dataset'],
+            options['fmt'],
+            chunk_size=options['chunk_size'],
+            stats=stats,
+        )
+
+        if options['output']:
+            with open(options['output'], 'w', newline='') as output:
+                output.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
+
+        self.stderr.write(str(stats))
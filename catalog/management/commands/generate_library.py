@@ -0,0 +1,42 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog import generate
+
+
+class Command(BaseCommand):
+    help = 'Fill an empty database with a deterministic synthetic library.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, required=True)
+        parser.add_argument('--copies-per-book', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=0,
+                            help='The same seed (and --date) always generates the same rows.')
+        parser.add_argument('--borrowers', type=int,
+                            help='Users who borrow copies; one per ten books by default.')
+        parser.add_argument('--date', help='Treat this day (YYYY-MM-DD) as today for due dates.')
+        parser.add_argument('--chunk-size', type=int, default=10000,
+                            help='Books committed per transaction.')
+
+    def handle(self, *args, **options):
+        today = None
+        if options['date']:
+            try:
+                today = datetime.datetime.strptime(options['date'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('--date must look like YYYY-MM-DD.')
+
+        generator = generate.LibraryGenerator(
+            options['books'],
+            options['copies_per_book'],
+            seed=options['seed'],
+            borrowers=options['borrowers'],
+            today=today,
+            chunk_size=options['chunk_size'],
+        )
+        try:
+            stats = generator.run(progress=lambda stats: self.stdout.write(str(stats)))
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write('Generated {}.'.format(stats))
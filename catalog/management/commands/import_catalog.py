@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog import importer
+
+
+class Command(BaseCommand):
+    help = 'Bulk import books, authors and copies from a CSV or JSON lines file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', dest='fmt', choices=('csv', 'jsonl'),
+                            help='Input format; guessed from the file extension by default.')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rows per bulk INSERT statement.')
+        parser.add_argument('--chunk-size', type=int, default=10000,
+                            help='Records committed per transaction.')
+        parser.add_argument('--checkpoint',
+                            help='File recording committed records; an interrupted import resumes from it.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Validate the input without writing anything.')
+        parser.add_argument('--skip-invalid', action='store_true',
+                            help='Import valid records and report invalid ones instead of stopping.')
+
+    def handle(self, *args, **options):
+        records = importer.read_records(options['path'], options['fmt'])
+        checkpoint = None
+        if options['checkpoint'] and not options['dry_run']:
+            checkpoint = importer.Checkpoint(options['checkpoint'], options['path'])
+
+        catalog_importer = importer.CatalogImporter(
+            batch_size=options['batch_size'],
+            chunk_size=options['chunk_size'],
+        )
+        try:
+            stats, errors = catalog_importer.run(
+                records,
+                checkpoint=checkpoint,
+                dry_run=options['dry_run'],
+                skip_invalid=options['skip_invalid'],
+                progress=lambda stats: self.stdout.write(str(stats)),
+            )
+        except importer.InvalidRecords as e:
+            self._report_errors(e.errors)
+            raise CommandError(
+                'Stopped after {} records: invalid input. Fix it or use --skip-invalid; '
+                'committed records are kept.'.format(e.stats.records)
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self._report_errors(errors)
+        if options['dry_run']:
+            if errors:
+                raise CommandError('{} of {} records are invalid.'.format(len(errors), stats.records))
+            self.stdout.write('{} records are valid.'.format(stats.records))
+
+    def _report_errors(self, errors):
+        for line, message in errors:
+            self.stderr.write('line {}: {}'.format(line, message))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog import counters
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the catalog counters shown on the index page from real counts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Only compare stored counters against real counts; exit with an error on drift.',
+        )
+
+    def handle(self, *args, **options):
+        if options['check']:
+            drift = counters.check()
+            if drift:
+                for field, (stored, actual) in sorted(drift.items()):
+                    self.stderr.write('{}: stored {}, actual {}'.format(field, stored, actual))
+                raise CommandError('Catalog counters are out of sync.')
+            self.stdout.write('Catalog counters are consistent.')
+            return
+
+        rebuilt = counters.rebuild()
+        for field in counters.COUNTER_FIELDS:
+            self.stdout.write('{}: {}'.format(field, getattr(rebuilt, field)))
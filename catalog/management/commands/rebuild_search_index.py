@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from catalog import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index over book titles, summaries and authors.'
+
+    def handle(self, *args, **options):
+        if not search.is_indexed():
+            self.stdout.write('Full-text search needs SQLite; nothing to rebuild.')
+            return
+        with transaction.atomic():
+            indexed = search.rebuild()
+        self.stdout.write('Indexed {} books.'.format(indexed))
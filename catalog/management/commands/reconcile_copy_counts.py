@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog import counters
+
+
+class Command(BaseCommand):
+    help = 'Recount the copies_total, copies_available and copies_on_loan columns of books from their copies.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Only list books whose columns drifted; exit with an error on drift.',
+        )
+
+    def handle(self, *args, **options):
+        if options['check']:
+            drifted = 0
+            for book in counters.drifted_books().order_by('pk').iterator():
+                drifted += 1
+                for field in counters.BOOK_COUNTER_FIELDS:
+                    stored, actual = getattr(book, field), getattr(book, 'actual_' + field)
+                    if stored != actual:
+                        self.stderr.write('Book {} {}: stored {}, actual {}'.format(book.pk, field, stored, actual))
+            if drifted:
+                raise CommandError('{} books have drifted copy counts.'.format(drifted))
+            self.stdout.write('Book copy counts are consistent.')
+            return
+
+        self.stdout.write('Reconciled {} books.'.format(counters.reconcile_books()))
@@ -0,0 +1,70 @@
+import multiprocessing
+import signal
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from catalog import jobs
+
+
+def _work(poll_interval, burst):
+    worker = jobs.Worker(poll_interval=poll_interval)
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    try:
+        worker.run(burst=burst)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Run background jobs from the database with a pool of worker processes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=1,
+                            help='Worker processes; 1 runs the worker in this process.')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds an idle worker waits before looking for jobs again.')
+        parser.add_argument('--burst', action='store_true',
+                            help='Exit once the queue is empty instead of waiting for jobs.')
+
+    def handle(self, *args, **options):
+        concurrency = options['concurrency']
+        if concurrency < 1:
+            raise CommandError('--concurrency must be at least 1.')
+        worker_args = (options['poll_interval'], options['burst'])
+        if concurrency == 1:
+            _work(*worker_args)
+            return
+
+        # each worker opens its own database connections
+        connections.close_all()
+        stopping = []
+
+        def stop(signum, frame):
+            stopping.append(signum)
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+
+        processes = [multiprocessing.Process(target=_work, args=worker_args) for _ in range(concurrency)]
+        for process in processes:
+            process.start()
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        self.stdout.write('Started {} workers.'.format(concurrency))
+
+        while True:
+            running = False
+            for index, process in enumerate(processes):
+                if process.is_alive():
+                    running = True
+                elif process.exitcode and not stopping and not options['burst']:
+                    self.stderr.write('Worker {} exited with {}; restarting it.'.format(process.pid, process.exitcode))
+                    processes[index] = multiprocessing.Process(target=_work, args=worker_args)
+                    processes[index].start()
+                    running = True
+            if not running:
+                break
+            time.sleep(options['poll_interval'])
@@ -0,0 +1,31 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog import overdue
+
+
+class Command(BaseCommand):
+    help = 'Email a reminder to every borrower with overdue copies, at most once a day.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Borrowers handled per batch.')
+        parser.add_argument('--date', help='Treat this day (YYYY-MM-DD) as today.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Count overdue copies without sending anything.')
+
+    def handle(self, *args, **options):
+        today = None
+        if options['date']:
+            try:
+                today = datetime.datetime.strptime(options['date'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('--date must look like YYYY-MM-DD.')
+
+        stats = overdue.scan(
+            today=today,
+            chunk_size=options['chunk_size'],
+            dry_run=options['dry_run'],
+        )
+        self.stdout.write(str(stats))
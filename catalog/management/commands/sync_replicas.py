@@ -0,0 +1,38 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from catalog import routers
+
+
+class Command(BaseCommand):
+    help = (
+        'Copy the primary SQLite database over the local read replicas listed in '
+        'DATABASE_REPLICAS. Real deployments use their database\'s own replication.'
+    )
+
+    def handle(self, *args, **options):
+        primary = connections[DEFAULT_DB_ALIAS]
+        if primary.vendor != 'sqlite':
+            raise CommandError('sync_replicas only copies SQLite databases.')
+        aliases = routers.replicas()
+        if not aliases:
+            self.stdout.write('No DATABASE_REPLICAS configured; nothing to sync.')
+            return
+
+        for alias in aliases:
+            replica = connections[alias]
+            target = replica.settings_dict['NAME']
+            snapshot = target + '.sync'
+            if os.path.exists(snapshot):
+                os.remove(snapshot)
+            with primary.cursor() as cursor:
+                # A consistent snapshot of the primary, even while it is written to.
+                cursor.execute('VACUUM INTO %s', [snapshot])
+            replica.close()
+            for suffix in ('-wal', '-shm'):
+                if os.path.exists(target + suffix):
+                    os.remove(target + suffix)
+            os.replace(snapshot, target)
+            self.stdout.write('Synced {} ({}).'.format(alias, target))
@@ -0,0 +1,31 @@
+from django.conf import settings
+
+from . import routers
+
+
+PIN_COOKIE_NAME = 'use_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ReplicaMiddleware(object):
+    """
+    Route the catalog reads of safe requests to one of the read replicas.
+
+    Unsafe requests run entirely against the primary and set a short-lived
+    cookie; while it is present the client's reads stay on the primary too,
+    so a redirect after a POST shows the data that was just written.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        safe = request.method in SAFE_METHODS
+        enabled = safe and PIN_COOKIE_NAME not in request.COOKIES
+        with routers.use_replicas(enabled):
+            response = self.get_response(request)
+        if not safe and routers.replicas():
+            response.set_cookie(
+                PIN_COOKIE_NAME, '1', max_age=settings.REPLICA_PIN_SECONDS, httponly=True,
+            )
+        return response
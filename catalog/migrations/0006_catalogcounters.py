@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.5 on 2026-10-18 17:01
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0005_auto_20170704_1823'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogCounters',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('num_books', models.IntegerField(default=0)),
+                ('num_instances', models.IntegerField(default=0)),
+                ('num_instances_available', models.IntegerField(default=0)),
+                ('num_authors', models.IntegerField(default=0)),
+                ('num_genres', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'catalog counters',
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.5 on 2026-10-18 17:02
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0006_catalogcounters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VisitCount',
+            fields=[
+                ('visitor_id', models.UUIDField(primary_key=True, serialize=False)),
+                ('count', models.IntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+CREATE_SQL = [
+    "CREATE VIRTUAL TABLE catalog_book_fts USING fts5("
+    "title, summary, author, tokenize = 'unicode61 remove_diacritics 2')",
+
+    "INSERT INTO catalog_book_fts (rowid, title, summary, author) "
+    "SELECT b.id, b.title, b.summary, COALESCE(a.first_name || ' ' || a.last_name, '') "
+    "FROM catalog_book b LEFT JOIN catalog_author a ON a.id = b.author_id",
+]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS catalog_author_fts_update",
+    "DROP TRIGGER IF EXISTS catalog_book_fts_delete",
+    "DROP TRIGGER IF EXISTS catalog_book_fts_update",
+    "DROP TRIGGER IF EXISTS catalog_book_fts_insert",
+    "DROP TABLE IF EXISTS catalog_book_fts",
+]
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        # the full-text index is SQLite only; other databases fall back to LIKE.
+        # The triggers keeping it in sync are installed by catalog.search after
+        # every migrate, since rebuilding a table drops its triggers.
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for sql in statements:
+            schema_editor.execute(sql)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0009_overduereminder'),
+    ]
+
+    operations = [
+        migrations.RunPython(run(CREATE_SQL), run(DROP_SQL)),
+    ]
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count_copies(apps, schema_editor):
+    Book = apps.get_model('catalog', 'Book')
+    BookInstance = apps.get_model('catalog', 'BookInstance')
+
+    def counted(**filters):
+        copies = BookInstance.objects.filter(book=OuterRef('pk'), **filters) \
+                                     .order_by() \
+                                     .values('book') \
+                                     .annotate(count=Count('pk')) \
+                                     .values('count')
+        return Coalesce(Subquery(copies, output_field=IntegerField()), Value(0))
+
+    Book.objects.update(
+        copies_total=counted(),
+        copies_available=counted(status='a'),
+        copies_on_loan=counted(status='o'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0014_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='copies_available',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='copies_on_loan',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='copies_total',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['-copies_available', 'title', 'id'], name='catalog_book_available_idx'),
+        ),
+        migrations.RunPython(count_copies, migrations.RunPython.noop),
+    ]
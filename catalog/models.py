@@ -3,6 +3,7 @@ from datetime import date
 
 from django.db import models
 from django.urls import reverse
+from django.utils import timezone
 from django.contrib.auth.models import User
 
 
@@ -22,14 +23,45 @@ class Language(models.Model):
         return self.name
 
 
+class BookQuerySet(models.QuerySet):
+
+    def available(self):
+        return self.filter(copies_available__gt=0)
+
+
 class Book(models.Model):
 
-    title = models.CharField(max_length=200)
+    # most available copies first, read in the order of catalog_book_available_idx
+    AVAILABILITY_ORDERING = ('-copies_available', 'title', 'id')
+    # maintained with F() by catalog.counters.adjust_books, never written by save()
+    COUNTER_FIELDS = ('copies_total', 'copies_available', 'copies_on_loan')
+
+    title = models.CharField(max_length=200, db_index=True)
     author = models.ForeignKey('Author', on_delete=models.SET_NULL, null=True)
     summary = models.TextField(max_length=1000, help_text='Enter a brief description of the book')
-    isbn = models.CharField('ISBN', max_length=13, help_text='13 Character <a href="https://www.isbn-international.org/content/what-isbn">ISBN number</a>')
+    isbn = models.CharField('ISBN', max_length=13, db_index=True, help_text='13 Character <a href="https://www.isbn-international.org/content/what-isbn">ISBN number</a>')
     genre = models.ManyToManyField(Genre, help_text='Select a genre for this book')
     language = models.ForeignKey(Language, on_delete=models.SET_NULL, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    copies_total = models.IntegerField(default=0, editable=False)
+    copies_available = models.IntegerField(default=0, editable=False)
+    copies_on_loan = models.IntegerField(default=0, editable=False)
+
+    objects = BookQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-copies_available', 'title', 'id'], name='catalog_book_available_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # a stale instance must not overwrite counts adjusted since it was loaded
+        if not self._state.adding and not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS
+            ]
+        super(Book, self).save(*args, **kwargs)
 
     def __str__(self):
         return self.title
@@ -40,9 +72,11 @@ class Book(models.Model):
     def display_genre(self):
         """
         Return Genre as string. Required for admin list display.
+
+        Slices in Python so genres prefetched by the admin are reused.
         """
         limit = 3
-        return ', '.join((genre.name for genre in self.genre.all()[:limit]))
+        return ', '.join((genre.name for genre in list(self.genre.all())[:limit]))
     display_genre.short_description = 'Genre'
 
 
@@ -66,10 +100,23 @@ class BookInstance(models.Model):
     due_back = models.DateField(null=True, blank=True)
     status = models.CharField(max_length=1, choices=LOAN_STATUS, blank=True, default=MAINTENANCE_STATUS, help_text='Book availability')
     borrower = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['due_back']
         permissions = (('can_mark_returned', 'Set book as returned'),)
+        indexes = [
+            models.Index(fields=['status', 'due_back'], name='catalog_bi_status_due_idx'),
+            models.Index(fields=['borrower', 'status', 'due_back'], name='catalog_bi_borrower_due_idx'),
+            models.Index(fields=['due_back', 'id'], name='catalog_bi_due_id_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(BookInstance, cls).from_db(db, field_names, values)
+        # remember loaded values so signal handlers can tell what changed
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
 
     def __str__(self):
         if self.book:
@@ -87,9 +134,144 @@ class Author(models.Model):
     last_name = models.CharField(max_length=100)
     date_of_birth = models.DateField(null=True, blank=True)
     date_of_death = models.DateField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['last_name', 'first_name'], name='catalog_author_name_idx'),
+        ]
 
     def __str__(self):
         return '%s, %s' % (self.last_name, self.first_name)
 
     def get_absolute_url(self):
         return reverse('author-detail', args=[str(self.id)])
+
+
+class CatalogCounters(models.Model):
+    """
+    Single row of precomputed totals shown on the index page.
+    """
+
+    num_books = models.IntegerField(default=0)
+    num_instances = models.IntegerField(default=0)
+    num_instances_available = models.IntegerField(default=0)
+    num_authors = models.IntegerField(default=0)
+    num_genres = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = 'catalog counters'
+
+    def __str__(self):
+        return 'Catalog counters'
+
+
+class VisitCount(models.Model):
+    """
+    Index page views per visitor, written in batches by catalog.visits.
+    """
+
+    visitor_id = models.UUIDField(primary_key=True)
+    count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return '{} ({})'.format(self.visitor_id, self.count)
+
+
+class OverdueReminder(models.Model):
+    """
+    Marks a borrower as reminded about overdue copies on a given day.
+    """
+
+    borrower = models.ForeignKey(User, on_delete=models.CASCADE)
+    sent_on = models.DateField()
+    copies = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = (('sent_on', 'borrower'),)
+
+    def __str__(self):
+        return '{} ({})'.format(self.borrower, self.sent_on)
+
+
+class Hold(models.Model):
+    """
+    A patron waiting for a copy of a book, managed by catalog.holds.
+
+    Waiting holds (no ``copy`` yet) of a book have consecutive ``sequence``
+    numbers in FIFO order, so a position is a difference of two indexed
+    values. A hold with a ``copy`` has been allocated that reserved copy.
+    """
+
+    book = models.ForeignKey(Book, on_delete=models.CASCADE)
+    patron = models.ForeignKey(User, on_delete=models.CASCADE)
+    sequence = models.BigIntegerField()
+    copy = models.OneToOneField(BookInstance, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    allocated_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = (('book', 'patron'),)
+        indexes = [
+            models.Index(fields=['book', 'copy', 'sequence'], name='catalog_hold_queue_idx'),
+        ]
+
+    def __str__(self):
+        return '{} ({})'.format(self.patron, self.book)
+
+
+class TableVersion(models.Model):
+    """
+    Change stamp of a catalog table, bumped by catalog.versions on every write.
+    """
+
+    table = models.CharField(max_length=100, primary_key=True)
+    version = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return '{} v{}'.format(self.table, self.version)
+
+
+class Job(models.Model):
+    """
+    A unit of background work, claimed and run by ``manage.py run_workers``
+    (see catalog.jobs).
+
+    A running job is leased to one worker until ``locked_until``; if the
+    worker dies the lease expires and another worker picks the job up.
+    """
+
+    QUEUED_STATUS = 'q'
+    RUNNING_STATUS = 'r'
+    DONE_STATUS = 'd'
+    FAILED_STATUS = 'f'
+    JOB_STATUS = (
+        (QUEUED_STATUS, 'Queued'),
+        (RUNNING_STATUS, 'Running'),
+        (DONE_STATUS, 'Done'),
+        (FAILED_STATUS, 'Failed'),
+    )
+
+    name = models.CharField(max_length=100)
+    kwargs = models.TextField(default='{}', help_text='Task keyword arguments as JSON')
+    status = models.CharField(max_length=1, choices=JOB_STATUS, default=QUEUED_STATUS)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now, help_text='Not claimed before this time')
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    result = models.TextField(blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='catalog_job_ready_idx'),
+            models.Index(fields=['status', 'locked_until'], name='catalog_job_lease_idx'),
+        ]
+
+    def __str__(self):
+        return '{} #{} ({})'.format(self.name, self.pk, self.get_status_display())
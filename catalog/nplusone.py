@@ -0,0 +1,177 @@
+"""
+N+1 query detection.
+
+While a ``Detector`` is active, every statement the database cursors run
+(see ``catalog.timing``) is reduced to a fingerprint, its shape with
+values and ``IN`` lists taken out, and attributed to the template line
+or project code line that triggered it. The same fingerprint from the
+same place ``NPLUSONE_THRESHOLD`` times or more in one request is
+usually a relation being loaded per row, e.g. ``{{ copy.book.title }}``
+in a loop without ``select_related('book')``.
+
+``NPlusOneMiddleware`` checks every request when ``NPLUSONE_MODE`` is
+``'log'`` (staging) or ``'raise'`` (e.g. ``NPLUSONE_MODE=raise
+./manage.py test catalog`` fails the tests whose requests repeat
+queries). Deliberate per-row queries can be wrapped in ``allow()``.
+"""
+import collections
+import logging
+import os
+import re
+import sys
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+
+
+MODES = ('off', 'log', 'raise')
+
+IN_LIST_RE = re.compile(r'\bIN \((?:%s, )*%s\)')
+LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+_SKIPPED_FILES = tuple(
+    os.path.splitext(os.path.join(os.path.dirname(__file__), name))[0] for name in ('nplusone', 'timing')
+)
+_LIBRARY_DIR = os.sep + 'site-packages' + os.sep
+
+
+class NPlusOneError(AssertionError):
+    pass
+
+
+Repeat = collections.namedtuple('Repeat', 'fingerprint location count')
+
+
+def fingerprint(sql):
+    """
+    The shape of ``sql``: ``IN`` lists and literals are replaced, placeholders kept.
+    """
+    return LITERAL_RE.sub('?', IN_LIST_RE.sub('IN (...)', sql))
+
+
+def _template_location(frame):
+    node = frame.f_locals.get('self')
+    origin = getattr(node, 'origin', None)
+    token = getattr(node, 'token', None)
+    if origin is None or token is None:
+        return None
+    return '{}:{}'.format(origin.template_name or origin.name, token.lineno)
+
+
+def location(frame=None):
+    """
+    The innermost template line or project source line on the stack.
+    """
+    frame = frame or sys._getframe(1)
+    base_dir = str(settings.BASE_DIR)
+    while frame is not None:
+        code = frame.f_code
+        if code.co_name == 'render_annotated':
+            place = _template_location(frame)
+            if place is not None:
+                return place
+        filename = code.co_filename
+        if (filename.startswith(base_dir) and _LIBRARY_DIR not in filename
+                and not filename.startswith(_SKIPPED_FILES)):
+            return '{}:{}'.format(os.path.relpath(filename, base_dir), frame.f_lineno)
+        frame = frame.f_back
+    return 'unknown'
+
+
+class Detector(object):
+
+    def __init__(self, threshold=None):
+        self.threshold = threshold if threshold is not None else settings.NPLUSONE_THRESHOLD
+        self.counts = collections.Counter()
+        self.allowed = 0
+
+    def record(self, sql):
+        if not self.allowed:
+            self.counts[fingerprint(sql), location()] += 1
+
+    def repeats(self):
+        """
+        Fingerprints run at least ``threshold`` times from one place, most repeated first.
+        """
+        return sorted(
+            (Repeat(fp, place, count) for (fp, place), count in self.counts.items() if count >= self.threshold),
+            key=lambda repeat: (-repeat.count, repeat.location),
+        )
+
+    def report(self):
+        return '\n'.join(
+            '{} x {} at {}'.format(repeat.count, repeat.fingerprint, repeat.location)
+            for repeat in self.repeats()
+        )
+
+
+def current():
+    return getattr(_local, 'detector', None)
+
+
+def record(sql):
+    """
+    Count ``sql`` against the active detector, if any; called by the cursors.
+    """
+    detector = current()
+    if detector is not None:
+        detector.record(sql)
+
+
+@contextmanager
+def detect(threshold=None):
+    """
+    Collect the queries run in this thread inside the block.
+    """
+    previous = current()
+    detector = _local.detector = Detector(threshold)
+    try:
+        yield detector
+    finally:
+        _local.detector = previous
+
+
+@contextmanager
+def allow():
+    """
+    Do not count the queries inside the block, e.g. deliberate per-row locking.
+    """
+    detector = current()
+    if detector is None:
+        yield
+        return
+    detector.allowed += 1
+    try:
+        yield
+    finally:
+        detector.allowed -= 1
+
+
+class NPlusOneMiddleware(object):
+    """
+    Log or raise for requests that repeat a query, depending on ``NPLUSONE_MODE``.
+    """
+
+    def __init__(self, get_response):
+        if settings.NPLUSONE_MODE not in MODES:
+            raise ImproperlyConfigured('NPLUSONE_MODE must be one of: {}.'.format(', '.join(MODES)))
+        if settings.NPLUSONE_MODE == 'off':
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with detect() as detector:
+            response = self.get_response(request)
+        repeats = detector.repeats()
+        if repeats:
+            message = 'Repeated queries in {} {}:\n{}'.format(request.method, request.path, detector.report())
+            if settings.NPLUSONE_MODE == 'raise':
+                raise NPlusOneError(message)
+            logger.warning(message)
+        return response
@@ -0,0 +1,176 @@
+"""
+Find overdue loans and remind their borrowers by email.
+
+Borrowers with overdue copies are walked in primary key order, in chunks,
+along the (borrower, status, due_back) index; each chunk then fetches its
+overdue copies with one query. Every borrower gets at most one email a
+day, listing all their overdue copies, and all emails go through a single
+mail connection. Reminders are claimed before their email is sent, so
+concurrent scans never email a borrower twice; a claim is given back if
+its email could not be sent.
+"""
+import datetime
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.mail import EmailMessage, get_connection
+from django.db import IntegrityError, transaction
+from django.template.loader import render_to_string
+
+from .models import BookInstance, OverdueReminder
+
+
+SUBJECT = 'Overdue books from the Local Library'
+
+
+class ScanStats(object):
+
+    def __init__(self):
+        self.started = time.time()
+        self.borrowers = 0
+        self.copies = 0
+        self.reminded = 0
+        self.skipped = 0
+
+    @property
+    def copies_per_second(self):
+        elapsed = time.time() - self.started
+        return self.copies / elapsed if elapsed else 0.0
+
+    def __str__(self):
+        return (
+            '{copies} overdue copies of {borrowers} borrowers: {reminded} reminded, '
+            '{skipped} skipped, {rate:.0f} copies/s'
+        ).format(rate=self.copies_per_second, **self.__dict__)
+
+
+def overdue_loans(today):
+    return BookInstance.objects.filter(
+        status__exact=BookInstance.ON_LOAN_STATUS,
+        due_back__lt=today,
+    )
+
+
+def borrower_chunks(today, chunk_size):
+    """
+    Yield lists of ids of borrowers with overdue copies.
+    """
+    last_id = None
+    while True:
+        queryset = overdue_loans(today).filter(borrower__isnull=False)
+        if last_id is not None:
+            queryset = queryset.filter(borrower_id__gt=last_id)
+        ids = list(
+            queryset.order_by('borrower_id')
+                    .values_list('borrower_id', flat=True)
+                    .distinct()[:chunk_size]
+        )
+        if not ids:
+            return
+        last_id = ids[-1]
+        yield ids
+
+
+def build_message(borrower, copies):
+    body = render_to_string('catalog/email/overdue_reminder.txt', {
+        'borrower': borrower,
+        'copies': copies,
+    })
+    return EmailMessage(SUBJECT, body, settings.DEFAULT_FROM_EMAIL, [borrower.email])
+
+
+def scan(today=None, chunk_size=500, dry_run=False, connection=None):
+    """
+    Remind every borrower with overdue copies who was not reminded today.
+    """
+    today = today or datetime.date.today()
+    stats = ScanStats()
+    connection = connection or get_connection()
+    if not dry_run:
+        connection.open()
+    try:
+        for borrower_ids in borrower_chunks(today, chunk_size):
+            _remind(borrower_ids, today, stats, dry_run, connection)
+    finally:
+        if not dry_run:
+            connection.close()
+    return stats
+
+
+def _remind(borrower_ids, today, stats, dry_run, connection):
+    already_reminded = set(
+        OverdueReminder.objects
+                      .filter(sent_on=today, borrower_id__in=borrower_ids)
+                      .values_list('borrower_id', flat=True)
+    )
+    pending = [pk for pk in borrower_ids if pk not in already_reminded]
+    stats.borrowers += len(borrower_ids)
+    stats.skipped += len(already_reminded)
+    if not pending:
+        return
+
+    copies_by_borrower = {}
+    copies = overdue_loans(today) \
+                 .filter(borrower_id__in=pending) \
+                 .select_related('book') \
+                 .order_by('borrower_id', 'due_back', 'id')
+    for copy in copies:
+        copies_by_borrower.setdefault(copy.borrower_id, []).append(copy)
+        stats.copies += 1
+
+    borrowers = User.objects.filter(pk__in=pending).exclude(email='').order_by('pk')
+    messages = {}
+    reminders = []
+    for borrower in borrowers:
+        overdue_copies = copies_by_borrower.get(borrower.pk)
+        if not overdue_copies:
+            # returned since the borrower chunk was read
+            continue
+        messages[borrower.pk] = build_message(borrower, overdue_copies)
+        reminders.append(OverdueReminder(
+            borrower=borrower,
+            sent_on=today,
+            copies=len(overdue_copies),
+        ))
+    stats.skipped += len(pending) - len(reminders)
+    if dry_run or not reminders:
+        return
+
+    claimed = _claim(reminders)
+    stats.skipped += len(reminders) - len(claimed)
+    for num, reminder in enumerate(claimed):
+        try:
+            connection.send_messages([messages[reminder.borrower_id]])
+        except Exception:
+            OverdueReminder.objects.filter(
+                sent_on=today,
+                borrower_id__in=[unsent.borrower_id for unsent in claimed[num:]],
+            ).delete()
+            raise
+        stats.reminded += 1
+
+
+def _claim(reminders):
+    """
+    Insert the reminders and return those this scan may send.
+
+    Another scan may have claimed some of the borrowers since they were
+    looked up; if the batch insert conflicts, every reminder is claimed on
+    its own and the conflicting ones are left to the other scan.
+    """
+    try:
+        with transaction.atomic():
+            OverdueReminder.objects.bulk_create(reminders)
+        return reminders
+    except IntegrityError:
+        pass
+    claimed = []
+    for reminder in reminders:
+        try:
+            with transaction.atomic():
+                reminder.save(force_insert=True)
+        except IntegrityError:
+            continue
+        claimed.append(reminder)
+    return claimed
@@ -0,0 +1,256 @@
+"""
+Keyset (cursor) pagination for list views.
+
+Pages are selected with a ``WHERE (a, b, id) > (...)`` style filter on a
+stable ordering instead of ``OFFSET``, and no total count is taken, so a
+deep page costs the same as the first one. Cursors are opaque signed
+tokens holding the ordering values of the row a page starts after.
+
+EstimatedCountPaginator keeps offset pages (as the admin needs) but takes
+the total of huge tables from the database statistics instead of COUNT(*).
+"""
+import json
+import operator
+from functools import reduce
+
+from django.core import signing
+from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Q
+from django.http import Http404
+from django.utils.functional import cached_property
+from django.utils.translation import ugettext as _
+
+
+CURSOR_SALT = 'catalog.pagination'
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+class KeysetPage(object):
+    """
+    Page of results exposing the parts of django.core.paginator.Page
+    the templates use, plus opaque cursors to the neighbouring pages.
+    """
+
+    is_keyset = True
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return '<KeysetPage of {} objects>'.format(len(self))
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator(object):
+
+    def __init__(self, queryset, ordering, per_page):
+        if not ordering or ordering[-1].lstrip('-') not in ('id', 'pk'):
+            raise ValueError('Keyset ordering must end with the primary key.')
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.per_page = per_page
+        self.model = queryset.model
+        self.nulls_largest = connections[queryset.db].features.nulls_order_largest
+
+    def _fields(self):
+        for name in self.ordering:
+            descending = name.startswith('-')
+            field_name = name.lstrip('-')
+            if field_name == 'pk':
+                field = self.model._meta.pk
+            else:
+                field = self.model._meta.get_field(field_name)
+            yield field, descending
+
+    def _values(self, obj):
+        return [getattr(obj, field.attname) for field, _ in self._fields()]
+
+    def encode(self, obj, direction):
+        values = json.loads(json.dumps(self._values(obj), cls=DjangoJSONEncoder))
+        return signing.dumps([direction, values], salt=CURSOR_SALT, compress=True)
+
+    def decode(self, cursor):
+        try:
+            direction, values = signing.loads(cursor, salt=CURSOR_SALT)
+            fields = list(self._fields())
+            if direction not in (NEXT, PREVIOUS) or len(values) != len(fields):
+                raise ValueError(cursor)
+            values = [
+                None if value is None else field.to_python(value)
+                for (field, _), value in zip(fields, values)
+            ]
+        except (signing.BadSignature, ValueError, TypeError):
+            raise Http404(_('Invalid cursor.'))
+        return direction, values
+
+    def _seek(self, values, forward):
+        """
+        Build a filter matching rows strictly after (or before) ``values``
+        in the ordering, taking the database's NULL placement into account.
+        """
+        conditions = []
+        equal = Q()
+        for (field, descending), value in zip(self._fields(), values):
+            name = field.attname
+            nulls_after = self.nulls_largest != descending
+            if not forward:
+                nulls_after = not nulls_after
+
+            if value is None:
+                beyond = None if nulls_after else Q(**{name + '__isnull': False})
+                same = Q(**{name + '__isnull': True})
+            else:
+                lookup = 'gt' if descending != forward else 'lt'
+                beyond = Q(**{'{}__{}'.format(name, lookup): value})
+                if field.null and nulls_after:
+                    beyond |= Q(**{name + '__isnull': True})
+                same = Q(**{name: value})
+
+            if beyond is not None:
+                conditions.append(equal & beyond)
+            equal &= same
+        return reduce(operator.or_, conditions)
+
+    def _order_by(self, forward):
+        if forward:
+            return self.ordering
+        return tuple(
+            name[1:] if name.startswith('-') else '-' + name
+            for name in self.ordering
+        )
+
+    def page(self, cursor=None):
+        direction, values = self.decode(cursor) if cursor else (NEXT, None)
+        forward = direction == NEXT
+
+        queryset = self.queryset.order_by(*self._order_by(forward))
+        if values is not None:
+            queryset = queryset.filter(self._seek(values, forward))
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if not forward:
+            rows.reverse()
+
+        if forward:
+            has_next, has_previous = has_more, values is not None
+        else:
+            has_next, has_previous = True, has_more
+        return KeysetPage(
+            rows,
+            next_cursor=self.encode(rows[-1], NEXT) if has_next and rows else None,
+            previous_cursor=self.encode(rows[0], PREVIOUS) if has_previous and rows else None,
+        )
+
+
+class KeysetPaginationMixin(object):
+    """
+    ListView mixin paginating with keyset cursors.
+
+    Requests still carrying a ``?page=`` number (old links) are served by
+    the regular offset paginator over the same ordering.
+    """
+
+    keyset_ordering = ('pk',)
+    cursor_kwarg = 'cursor'
+
+    def get_keyset_ordering(self):
+        return self.keyset_ordering
+
+    def paginate_queryset(self, queryset, page_size):
+        ordering = self.get_keyset_ordering()
+        if self.page_kwarg in self.request.GET:
+            return super(KeysetPaginationMixin, self).paginate_queryset(
+                queryset.order_by(*ordering), page_size
+            )
+
+        paginator = KeysetPaginator(queryset, ordering, page_size)
+        page = paginator.page(self.request.GET.get(self.cursor_kwarg))
+        return (None, page, page.object_list, page.has_other_pages())
+
+    def get_context_data(self, **kwargs):
+        context = super(KeysetPaginationMixin, self).get_context_data(**kwargs)
+        # filters and sorting carried over to the previous and next page links
+        params = self.request.GET.copy()
+        params.pop(self.cursor_kwarg, None)
+        params.pop(self.page_kwarg, None)
+        context['page_query'] = params.urlencode() + '&' if params else ''
+        return context
+
+
+def estimated_row_count(model, using='default'):
+    """
+    Row count of ``model``'s table from the planner statistics, or None
+    when the database keeps none (e.g. SQLite before ``ANALYZE``).
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    queries = {
+        'sqlite': ('SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table]),
+        'postgresql': ('SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [table]),
+        'mysql': (
+            'SELECT table_rows FROM information_schema.tables '
+            'WHERE table_schema = DATABASE() AND table_name = %s',
+            [table],
+        ),
+    }
+    if connection.vendor not in queries:
+        return None
+    sql, params = queries[connection.vendor]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            # sqlite_stat1 only exists once ANALYZE has run
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if cursor.fetchone() is None:
+                return None
+        cursor.execute(sql, params)
+        row = cursor.fetchone()
+    if row is None or row[0] is None:
+        return None
+    # sqlite_stat1.stat is "<rows> <rows per key> ..."
+    estimate = int(float(str(row[0]).split()[0]))
+    return estimate if estimate >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator for changelists of huge tables.
+
+    An unfiltered queryset over a table estimated above ``estimate_threshold``
+    rows reports the estimate; any other count stops at ``count_limit``, so
+    no request counts millions of rows.
+    """
+
+    estimate_threshold = 100000
+    count_limit = 100000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_row_count(queryset.model, using=queryset.db)
+            if estimate is not None and estimate >= self.estimate_threshold:
+                return estimate
+        return queryset.values('pk')[:self.count_limit].count()
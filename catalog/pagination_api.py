@@ -0,0 +1,116 @@
+from collections import OrderedDict
+
+from django.template import loader
+from django.utils.encoding import force_text
+from django.utils.translation import ugettext_lazy as _
+from rest_framework import pagination
+from rest_framework.compat import coreapi, coreschema
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from .pagination import KeysetPaginator
+
+
+class CatalogCursorPagination(pagination.BasePagination):
+    """
+    Keyset cursors over every column of ``ordering``, as in the HTML list
+    views (see catalog.pagination).
+
+    DRF's CursorPagination seeks on the first column only and offsets
+    through ties, which repeats rows and never ends once more than its
+    offset cutoff of rows share a value, e.g. a title.
+    """
+    cursor_query_param = 'cursor'
+    cursor_query_description = _('The pagination cursor value.')
+    page_size = api_settings.PAGE_SIZE
+    ordering = ('pk',)
+    template = 'rest_framework/pagination/previous_and_next.html'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.base_url = request.build_absolute_uri()
+        # an empty ?cursor= asks for the first page in cursor mode
+        cursor = request.query_params.get(self.cursor_query_param) or None
+        self.page = KeysetPaginator(queryset, self.ordering, self.page_size).page(cursor)
+        return list(self.page)
+
+    def _link(self, cursor):
+        if cursor is None:
+            return None
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def get_next_link(self):
+        return self._link(self.page.next_cursor)
+
+    def get_previous_link(self):
+        return self._link(self.page.previous_cursor)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_html_context(self):
+        return {
+            'previous_url': self.get_previous_link(),
+            'next_url': self.get_next_link(),
+        }
+
+    def to_html(self):
+        return loader.get_template(self.template).render(self.get_html_context())
+
+    def get_schema_fields(self, view):
+        assert coreapi is not None, 'coreapi must be installed to use `get_schema_fields()`'
+        assert coreschema is not None, 'coreschema must be installed to use `get_schema_fields()`'
+        return [
+            coreapi.Field(
+                name=self.cursor_query_param,
+                required=False,
+                location='query',
+                schema=coreschema.String(title='Cursor', description=force_text(self.cursor_query_description)),
+            ),
+        ]
+
+
+class CatalogLimitOffsetPagination(pagination.LimitOffsetPagination):
+    max_limit = 500
+
+
+class CatalogPagination(pagination.BasePagination):
+    """
+    Limit/offset pagination by default, cursor pagination when the
+    request carries a ``cursor`` parameter.
+
+    Cursor pages are ordered by the view's ``cursor_ordering``.
+    """
+
+    def __init__(self):
+        self.limit_offset = CatalogLimitOffsetPagination()
+        self.cursor = CatalogCursorPagination()
+        self.active = self.limit_offset
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor.cursor_query_param in request.query_params:
+            self.cursor.ordering = getattr(view, 'cursor_ordering', self.cursor.ordering)
+            self.active = self.cursor
+        else:
+            self.active = self.limit_offset
+        return self.active.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.active.get_paginated_response(data)
+
+    def to_html(self):
+        return self.active.to_html()
+
+    def get_results(self, data):
+        return self.active.get_results(data)
+
+    def get_schema_fields(self, view):
+        return self.limit_offset.get_schema_fields(view) + self.cursor.get_schema_fields(view)
+
+    @property
+    def display_page_controls(self):
+        return getattr(self.active, 'display_page_controls', False)
@@ -0,0 +1,77 @@
+"""
+Read-replica routing for catalog reads.
+
+Aliases listed in the ``DATABASE_REPLICAS`` setting receive reads of
+catalog models, but only while a request has opted in through
+``catalog.middleware.ReplicaMiddleware``. Everything else - writes, reads
+outside a request (management commands, workers), reads during unsafe
+requests and reads by a client that wrote something in the last
+``REPLICA_PIN_SECONDS`` - goes to the primary, so users always see their
+own writes even when the replicas lag behind. A request reads from one
+replica, picked at random when it opts in, so all its reads see the same
+state of the data.
+"""
+import random
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+
+_state = threading.local()
+
+
+def replicas():
+    return list(getattr(settings, 'DATABASE_REPLICAS', ()))
+
+
+def replicas_enabled():
+    return getattr(_state, 'enabled', False)
+
+
+def current_replica():
+    """
+    Return the replica catalog reads go to in this thread, or None.
+    """
+    return getattr(_state, 'replica', None)
+
+
+@contextmanager
+def use_replicas(enabled=True):
+    """
+    Allow (or forbid) catalog reads from replicas in this thread; they all
+    go to one replica picked on entry.
+    """
+    aliases = replicas()
+    previous = replicas_enabled(), current_replica()
+    _state.enabled = enabled
+    _state.replica = random.choice(aliases) if enabled and aliases else None
+    try:
+        yield
+    finally:
+        _state.enabled, _state.replica = previous
+
+
+class ReplicaRouter(object):
+    """
+    Send catalog reads to the current replica when allowed, the rest to the primary.
+    """
+    app_labels = ('catalog',)
+
+    def db_for_read(self, model, **hints):
+        replica = current_replica()
+        if replica is not None and model._meta.app_label in self.app_labels:
+            return replica
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Every alias holds the same data.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary, not from migrate.
+        return db not in replicas()
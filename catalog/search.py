@@ -0,0 +1,198 @@
+"""
+Full-text search over book titles, summaries and author names.
+
+On SQLite the ``catalog_book_fts`` FTS5 table (created in migration 0010)
+mirrors ``catalog_book`` through triggers, so it stays in sync with every
+write path, bulk ones included. SQLite schema changes rebuild tables and
+lose their triggers, so they are dropped before ``migrate`` and installed
+again afterwards. Results are ranked with bm25, weighting
+title matches above author matches above summary matches. Other databases
+fall back to ``icontains`` filters.
+"""
+import re
+
+from django.db import connection, connections
+from django.db.models import Q
+
+from .models import Book
+
+
+FTS_TABLE = 'catalog_book_fts'
+# bm25 column weights for title, summary and author
+WEIGHTS = (10.0, 1.0, 5.0)
+MAX_TERMS = 10
+
+TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+AUTHOR_NAME = (
+    "COALESCE((SELECT first_name || ' ' || last_name FROM catalog_author "
+    "WHERE id = new.author_id), '')"
+)
+
+TRIGGERS = {
+    'catalog_book_fts_insert':
+        "AFTER INSERT ON catalog_book BEGIN "
+        "INSERT INTO catalog_book_fts (rowid, title, summary, author) "
+        "VALUES (new.id, new.title, new.summary, " + AUTHOR_NAME + "); END",
+    'catalog_book_fts_update':
+        "AFTER UPDATE OF title, summary, author_id ON catalog_book BEGIN "
+        "DELETE FROM catalog_book_fts WHERE rowid = old.id; "
+        "INSERT INTO catalog_book_fts (rowid, title, summary, author) "
+        "VALUES (new.id, new.title, new.summary, " + AUTHOR_NAME + "); END",
+    'catalog_book_fts_delete':
+        "AFTER DELETE ON catalog_book BEGIN "
+        "DELETE FROM catalog_book_fts WHERE rowid = old.id; END",
+    'catalog_author_fts_update':
+        "AFTER UPDATE OF first_name, last_name ON catalog_author BEGIN "
+        "UPDATE catalog_book_fts SET author = new.first_name || ' ' || new.last_name "
+        "WHERE rowid IN (SELECT id FROM catalog_book WHERE author_id = new.id); END",
+}
+
+
+def terms(query):
+    return TERM_RE.findall(query or '')[:MAX_TERMS]
+
+
+def to_match(query):
+    """
+    Turn user input into an FTS5 MATCH expression.
+
+    Every word must match; the last one also matches as a prefix so
+    results show up while the patron is still typing.
+    """
+    words = terms(query)
+    if not words:
+        return None
+    quoted = ['"{}"'.format(word) for word in words]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def is_indexed():
+    return connection.vendor == 'sqlite'
+
+
+class SearchResults(object):
+    """
+    Ranked books matching a query; supports ``count()`` and slicing so it
+    can be handed to Django and REST framework paginators.
+    """
+
+    def __init__(self, query, queryset=None):
+        self.query = query
+        self.queryset = Book.objects.select_related('author') if queryset is None else queryset
+        self.match = to_match(query)
+        self._count = None
+
+    def _cursor(self):
+        # the database the books are read from, which may be a replica
+        return connections[self.queryset.db].cursor()
+
+    def count(self):
+        if self._count is None:
+            if self.match is None:
+                self._count = 0
+            else:
+                with self._cursor() as cursor:
+                    cursor.execute(
+                        'SELECT COUNT(*) FROM {0} WHERE {0} MATCH %s'.format(FTS_TABLE),
+                        [self.match],
+                    )
+                    self._count = cursor.fetchone()[0]
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            if key.step is not None:
+                raise ValueError('Search results do not support slice steps.')
+            start = key.start or 0
+            limit = -1 if key.stop is None else max(key.stop - start, 0)
+            return self.books(self.ranked_ids(limit, start))
+        return self[key:key + 1][0]
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def ranked_ids(self, limit, offset=0):
+        if self.match is None or limit == 0:
+            return []
+        with self._cursor() as cursor:
+            cursor.execute(
+                'SELECT rowid FROM {0} WHERE {0} MATCH %s '
+                'ORDER BY bm25({0}, %s, %s, %s), rowid LIMIT %s OFFSET %s'.format(FTS_TABLE),
+                [self.match] + list(WEIGHTS) + [limit, offset],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def books(self, ids):
+        books = self.queryset.in_bulk(ids)
+        return [books[pk] for pk in ids if pk in books]
+
+
+def search(query, queryset=None):
+    """
+    Books from ``queryset`` (all books by default) matching ``query``,
+    best matches first.
+    """
+    if is_indexed():
+        return SearchResults(query, queryset)
+
+    if queryset is None:
+        queryset = Book.objects.select_related('author')
+    words = terms(query)
+    if not words:
+        return queryset.none()
+    for word in words:
+        queryset = queryset.filter(
+            Q(title__icontains=word) |
+            Q(summary__icontains=word) |
+            Q(author__first_name__icontains=word) |
+            Q(author__last_name__icontains=word)
+        )
+    return queryset.order_by('title', 'id')
+
+
+def rebuild():
+    """
+    Repopulate the full-text index from the book table and return the
+    number of indexed books.
+    """
+    if not is_indexed():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM {}'.format(FTS_TABLE))
+        cursor.execute(
+            "INSERT INTO {} (rowid, title, summary, author) "
+            "SELECT b.id, b.title, b.summary, COALESCE(a.first_name || ' ' || a.last_name, '') "
+            "FROM catalog_book b LEFT JOIN catalog_author a ON a.id = b.author_id".format(FTS_TABLE)
+        )
+        cursor.execute("INSERT INTO {0} ({0}) VALUES ('optimize')".format(FTS_TABLE))
+        cursor.execute('SELECT COUNT(*) FROM {}'.format(FTS_TABLE))
+        return cursor.fetchone()[0]
+
+
+def drop_triggers(using='default', **kwargs):
+    """
+    pre_migrate handler: remove the sync triggers before tables are rebuilt.
+    """
+    db = connections[using]
+    if db.vendor != 'sqlite':
+        return
+    with db.cursor() as cursor:
+        for name in TRIGGERS:
+            cursor.execute('DROP TRIGGER IF EXISTS {}'.format(name))
+
+
+def create_triggers(using='default', **kwargs):
+    """
+    post_migrate handler: install the sync triggers if the index exists.
+    """
+    db = connections[using]
+    if db.vendor != 'sqlite' or FTS_TABLE not in db.introspection.table_names():
+        return
+    with db.cursor() as cursor:
+        for name, body in sorted(TRIGGERS.items()):
+            cursor.execute('CREATE TRIGGER IF NOT EXISTS {} {}'.format(name, body))
@@ -1,38 +1,181 @@
+import json
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError as DjangoValidationError
 from rest_framework import serializers
 
-from .models import Genre, Language, Book, Author, BookInstance
+from . import holds, jobs
+from .models import Genre, Language, Book, Author, BookInstance, Hold, Job
+
+
+class SparseFieldsetMixin(object):
+    """
+    Serialize only the fields passed as ``fields=[...]``.
+    """
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super(SparseFieldsetMixin, self).__init__(*args, **kwargs)
+        if fields is not None:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
 
 
-class GenreSerializer(serializers.ModelSerializer):
+class GenreSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
 
     class Meta:
         model = Genre
         fields = '__all__'
 
 
-class LanguageSerializer(serializers.ModelSerializer):
+class LanguageSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
 
     class Meta:
         model = Language
         fields = '__all__'
 
 
-class BookSerializer(serializers.ModelSerializer):
+class BookSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
 
     class Meta:
         model = Book
         fields = '__all__'
 
 
-class AuthorSerializer(serializers.ModelSerializer):
+class AuthorBookSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = Book
+        fields = ('id', 'title', 'copies_total', 'copies_available', 'copies_on_loan')
+
+
+class AuthorSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    books = serializers.SerializerMethodField()
 
     class Meta:
         model = Author
         fields = '__all__'
 
+    def get_books(self, author):
+        # AuthorViewSet prefetches the books; writes serialize a fresh instance
+        prefetch_name = Book._meta.get_field('author').related_query_name()
+        if prefetch_name in getattr(author, '_prefetched_objects_cache', {}):
+            books = author.book_set.all()
+        else:
+            books = author.book_set.order_by('title', 'id')
+        return AuthorBookSerializer(books, many=True).data
 
-class BookInstanceSerializer(serializers.ModelSerializer):
+
+class BookInstanceSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
 
     class Meta:
         model = BookInstance
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+
+
+class CheckoutSerializer(serializers.Serializer):
+    borrower = serializers.PrimaryKeyRelatedField(queryset=User.objects.all())
+    due_back = serializers.DateField(required=False)
+
+
+class RenewSerializer(serializers.Serializer):
+    due_back = serializers.DateField()
+    # only renew if this user still has the copy
+    borrower = serializers.PrimaryKeyRelatedField(queryset=User.objects.all(), required=False)
+
+
+class HoldSerializer(serializers.ModelSerializer):
+    position = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Hold
+        fields = ('id', 'book', 'patron', 'position', 'copy', 'created_at', 'allocated_at')
+        read_only_fields = ('copy', 'allocated_at')
+
+    def get_position(self, hold):
+        return holds.position(hold)
+
+
+class JSONTextField(serializers.DictField):
+    """
+    A JSON object kept in a text column.
+    """
+
+    def to_representation(self, value):
+        return json.loads(value) if value else None
+
+
+class JobSerializer(serializers.ModelSerializer):
+    kwargs = JSONTextField(required=False)
+    result = JSONTextField(read_only=True)
+
+    class Meta:
+        model = Job
+        fields = (
+            'id', 'name', 'kwargs', 'status', 'attempts', 'max_attempts', 'run_at',
+            'result', 'last_error', 'created_at', 'finished_at',
+        )
+        read_only_fields = ('status', 'attempts', 'last_error', 'finished_at')
+        extra_kwargs = {'run_at': {'required': False}, 'max_attempts': {'required': False}}
+
+    def validate_name(self, value):
+        if value not in jobs.TASKS:
+            raise serializers.ValidationError('Choose one of: {}.'.format(', '.join(sorted(jobs.TASKS))))
+        return value
+
+
+class PreloadedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Resolve primary keys from objects preloaded into the serializer context
+    instead of running one query per value.
+    """
+
+    def to_internal_value(self, data):
+        model = self.get_queryset().model
+        preloaded = self.context.get('preloaded', {}).get(model)
+        if preloaded is None:
+            return super(PreloadedPrimaryKeyRelatedField, self).to_internal_value(data)
+        try:
+            return preloaded[model._meta.pk.to_python(data)]
+        except KeyError:
+            self.fail('does_not_exist', pk_value=data)
+        except (TypeError, ValueError, DjangoValidationError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+
+class BookInstanceBulkListSerializer(serializers.ListSerializer):
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            self._context['preloaded'] = self.preload_related(data)
+        return super(BookInstanceBulkListSerializer, self).to_internal_value(data)
+
+    def preload_related(self, data):
+        """
+        Fetch every object referenced by the payload with one query per field.
+        """
+        preloaded = {}
+        for name, field in self.child.fields.items():
+            if not isinstance(field, PreloadedPrimaryKeyRelatedField):
+                continue
+            model = field.get_queryset().model
+            pks = set()
+            for item in data:
+                if not isinstance(item, dict) or item.get(name) is None:
+                    continue
+                try:
+                    pks.add(model._meta.pk.to_python(item[name]))
+                except (TypeError, ValueError, DjangoValidationError):
+                    pass
+            preloaded[model] = field.get_queryset().in_bulk(list(pks))
+        return preloaded
+
+
+class BookInstanceBulkSerializer(BookInstanceSerializer):
+    serializer_related_field = PreloadedPrimaryKeyRelatedField
+
+    # uniqueness of ids is checked for the whole batch at once
+    id = serializers.UUIDField(required=False)
+
+    class Meta(BookInstanceSerializer.Meta):
+        list_serializer_class = BookInstanceBulkListSerializer
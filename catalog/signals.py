@@ -0,0 +1,157 @@
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import counters, fragments, holds, versions
+from .models import Author, Book, BookInstance, Genre, Language
+
+
+_state = threading.local()
+
+
+@contextmanager
+def muted():
+    """
+    Skip the bookkeeping handlers below in this thread.
+
+    Bulk operations use it and account for their changes in one go.
+    """
+    previous = getattr(_state, 'muted', False)
+    _state.muted = True
+    try:
+        yield
+    finally:
+        _state.muted = previous
+
+
+def unless_muted(handler):
+    @wraps(handler)
+    def wrapper(*args, **kwargs):
+        if not getattr(_state, 'muted', False):
+            return handler(*args, **kwargs)
+    return wrapper
+
+
+def _is_available(status):
+    return status == BookInstance.AVAILABLE_STATUS
+
+
+@receiver(post_save, sender=Book)
+@unless_muted
+def book_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.adjust(num_books=1)
+    else:
+        fragments.invalidate(instance.pk)
+
+
+@receiver(post_delete, sender=Book)
+@unless_muted
+def book_deleted(sender, instance, **kwargs):
+    counters.adjust(num_books=-1)
+    fragments.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=Author)
+@unless_muted
+def author_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.adjust(num_authors=1)
+
+
+@receiver(post_delete, sender=Author)
+@unless_muted
+def author_deleted(sender, instance, **kwargs):
+    counters.adjust(num_authors=-1)
+
+
+@receiver(post_save, sender=Genre)
+@unless_muted
+def genre_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.adjust(num_genres=1)
+
+
+@receiver(post_delete, sender=Genre)
+@unless_muted
+def genre_deleted(sender, instance, **kwargs):
+    counters.adjust(num_genres=-1)
+
+
+@receiver(post_save, sender=BookInstance)
+@unless_muted
+def bookinstance_saved(sender, instance, created, **kwargs):
+    loaded = {} if created else getattr(instance, '_loaded_values', {})
+    if created:
+        counters.adjust(
+            num_instances=1,
+            num_instances_available=int(_is_available(instance.status)),
+        )
+        counters.adjust_books(added=[(instance.book_id, instance.status)])
+    else:
+        if 'status' in loaded:
+            was = _is_available(loaded['status'])
+            now = _is_available(instance.status)
+            counters.adjust(num_instances_available=int(now) - int(was))
+        if 'status' in loaded or 'book_id' in loaded:
+            counters.adjust_books(
+                added=[(instance.book_id, instance.status)],
+                removed=[(loaded.get('book_id', instance.book_id), loaded.get('status', instance.status))],
+            )
+    # a copy moved to another book leaves the old book's section too
+    fragments.invalidate(instance.book_id, loaded.get('book_id'))
+    if _is_available(instance.status) and not _is_available(loaded.get('status')):
+        holds.allocate([instance])
+    instance._loaded_values = {
+        field.attname: getattr(instance, field.attname)
+        for field in sender._meta.concrete_fields
+    }
+
+
+@receiver(post_delete, sender=BookInstance)
+@unless_muted
+def bookinstance_deleted(sender, instance, **kwargs):
+    loaded = getattr(instance, '_loaded_values', {})
+    status = loaded.get('status', instance.status)
+    counters.adjust(
+        num_instances=-1,
+        num_instances_available=-int(_is_available(status)),
+    )
+    # also touches the book, whose page lists its copies
+    counters.adjust_books(removed=[(loaded.get('book_id', instance.book_id), status)])
+    fragments.invalidate(instance.book_id)
+    if status == BookInstance.RESERVED_STATUS:
+        holds.requeue([loaded.get('book_id', instance.book_id)])
+
+
+@receiver(m2m_changed, sender=Book.genre.through)
+@unless_muted
+def book_genres_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # genre.book_set: the books are known before a clear, not after
+        if action in ('post_add', 'post_remove'):
+            books = Book.objects.filter(pk__in=pk_set)
+        elif action == 'pre_clear':
+            books = Book.objects.filter(genre=instance)
+        else:
+            return
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        books = Book.objects.filter(pk=instance.pk)
+    else:
+        return
+    books.update(updated_at=timezone.now())
+    versions.bump(Book)
+
+
+@unless_muted
+def table_changed(sender, **kwargs):
+    versions.bump(sender)
+
+
+for model in (Author, Book, BookInstance, Genre, Language):
+    post_save.connect(table_changed, sender=model, dispatch_uid='catalog.versions.saved')
+    post_delete.connect(table_changed, sender=model, dispatch_uid='catalog.versions.deleted')
@@ -0,0 +1,111 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from catalog.models import Author, Book, BookInstance, Genre
+from catalog.pagination import EstimatedCountPaginator, estimated_row_count
+
+
+class AdminChangelistQueryTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', '12345')
+        cls.genres = [Genre.objects.create(name='Genre {}'.format(num)) for num in range(4)]
+
+    def setUp(self):
+        self.client.login(username='admin', password='12345')
+
+    def add_books(self, number):
+        author = Author.objects.create(first_name='John', last_name='Smith')
+        for num in range(number):
+            book = Book.objects.create(title='Title {}'.format(num), author=author)
+            book.genre.add(*self.genres)
+            BookInstance.objects.create(
+                book=book, imprint='Imprint', borrower=self.admin,
+                status=BookInstance.ON_LOAN_STATUS,
+                due_back=datetime.date(2017, 1, 1) + datetime.timedelta(days=num),
+            )
+
+    def count_queries(self, url, **params):
+        with CaptureQueriesContext(connection) as context:
+            resp = self.client.get(url, params)
+        self.assertEqual(resp.status_code, 200)
+        return len(context.captured_queries)
+
+    def assertQueriesDoNotGrowWithRows(self, url, **params):
+        self.add_books(5)
+        few = self.count_queries(url, **params)
+        self.add_books(95)
+        self.assertEqual(self.count_queries(url, **params), few)
+
+    def test_book_changelist(self):
+        url = reverse('admin:catalog_book_changelist')
+        self.assertQueriesDoNotGrowWithRows(url)
+        resp = self.client.get(url)
+        self.assertEqual(len(resp.context['cl'].result_list), 100)
+        self.assertContains(resp, 'Genre 0, Genre 1, Genre 2')
+
+    def test_bookinstance_changelist(self):
+        self.assertQueriesDoNotGrowWithRows(reverse('admin:catalog_bookinstance_changelist'))
+
+    def test_bookinstance_changelist_filtered(self):
+        self.assertQueriesDoNotGrowWithRows(
+            reverse('admin:catalog_bookinstance_changelist'),
+            status__exact=BookInstance.ON_LOAN_STATUS,
+        )
+
+    def test_bookinstance_changelist_skips_full_count(self):
+        self.add_books(3)
+        url = reverse('admin:catalog_bookinstance_changelist')
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(url, {'status__exact': BookInstance.ON_LOAN_STATUS})
+        counts = [query['sql'] for query in context.captured_queries if 'COUNT(' in query['sql']]
+        self.assertEqual(len(counts), 1)
+        self.assertIn('LIMIT', counts[0])
+
+
+class EstimatedCountPaginatorTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        book = Book.objects.create(title='Title')
+        BookInstance.objects.bulk_create([
+            BookInstance(book=book, imprint='Imprint', status=BookInstance.AVAILABLE_STATUS if num % 2 else '')
+            for num in range(30)
+        ])
+
+    def paginator(self, queryset, **attrs):
+        paginator = EstimatedCountPaginator(queryset, 10)
+        for name, value in attrs.items():
+            setattr(paginator, name, value)
+        return paginator
+
+    def test_small_counts_are_exact(self):
+        self.assertEqual(self.paginator(BookInstance.objects.all()).count, 30)
+        available = BookInstance.objects.filter(status=BookInstance.AVAILABLE_STATUS)
+        self.assertEqual(self.paginator(available).count, 15)
+
+    def test_counts_stop_at_the_limit(self):
+        paginator = self.paginator(BookInstance.objects.all(), count_limit=20)
+        self.assertEqual(paginator.count, 20)
+        self.assertEqual(paginator.num_pages, 2)
+
+    def test_unfiltered_count_uses_table_statistics(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('statistics are only refreshed here on SQLite')
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE catalog_bookinstance')
+        self.assertEqual(estimated_row_count(BookInstance), 30)
+
+        BookInstance.objects.bulk_create([BookInstance(imprint='New') for _ in range(5)])
+        paginator = self.paginator(BookInstance.objects.all(), estimate_threshold=10)
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(paginator.count, 30)
+        self.assertFalse([query for query in context.captured_queries if 'COUNT(' in query['sql']])
+        filtered = self.paginator(BookInstance.objects.filter(imprint='New'), estimate_threshold=10)
+        self.assertEqual(filtered.count, 5)
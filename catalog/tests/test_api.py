@@ -0,0 +1,258 @@
+import datetime
+import json
+import uuid
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from catalog import counters
+from catalog.models import Author, Book, BookInstance, Genre
+
+
+class ApiPaginationTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        book = Book.objects.create(title='Title')
+        BookInstance.objects.bulk_create([
+            BookInstance(book=book, imprint='Imprint {}'.format(copy_num))
+            for copy_num in range(120)
+        ])
+
+    def test_list_is_paginated_by_default(self):
+        resp = self.client.get('/api/catalog/book-instances/')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data['count'], 120)
+        self.assertEqual(len(resp.data['results']), 50)
+        self.assertIn('offset=50', resp.data['next'])
+
+    def test_limit_is_bounded(self):
+        resp = self.client.get('/api/catalog/book-instances/', {'limit': 100000})
+        self.assertEqual(len(resp.data['results']), 120)
+
+        Book.objects.bulk_create([Book(title='Title {}'.format(num)) for num in range(600)])
+        resp = self.client.get('/api/catalog/books/', {'limit': 100000})
+        self.assertEqual(len(resp.data['results']), 500)
+
+    def test_cursor_pagination_walks_all_rows_without_count(self):
+        seen = []
+        url = '/api/catalog/book-instances/?cursor='
+        while url:
+            resp = self.client.get(url)
+            self.assertEqual(resp.status_code, 200)
+            self.assertNotIn('count', resp.data)
+            seen.extend(item['id'] for item in resp.data['results'])
+            url = resp.data['next']
+        self.assertEqual(len(seen), 120)
+        self.assertEqual(len(set(seen)), 120)
+
+    def test_cursor_pagination_seeks_past_ties_in_every_column(self):
+        # more rows share a title and a surname than DRF's offset cutoff of 1000
+        Book.objects.bulk_create([Book(title='Same title') for _ in range(1100)])
+        Author.objects.bulk_create([Author(first_name='Jane', last_name='Doe') for _ in range(1100)])
+        for url, model in (('/api/catalog/books/?cursor=', Book), ('/api/catalog/authors/?fields=id&cursor=', Author)):
+            total = model.objects.count()
+            seen = []
+            while url:
+                resp = self.client.get(url)
+                self.assertEqual(resp.status_code, 200)
+                seen.extend(item['id'] for item in resp.data['results'])
+                url = resp.data['next']
+            self.assertEqual(len(seen), total)
+            self.assertEqual(len(set(seen)), total)
+
+        resp = self.client.get('/api/catalog/books/?cursor=')
+        resp = self.client.get(resp.data['next'])
+        resp = self.client.get(resp.data['previous'])
+        self.assertEqual(resp.data['results'][0]['id'], Book.objects.order_by('title', 'id')[0].pk)
+        self.assertIsNone(resp.data['previous'])
+
+    def test_invalid_cursor_returns_not_found(self):
+        self.assertEqual(self.client.get('/api/catalog/books/', {'cursor': 'tampered'}).status_code, 404)
+
+
+class ApiSparseFieldsetTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(first_name='John', last_name='Smith')
+        genre = Genre.objects.create(name='Fantasy')
+        for book_num in range(3):
+            book = Book.objects.create(
+                title='Title {}'.format(book_num),
+                summary='Long summary',
+                author=author,
+            )
+            book.genre.add(genre)
+
+    def test_only_requested_fields_are_serialized(self):
+        resp = self.client.get('/api/catalog/books/', {'fields': 'id,title'})
+        self.assertEqual(resp.status_code, 200)
+        for item in resp.data['results']:
+            self.assertEqual(set(item), {'id', 'title'})
+
+    def test_only_requested_columns_are_selected(self):
+        with CaptureQueriesContext(connection) as context:
+            self.client.get('/api/catalog/books/', {'fields': 'title'})
+        select = context.captured_queries[-1]['sql']
+        self.assertIn('"catalog_book"."title"', select)
+        self.assertNotIn('summary', select)
+
+    def test_many_to_many_fields_are_prefetched(self):
+        # table version, count, books, genres
+        with self.assertNumQueries(4):
+            resp = self.client.get('/api/catalog/books/', {'fields': 'id,genre'})
+        genre = Genre.objects.get()
+        self.assertEqual([item['genre'] for item in resp.data['results']], [[genre.pk]] * 3)
+
+    def test_unknown_field_is_rejected(self):
+        resp = self.client.get('/api/catalog/books/', {'fields': 'title,secret'})
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn('fields', resp.data)
+
+
+class AuthorCopyCountsApiTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.authors = [
+            Author.objects.create(first_name='First', last_name='Author {}'.format(num))
+            for num in range(3)
+        ]
+        for author in cls.authors:
+            for book_num in range(10):
+                book = Book.objects.create(title='Title {}'.format(book_num), author=author)
+                BookInstance.objects.create(book=book, imprint='Imprint', status=BookInstance.AVAILABLE_STATUS)
+                BookInstance.objects.create(book=book, imprint='Imprint', status=BookInstance.ON_LOAN_STATUS)
+
+    def test_author_lists_books_with_copy_counts(self):
+        resp = self.client.get('/api/catalog/authors/{}/'.format(self.authors[0].pk))
+        self.assertEqual(len(resp.data['books']), 10)
+        self.assertEqual(resp.data['books'][0], {
+            'id': Book.objects.filter(author=self.authors[0]).order_by('title', 'id')[0].pk,
+            'title': 'Title 0',
+            'copies_total': 2,
+            'copies_available': 1,
+            'copies_on_loan': 1,
+        })
+
+    def test_list_counts_copies_in_one_grouped_query(self):
+        # table versions, count, authors, books
+        with self.assertNumQueries(4):
+            resp = self.client.get('/api/catalog/authors/')
+        self.assertEqual([len(author['books']) for author in resp.data['results']], [10, 10, 10])
+
+    def test_books_are_skipped_when_not_requested(self):
+        with self.assertNumQueries(3):
+            resp = self.client.get('/api/catalog/authors/', {'fields': 'last_name'})
+        self.assertEqual(resp.data['results'][0], {'last_name': 'Author 0'})
+
+    def test_update_still_returns_counts(self):
+        resp = self.client.patch(
+            '/api/catalog/authors/{}/'.format(self.authors[0].pk),
+            data=json.dumps({'first_name': 'Changed'}),
+            content_type='application/json',
+        )
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data['books'][0]['copies_total'], 2)
+
+
+@override_settings(BULK_MAX_BATCH_SIZE=300)
+class BookInstanceBulkApiTest(TestCase):
+
+    url = '/api/catalog/book-instances/bulk/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = Book.objects.create(title='Title')
+        cls.user = User.objects.create_user(username='reader', password='12345')
+
+    def setUp(self):
+        counters.rebuild()
+
+    def _send(self, method, payload):
+        return getattr(self.client, method)(
+            self.url,
+            data=json.dumps(payload),
+            content_type='application/json',
+        )
+
+    def _copies(self, number):
+        return [
+            {'book': self.book.pk, 'imprint': 'Imprint {}'.format(num), 'status': BookInstance.AVAILABLE_STATUS}
+            for num in range(number)
+        ]
+
+    def test_bulk_create_uses_a_fixed_number_of_queries(self):
+        # book lookup, savepoint, insert, counters, book counters, table version,
+        # reservations to withdraw, hold queues, release
+        with self.assertNumQueries(9):
+            resp = self._send('post', self._copies(250))
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(len(resp.data), 250)
+        self.assertEqual(BookInstance.objects.count(), 250)
+        self.assertEqual(counters.check(), {})
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.copies_total, self.book.copies_available), (250, 250))
+
+    def test_bulk_create_reports_per_item_errors_and_writes_nothing(self):
+        payload = self._copies(3)
+        payload[1]['book'] = 999
+        payload[2]['status'] = 'x'
+        resp = self._send('post', payload)
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(resp.data[0], {})
+        self.assertIn('book', resp.data[1])
+        self.assertIn('status', resp.data[2])
+        self.assertFalse(BookInstance.objects.exists())
+
+    def test_bulk_create_rejects_existing_ids(self):
+        copy = BookInstance.objects.create(book=self.book)
+        payload = self._copies(2)
+        payload[1]['id'] = str(copy.pk)
+        resp = self._send('post', payload)
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn('id', resp.data[1])
+        self.assertEqual(BookInstance.objects.count(), 1)
+
+    def test_batch_size_is_limited(self):
+        resp = self._send('post', self._copies(301))
+        self.assertEqual(resp.status_code, 400)
+        self.assertFalse(BookInstance.objects.exists())
+
+    def test_bulk_update(self):
+        created = self._send('post', self._copies(150)).data
+        due_back = datetime.date.today() + datetime.timedelta(weeks=2)
+        payload = [
+            {
+                'id': item['id'],
+                'status': BookInstance.ON_LOAN_STATUS,
+                'borrower': self.user.pk,
+                'due_back': due_back.isoformat(),
+            }
+            for item in created[:120]
+        ]
+        resp = self._send('patch', payload)
+        self.assertEqual(resp.status_code, 200)
+        on_loan = BookInstance.objects.filter(status=BookInstance.ON_LOAN_STATUS)
+        self.assertEqual(on_loan.count(), 120)
+        self.assertEqual(on_loan.filter(borrower=self.user, due_back=due_back).count(), 120)
+        self.assertEqual(
+            set(BookInstance.objects.exclude(status=BookInstance.ON_LOAN_STATUS).values_list('imprint', flat=True)),
+            {'Imprint {}'.format(num) for num in range(120, 150)},
+        )
+        self.assertEqual(counters.check(), {})
+
+    def test_bulk_update_reports_unknown_ids(self):
+        resp = self._send('patch', [{'id': str(uuid.uuid4()), 'status': BookInstance.ON_LOAN_STATUS}])
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn('id', resp.data[0])
+
+    def test_bulk_delete(self):
+        created = self._send('post', self._copies(20)).data
+        resp = self._send('delete', [item['id'] for item in created[:15]])
+        self.assertEqual(resp.status_code, 204)
+        self.assertEqual(BookInstance.objects.count(), 5)
+        self.assertEqual(counters.check(), {})
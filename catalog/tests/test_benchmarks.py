@@ -0,0 +1,46 @@
+from django.test import SimpleTestCase, TestCase
+
+from catalog.benchmarks import SCENARIOS, compare
+
+
+class RouteBenchmarkTest(TestCase):
+
+    def test_every_route_is_benchmarked(self):
+        report = SCENARIOS['routes'](books=20, copies_per_book=2, borrowers=5, requests=1)
+        self.assertEqual(report['uncovered_routes'], [])
+        for name, endpoint in report['endpoints'].items():
+            self.assertEqual(endpoint['unexpected_statuses'], [], name)
+            self.assertGreater(endpoint['p99_ms'], 0)
+
+
+class TimingBenchmarkTest(TestCase):
+
+    def test_overhead_is_reported_per_page(self):
+        report = SCENARIOS['timing'](books=5, copies_per_book=1, blocks=2, requests=1, loops=100)
+        self.assertEqual(len(report['pages']), 6)
+        self.assertIn('overhead_percent', report)
+        self.assertEqual(len(report['overhead_ci95_percent']), 2)
+        self.assertEqual(report['pages']['/catalog/']['renders'], 1)
+        self.assertGreater(report['overhead_bound_percent'], 0)
+        self.assertEqual(report['within_budget'], report['overhead_bound_percent'] < 2)
+
+
+class CompareTest(SimpleTestCase):
+
+    def test_regressions_beyond_the_threshold_are_reported(self):
+        baseline = {'endpoints': {
+            'index': {'p95_ms': 10.0, 'queries': 2, 'path': '/catalog/'},
+            'fast': {'p95_ms': 0.5, 'queries': 1},
+        }}
+        report = {'endpoints': {
+            'index': {'p95_ms': 13.0, 'queries': 3, 'path': '/catalog/'},
+            'fast': {'p95_ms': 1.2, 'queries': 1},
+            'new': {'p95_ms': 100.0},
+        }}
+        self.assertEqual(compare(report, baseline, 20), [
+            {'metric': 'endpoints.index.p95_ms', 'baseline': 10.0, 'current': 13.0},
+            {'metric': 'endpoints.index.queries', 'baseline': 2, 'current': 3},
+        ])
+        self.assertEqual(compare(report, baseline, 40), [
+            {'metric': 'endpoints.index.queries', 'baseline': 2, 'current': 3},
+        ])
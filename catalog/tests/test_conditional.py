@@ -0,0 +1,135 @@
+import json
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.urls import reverse
+
+from catalog import bulk
+from catalog.models import Author, Book, BookInstance, Genre
+
+
+class ConditionalGetTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(first_name='John', last_name='Smith')
+        cls.book = Book.objects.create(title='Title', author=cls.author)
+        cls.genre = Genre.objects.create(name='Fantasy')
+        cls.copy = BookInstance.objects.create(book=cls.book, imprint='Imprint')
+        cls.other_book = Book.objects.create(title='Other', author=cls.author)
+
+    def assertNotModified(self, url, response, queries=None, **params):
+        headers = {'HTTP_IF_NONE_MATCH': response['ETag']}
+        if queries is None:
+            resp = self.client.get(url, params, **headers)
+        else:
+            with self.assertNumQueries(queries):
+                resp = self.client.get(url, params, **headers)
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp.templates, [])
+        self.assertEqual(resp.content, b'')
+
+    def assertModified(self, url, response, **params):
+        resp = self.client.get(url, params, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp['ETag'], response['ETag'])
+
+    def test_book_detail_is_not_rendered_when_unchanged(self):
+        url = reverse('book-detail', kwargs={'pk': self.book.pk})
+        resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.has_header('Last-Modified'))
+        # book stamp and lookup table versions only
+        self.assertNotModified(url, resp, queries=2)
+
+        resp = self.client.get(url, HTTP_IF_MODIFIED_SINCE=resp['Last-Modified'])
+        self.assertEqual(resp.status_code, 304)
+
+    def test_book_detail_changes_with_what_it_shows(self):
+        url = reverse('book-detail', kwargs={'pk': self.book.pk})
+
+        changes = [
+            lambda: BookInstance.objects.get(pk=self.copy.pk).save(),
+            lambda: self.book.genre.add(self.genre),
+            lambda: Genre.objects.get(pk=self.genre.pk).save(),
+            lambda: self.author.save(),
+            lambda: BookInstance.objects.create(book=self.book, imprint='Second'),
+            lambda: BookInstance.objects.filter(imprint='Second').get().delete(),
+            lambda: self.genre.book_set.clear(),
+        ]
+        for num, change in enumerate(changes):
+            with self.subTest(change=num):
+                resp = self.client.get(url)
+                change()
+                self.assertModified(url, resp)
+
+        resp = self.client.get(url)
+        BookInstance.objects.create(book=self.other_book, imprint='Elsewhere')
+        self.assertNotModified(url, resp)
+
+    def test_bulk_writes_change_validators(self):
+        url = reverse('book-detail', kwargs={'pk': self.book.pk})
+        resp = self.client.get(url)
+        bulk.delete_instances([self.copy.pk])
+        self.assertModified(url, resp)
+
+        list_url = '/api/catalog/book-instances/'
+        resp = self.client.get(list_url)
+        bulk.create_instances([{'book': self.book, 'imprint': 'Bulk'}])
+        self.assertModified(list_url, resp)
+
+    def test_author_detail(self):
+        url = reverse('author-detail', kwargs={'pk': self.author.pk})
+        resp = self.client.get(url)
+        self.assertNotModified(url, resp, queries=2)
+        self.other_book.title = 'Renamed'
+        self.other_book.save()
+        self.assertModified(url, resp)
+
+    def test_list_views_use_table_versions(self):
+        url = reverse('book-list')
+        resp = self.client.get(url)
+        self.assertNotModified(url, resp, queries=1)
+        Author.objects.create(first_name='Jane', last_name='Doe')
+        self.assertModified(url, resp)
+
+        url = reverse('author-list')
+        resp = self.client.get(url)
+        Book.objects.create(title='Unrelated')
+        self.assertNotModified(url, resp)
+
+    def test_validators_depend_on_the_user(self):
+        url = reverse('book-detail', kwargs={'pk': self.book.pk})
+        resp = self.client.get(url)
+        User.objects.create_user(username='reader', password='12345')
+        self.client.login(username='reader', password='12345')
+        self.assertModified(url, resp)
+
+    def test_missing_object_is_still_404(self):
+        resp = self.client.get(reverse('book-detail', kwargs={'pk': 999}))
+        self.assertEqual(resp.status_code, 404)
+        self.assertFalse(resp.has_header('ETag'))
+
+    def test_api_detail_and_list(self):
+        url = '/api/catalog/book-instances/{}/'.format(self.copy.pk)
+        resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotModified(url, resp, queries=1)
+
+        self.client.patch(url, data=json.dumps({'imprint': 'Changed'}), content_type='application/json')
+        self.assertModified(url, resp)
+
+        url = '/api/catalog/genres/{}/'.format(self.genre.pk)
+        resp = self.client.get(url)
+        self.assertNotModified(url, resp, queries=1)
+
+        url = '/api/catalog/books/'
+        resp = self.client.get(url, {'fields': 'title'})
+        self.assertNotModified(url, resp, queries=1, fields='title')
+        self.book.genre.add(self.genre)
+        self.assertModified(url, resp, fields='title')
+
+    def test_api_validators_depend_on_the_format(self):
+        url = '/api/catalog/books/{}/'.format(self.book.pk)
+        resp = self.client.get(url, {'format': 'json'})
+        self.assertModified(url, resp, format='api')
@@ -0,0 +1,203 @@
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils.six import StringIO
+
+from catalog import bulk, counters, holds, loans
+from catalog.models import Author, Book, BookInstance, Genre
+
+
+class CatalogCountersTest(TestCase):
+
+    def setUp(self):
+        self.book = Book.objects.create(title='Title')
+        Author.objects.create(first_name='John', last_name='Smith')
+        Genre.objects.create(name='Fantasy')
+        BookInstance.objects.create(book=self.book, status=BookInstance.AVAILABLE_STATUS)
+        BookInstance.objects.create(book=self.book, status=BookInstance.ON_LOAN_STATUS)
+        counters.rebuild()
+
+    def assertCounters(self, **expected):
+        totals = counters.read()
+        for field, value in expected.items():
+            self.assertEqual(getattr(totals, field), value, field)
+
+    def test_rebuild_matches_real_counts(self):
+        self.assertCounters(
+            num_books=1,
+            num_instances=2,
+            num_instances_available=1,
+            num_authors=1,
+            num_genres=1,
+        )
+        self.assertEqual(counters.check(), {})
+
+    def test_counters_follow_creates_and_deletes(self):
+        Book.objects.create(title='Another title')
+        Genre.objects.create(name='Poetry').delete()
+        Author.objects.all().delete()
+        self.assertCounters(num_books=2, num_genres=1, num_authors=0)
+        self.assertEqual(counters.check(), {})
+
+    def test_counters_follow_status_changes(self):
+        copy = BookInstance.objects.get(status=BookInstance.ON_LOAN_STATUS)
+        copy.status = BookInstance.AVAILABLE_STATUS
+        copy.save()
+        self.assertCounters(num_instances_available=2)
+
+        copy.save()
+        self.assertCounters(num_instances_available=2)
+
+        copy.delete()
+        self.assertCounters(num_instances=1, num_instances_available=1)
+        self.assertEqual(counters.check(), {})
+
+    def test_check_reports_drift_from_bulk_updates(self):
+        BookInstance.objects.update(status=BookInstance.AVAILABLE_STATUS)
+        self.assertEqual(counters.check(), {'num_instances_available': (1, 2)})
+
+    def test_command_rebuilds_counters(self):
+        BookInstance.objects.update(status=BookInstance.AVAILABLE_STATUS)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_counters', check=True, stdout=StringIO(), stderr=StringIO())
+        call_command('rebuild_counters', stdout=StringIO())
+        self.assertCounters(num_instances_available=2)
+        call_command('rebuild_counters', check=True, stdout=StringIO())
+
+    def test_index_reads_counters_row(self):
+        with CaptureQueriesContext(connection) as context:
+            resp = self.client.get(reverse('index'))
+        catalog_queries = [
+            query['sql'] for query in context.captured_queries
+            if 'catalog_' in query['sql']
+        ]
+        self.assertEqual(len(catalog_queries), 1)
+        self.assertIn('catalog_catalogcounters', catalog_queries[0])
+        self.assertEqual(resp.context['num_books'], 1)
+        self.assertEqual(resp.context['num_instances_available'], 1)
+
+
+class BookCopyCountsTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = Book.objects.create(title='Title')
+        cls.other = Book.objects.create(title='Other title')
+        cls.patrons = [
+            User.objects.create_user(username='patron{}'.format(num), password='12345')
+            for num in range(2)
+        ]
+
+    def assertCopyCounts(self, book, total, available, on_loan):
+        book.refresh_from_db()
+        self.assertEqual((book.copies_total, book.copies_available, book.copies_on_loan), (total, available, on_loan))
+        self.assertFalse(counters.drifted_books().exists())
+
+    def test_counts_follow_saves_and_deletes(self):
+        copy = BookInstance.objects.create(book=self.book, status=BookInstance.AVAILABLE_STATUS)
+        BookInstance.objects.create(book=self.book, status=BookInstance.MAINTENANCE_STATUS)
+        self.assertCopyCounts(self.book, 2, 1, 0)
+
+        copy.status = BookInstance.ON_LOAN_STATUS
+        copy.save()
+        self.assertCopyCounts(self.book, 2, 0, 1)
+
+        copy.book = self.other
+        copy.save()
+        self.assertCopyCounts(self.book, 1, 0, 0)
+        self.assertCopyCounts(self.other, 1, 0, 1)
+
+        copy.delete()
+        self.assertCopyCounts(self.other, 0, 0, 0)
+
+    def test_saving_a_stale_book_keeps_the_counts(self):
+        copy = BookInstance.objects.create(book=self.book, status=BookInstance.AVAILABLE_STATUS)
+        stale = Book.objects.get(pk=self.book.pk)
+        loans.checkout(copy.pk, self.patrons[0])
+        stale.title = 'New title'
+        stale.save()
+        self.assertCopyCounts(self.book, 1, 0, 1)
+        self.assertEqual(self.book.title, 'New title')
+
+    def test_counts_follow_loans_and_holds(self):
+        copy = BookInstance.objects.create(book=self.book, status=BookInstance.AVAILABLE_STATUS)
+        loans.checkout(copy.pk, self.patrons[0])
+        self.assertCopyCounts(self.book, 1, 0, 1)
+
+        hold = holds.place(self.book, self.patrons[1])
+        loans.return_copy(copy.pk)
+        # reserved for the hold: neither available nor on loan
+        self.assertCopyCounts(self.book, 1, 0, 0)
+
+        hold.refresh_from_db()
+        holds.cancel(hold)
+        self.assertCopyCounts(self.book, 1, 1, 0)
+
+    def test_counts_follow_bulk_operations(self):
+        created = bulk.create_instances([
+            {'book': self.book, 'imprint': 'Imprint', 'status': BookInstance.AVAILABLE_STATUS}
+            for _ in range(3)
+        ])
+        self.assertCopyCounts(self.book, 3, 3, 0)
+
+        bulk.update_instances(created[:2], [
+            {'status': BookInstance.ON_LOAN_STATUS, 'borrower': self.patrons[0]},
+            {'book': self.other},
+        ])
+        self.assertCopyCounts(self.book, 2, 1, 1)
+        self.assertCopyCounts(self.other, 1, 1, 0)
+
+        bulk.delete_instances([copy.pk for copy in created])
+        self.assertCopyCounts(self.book, 0, 0, 0)
+        self.assertCopyCounts(self.other, 0, 0, 0)
+
+    def test_command_reconciles_drift(self):
+        BookInstance.objects.bulk_create([
+            BookInstance(book=self.book, status=BookInstance.AVAILABLE_STATUS) for _ in range(2)
+        ])
+        err = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('reconcile_copy_counts', check=True, stdout=StringIO(), stderr=err)
+        self.assertIn('Book {} copies_total: stored 0, actual 2'.format(self.book.pk), err.getvalue())
+
+        out = StringIO()
+        call_command('reconcile_copy_counts', stdout=out)
+        self.assertIn('Reconciled 1 books.', out.getvalue())
+        self.assertCopyCounts(self.book, 2, 2, 0)
+        call_command('reconcile_copy_counts', check=True, stdout=StringIO())
+
+    def test_lists_filter_and_sort_on_availability(self):
+        BookInstance.objects.create(book=self.other, status=BookInstance.AVAILABLE_STATUS)
+        BookInstance.objects.create(book=self.other, status=BookInstance.AVAILABLE_STATUS)
+        self.assertEqual(list(Book.objects.available()), [self.other])
+
+        resp = self.client.get(reverse('book-list'), {'available': 1})
+        self.assertEqual(list(resp.context['book_list']), [self.other])
+        self.assertContains(resp, '2 of 2 available')
+        resp = self.client.get(reverse('book-list'), {'sort': 'available'})
+        self.assertEqual(list(resp.context['book_list']), [self.other, self.book])
+
+        resp = self.client.get('/api/catalog/books/', {'available': 'true'})
+        self.assertEqual([book['id'] for book in resp.data['results']], [self.other.pk])
+        self.assertEqual(resp.data['results'][0]['copies_available'], 2)
+        resp = self.client.get('/api/catalog/books/', {'sort': 'available', 'cursor': ''})
+        self.assertEqual([book['id'] for book in resp.data['results']], [self.other.pk, self.book.pk])
+
+    def test_api_sorted_by_availability_pages_through_ties(self):
+        Book.objects.bulk_create([
+            Book(title='Title {}'.format(num % 7), copies_total=3, copies_available=num % 3)
+            for num in range(1300)
+        ])
+        expected = list(Book.objects.order_by(*Book.AVAILABILITY_ORDERING).values_list('pk', flat=True))
+        seen = []
+        url = '/api/catalog/books/?sort=available&fields=id&cursor='
+        while url:
+            resp = self.client.get(url)
+            self.assertEqual(resp.status_code, 200)
+            seen.extend(book['id'] for book in resp.data['results'])
+            url = resp.data['next']
+        self.assertEqual(seen, expected)
@@ -0,0 +1,71 @@
+import copy
+import threading
+import unittest
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, connections, transaction
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from catalog import importer
+from catalog.models import Book, Genre
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'SQLite tuning only')
+class SqliteTuningTest(TestCase):
+
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA {}'.format(name))
+            return cursor.fetchone()[0]
+
+    def test_pragmas_are_applied_to_new_connections(self):
+        pragmas = settings.DATABASES['default']['OPTIONS']['pragmas']
+        self.assertEqual(self.pragma('busy_timeout'), pragmas['busy_timeout'])
+        self.assertEqual(self.pragma('cache_size'), pragmas['cache_size'])
+        # 1 is NORMAL
+        self.assertEqual(self.pragma('synchronous'), 1)
+
+    def test_invalid_pragmas_are_rejected(self):
+        settings_dict = copy.deepcopy(connection.settings_dict)
+        settings_dict['OPTIONS'] = {'pragmas': {'journal_mode': 'wal; DROP TABLE x'}}
+        wrapper = connections['default'].__class__(settings_dict)
+        with self.assertRaises(ImproperlyConfigured):
+            wrapper.get_connection_params()
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'SQLite tuning only')
+class SqliteTransactionModeTest(TransactionTestCase):
+
+    def test_atomic_blocks_begin_in_the_configured_mode(self):
+        mode = settings.DATABASES['default']['OPTIONS']['transaction_mode']
+        with CaptureQueriesContext(connection) as context:
+            with transaction.atomic():
+                Genre.objects.create(name='Fantasy')
+        self.assertEqual(context.captured_queries[0]['sql'], 'BEGIN {}'.format(mode.upper()))
+
+    def test_imports_take_the_write_lock_before_picking_book_ids(self):
+        mode = settings.DATABASES['default']['OPTIONS']['transaction_mode']
+        records = [importer.clean_record({'title': 'Title'})]
+        with CaptureQueriesContext(connection) as context:
+            importer.CatalogImporter().write_chunk(records, importer.ImportStats())
+        self.assertEqual(context.captured_queries[0]['sql'], 'BEGIN IMMEDIATE')
+        self.assertEqual(Book.objects.get().title, 'Title')
+        self.assertEqual(connection.transaction_mode, mode)
+
+    def test_immediate_transactions_on_new_connections(self):
+        captured = []
+
+        def begin():
+            # a thread starts without a connection
+            with CaptureQueriesContext(connection) as context:
+                with connection.immediate_transaction():
+                    pass
+            captured.extend(query['sql'] for query in context.captured_queries)
+            connection.close()
+
+        thread = threading.Thread(target=begin)
+        thread.start()
+        thread.join()
+        self.assertEqual(captured[0], 'BEGIN IMMEDIATE')
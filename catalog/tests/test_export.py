@@ -0,0 +1,81 @@
+import csv
+import json
+
+from django.contrib.auth.models import Permission, User
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+from django.utils.six import StringIO
+
+from catalog import export
+from catalog.models import Author, Book, BookInstance, Genre
+
+
+class ExportTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(first_name='John', last_name='Smith')
+        fantasy = Genre.objects.create(name='Fantasy')
+        poetry = Genre.objects.create(name='Poetry')
+        for book_num in range(5):
+            book = Book.objects.create(title='Title {}'.format(book_num), author=author)
+            book.genre.add(fantasy)
+            if book_num % 2:
+                book.genre.add(poetry)
+            BookInstance.objects.create(book=book, imprint='Imprint')
+
+        cls.user = User.objects.create_user(username='librarian', password='12345')
+        cls.user.user_permissions.add(Permission.objects.get(name='Set book as returned'))
+
+    def test_rows_are_read_in_chunks(self):
+        # two queries (rows, genres) per chunk of two books plus the final empty chunk
+        with self.assertNumQueries(7):
+            rows = list(export.iter_rows('books', chunk_size=2))
+        self.assertEqual([row['title'] for row in rows], ['Title {}'.format(num) for num in range(5)])
+        fantasy, poetry = Genre.objects.order_by('pk').values_list('pk', flat=True)
+        self.assertEqual(rows[0]['genre'], [fantasy])
+        self.assertEqual(rows[1]['genre'], [fantasy, poetry])
+
+    def test_stats_count_rows(self):
+        stats = export.ExportStats('book-instances')
+        lines = list(export.export('book-instances', 'ndjson', chunk_size=2, stats=stats))
+        self.assertEqual(len(lines), 5)
+        self.assertEqual(stats.rows, 5)
+        self.assertIsNotNone(stats.finished)
+
+    def test_ndjson_lines_are_json_objects(self):
+        lines = list(export.export('authors', 'ndjson'))
+        self.assertEqual(json.loads(lines[0])['last_name'], 'Smith')
+
+    def test_csv_has_header_and_joined_genres(self):
+        lines = list(export.export('books', 'csv'))
+        rows = list(csv.reader(lines))
+        self.assertEqual(rows[0], list(export.columns('books')))
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(len(rows[2][-1].split(';')), 2)
+
+    def test_view_requires_permission(self):
+        url = reverse('catalog-export', kwargs={'dataset': 'books', 'fmt': 'csv'})
+        resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 302)
+
+    def test_view_streams_export(self):
+        self.client.login(username='librarian', password='12345')
+        url = reverse('catalog-export', kwargs={'dataset': 'books', 'fmt': 'ndjson'})
+        resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.streaming)
+        lines = b''.join(resp.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 5)
+
+    def test_view_rejects_unknown_dataset(self):
+        self.client.login(username='librarian', password='12345')
+        url = reverse('catalog-export', kwargs={'dataset': 'users', 'fmt': 'csv'})
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_command_writes_export_and_reports_throughput(self):
+        out, err = StringIO(), StringIO()
+        call_command('export_catalog', 'book-instances', fmt='csv', stdout=out, stderr=err)
+        self.assertEqual(len(out.getvalue().splitlines()), 6)
+        self.assertIn('rows/s', err.getvalue())
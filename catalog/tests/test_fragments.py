@@ -0,0 +1,87 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from catalog import bulk, fragments
+from catalog.models import Book, BookInstance
+
+
+class CopiesFragmentCacheTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = Book.objects.create(title='Title')
+        cls.other_book = Book.objects.create(title='Other')
+        cls.copy = BookInstance.objects.create(
+            book=cls.book, imprint='First imprint', status=BookInstance.AVAILABLE_STATUS,
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def render(self, book=None):
+        return fragments.render_copies(book or self.book)
+
+    def test_hits_after_first_render(self):
+        html = self.render()
+        self.assertIn('First imprint', html)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.render(), html)
+        self.assertEqual(fragments.stats(), {'hits': 1, 'misses': 1, 'hit_rate': 0.5})
+
+    def test_copy_changes_invalidate_their_book_only(self):
+        self.render()
+        self.render(self.other_book)
+
+        copy = BookInstance.objects.get(pk=self.copy.pk)
+        copy.status = BookInstance.ON_LOAN_STATUS
+        copy.save()
+        self.assertIn('On loan', self.render())
+        self.assertEqual(fragments.stats()['misses'], 3)
+        self.render(self.other_book)
+        self.assertEqual(fragments.stats()['hits'], 1)
+
+        BookInstance.objects.create(book=self.book, imprint='Second imprint')
+        self.assertIn('Second imprint', self.render())
+
+        BookInstance.objects.get(imprint='Second imprint').delete()
+        self.assertNotIn('Second imprint', self.render())
+
+    def test_moving_a_copy_invalidates_both_books(self):
+        self.render()
+        self.render(self.other_book)
+        copy = BookInstance.objects.get(pk=self.copy.pk)
+        copy.book = self.other_book
+        copy.save()
+        self.assertNotIn('First imprint', self.render())
+        self.assertIn('First imprint', self.render(self.other_book))
+
+    def test_book_changes_invalidate(self):
+        self.render()
+        self.book.save()
+        self.render()
+        self.assertEqual(fragments.stats()['misses'], 2)
+
+    def test_bulk_writes_invalidate(self):
+        self.render()
+        bulk.create_instances([{'book': self.book, 'imprint': 'Bulk imprint'}])
+        self.assertIn('Bulk imprint', self.render())
+
+        copy = BookInstance.objects.get(imprint='Bulk imprint')
+        bulk.update_instances([copy], [{'imprint': 'Updated imprint'}])
+        self.assertIn('Updated imprint', self.render())
+
+        bulk.delete_instances([copy.pk])
+        self.assertNotIn('Updated imprint', self.render())
+
+    def test_stats_view_is_for_staff(self):
+        url = reverse('cache-stats')
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        User.objects.create_user(username='staff', password='12345', is_staff=True)
+        self.client.login(username='staff', password='12345')
+        self.client.get(reverse('book-detail', kwargs={'pk': self.book.pk}))
+        self.client.get(reverse('book-detail', kwargs={'pk': self.book.pk}))
+        resp = self.client.get(url)
+        self.assertEqual(resp.json(), {'copies': {'hits': 1, 'misses': 1, 'hit_rate': 0.5}})
@@ -0,0 +1,66 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from catalog import counters, generate, search
+from catalog.models import Author, Book, BookInstance, Genre, Language
+
+
+TODAY = datetime.date(2020, 6, 1)
+
+
+def snapshot():
+    # natural keys, since lookup table ids are not reused after a delete
+    return (
+        list(Book.objects.order_by('pk').values_list(
+            'pk', 'title', 'summary', 'isbn', 'author__first_name', 'author__last_name', 'language__name',
+        )),
+        list(Book.genre.through.objects.order_by('book_id', 'genre__name').values_list('book_id', 'genre__name')),
+        list(BookInstance.objects.order_by('pk').values_list(
+            'pk', 'book_id', 'imprint', 'status', 'due_back', 'borrower__username',
+        )),
+    )
+
+
+class GenerateLibraryTest(TestCase):
+
+    def test_counts_and_consistency(self):
+        stats = generate.generate_library(50, 4, seed=1, borrowers=7, today=TODAY, chunk_size=20)
+        self.assertEqual((stats.books, stats.copies, stats.borrowers), (50, 200, 7))
+        self.assertEqual(Book.objects.count(), 50)
+        self.assertEqual(BookInstance.objects.count(), 200)
+        self.assertEqual(Author.objects.count(), 6)
+        self.assertEqual(User.objects.count(), 7)
+        self.assertEqual(counters.check(), {})
+        self.assertFalse(counters.drifted_books().exists())
+
+        on_loan = BookInstance.objects.filter(status=BookInstance.ON_LOAN_STATUS)
+        self.assertFalse(on_loan.filter(borrower__isnull=True).exists())
+        self.assertFalse(on_loan.filter(due_back__isnull=True).exists())
+        self.assertFalse(
+            BookInstance.objects.exclude(status=BookInstance.ON_LOAN_STATUS)
+                                .filter(borrower__isnull=False).exists()
+        )
+        self.assertTrue(on_loan.filter(due_back__lt=TODAY).exists())
+        self.assertEqual(len(Book.objects.get(pk=1).isbn), 13)
+
+        # rows written with raw INSERTs are still indexed and sequences still advance
+        book = Book.objects.get(pk=1)
+        self.assertIn(book, list(search.search(book.title)[:50]))
+        self.assertEqual(Book.objects.create(title='New').pk, 51)
+
+    def test_same_seed_same_library(self):
+        generate.generate_library(20, 3, seed=5, today=TODAY, chunk_size=7)
+        first = snapshot()
+        for model in (BookInstance, Book, Author, Genre, Language, User):
+            model.objects.all().delete()
+
+        # chunking does not change the output
+        generate.generate_library(20, 3, seed=5, today=TODAY, chunk_size=10)
+        self.assertEqual(snapshot(), first)
+
+    def test_refuses_a_non_empty_catalog(self):
+        Book.objects.create(title='Title')
+        with self.assertRaises(ValueError):
+            generate.generate_library(1, 1)
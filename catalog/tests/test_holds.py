@@ -0,0 +1,212 @@
+import json
+
+from django.contrib.auth.models import User
+from django.db import DatabaseError
+from django.test import TestCase
+
+from catalog import bulk, counters, holds, loans
+from catalog.models import Book, BookInstance, Hold
+
+
+class HoldQueueTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = Book.objects.create(title='Title')
+        cls.patrons = [
+            User.objects.create_user(username='patron{}'.format(num), password='12345')
+            for num in range(4)
+        ]
+        cls.copy = BookInstance.objects.create(
+            book=cls.book, imprint='Imprint',
+            status=BookInstance.ON_LOAN_STATUS, borrower=cls.patrons[0],
+        )
+
+    def test_positions_follow_joins_and_cancellations(self):
+        queue = [holds.place(self.book, patron) for patron in self.patrons[1:]]
+        self.assertEqual([holds.position(hold) for hold in queue], [1, 2, 3])
+
+        holds.cancel(queue[1])
+        positions = {
+            hold.patron_id: holds.position(hold)
+            for hold in holds.with_positions(Hold.objects.all())
+        }
+        self.assertEqual(positions, {self.patrons[1].pk: 1, self.patrons[3].pk: 2})
+
+        hold = holds.place(self.book, self.patrons[2])
+        self.assertEqual(holds.position(hold), 3)
+        with self.assertRaises(holds.HoldError):
+            holds.place(self.book, self.patrons[2])
+
+    def test_return_reserves_the_copy_for_the_head_of_the_queue(self):
+        counters.rebuild()
+        first = holds.place(self.book, self.patrons[1])
+        second = holds.place(self.book, self.patrons[2])
+
+        copy = loans.return_copy(self.copy.pk)
+        self.assertEqual(copy.status, BookInstance.RESERVED_STATUS)
+        first.refresh_from_db()
+        self.assertEqual(first.copy, copy)
+        self.assertEqual(holds.position(first), 0)
+        self.assertEqual(holds.position(Hold.objects.get(pk=second.pk)), 1)
+        self.assertEqual(counters.check(), {})
+
+        # only the holder can check the reserved copy out
+        with self.assertRaises(loans.LoanConflict):
+            loans.checkout(copy.pk, self.patrons[2])
+        copy = loans.checkout(copy.pk, self.patrons[1])
+        self.assertEqual(copy.borrower, self.patrons[1])
+        self.assertFalse(Hold.objects.filter(pk=first.pk).exists())
+        self.assertEqual(counters.check(), {})
+
+    def test_cancelling_an_allocated_hold_passes_the_copy_on(self):
+        first = holds.place(self.book, self.patrons[1])
+        second = holds.place(self.book, self.patrons[2])
+        loans.return_copy(self.copy.pk)
+        first.refresh_from_db()
+
+        holds.cancel(first)
+        second.refresh_from_db()
+        self.assertEqual(second.copy_id, self.copy.pk)
+        self.assertEqual(BookInstance.objects.get(pk=self.copy.pk).status, BookInstance.RESERVED_STATUS)
+
+        holds.cancel(second)
+        self.assertEqual(BookInstance.objects.get(pk=self.copy.pk).status, BookInstance.AVAILABLE_STATUS)
+
+    def test_copies_made_available_elsewhere_are_allocated(self):
+        hold = holds.place(self.book, self.patrons[1])
+        self.copy.status = BookInstance.AVAILABLE_STATUS
+        self.copy.save()
+        self.assertEqual(self.copy.status, BookInstance.RESERVED_STATUS)
+
+        other = holds.place(self.book, self.patrons[2])
+        created = bulk.create_instances([
+            {'book': self.book, 'imprint': 'New', 'status': BookInstance.AVAILABLE_STATUS},
+        ])
+        other.refresh_from_db()
+        self.assertEqual(other.copy_id, created[0].pk)
+        hold.refresh_from_db()
+        self.assertEqual(hold.copy_id, self.copy.pk)
+
+    def test_making_a_reserved_copy_available_withdraws_the_reservation(self):
+        first = holds.place(self.book, self.patrons[1])
+        second = holds.place(self.book, self.patrons[2])
+        third = holds.place(self.book, self.patrons[3])
+        loans.return_copy(self.copy.pk)
+
+        copy = BookInstance.objects.get(pk=self.copy.pk)
+        copy.status = BookInstance.AVAILABLE_STATUS
+        copy.save()
+        self.assertFalse(Hold.objects.filter(pk=first.pk).exists())
+        second.refresh_from_db()
+        self.assertEqual(second.copy_id, copy.pk)
+
+        bulk.update_instances(
+            [BookInstance.objects.get(pk=copy.pk)],
+            [{'status': BookInstance.AVAILABLE_STATUS}],
+        )
+        self.assertFalse(Hold.objects.filter(pk=second.pk).exists())
+        third.refresh_from_db()
+        self.assertEqual(third.copy_id, copy.pk)
+        self.assertEqual(BookInstance.objects.get(pk=copy.pk).status, BookInstance.RESERVED_STATUS)
+
+    def test_deleting_a_reserved_copy_requeues_its_hold_first(self):
+        first = holds.place(self.book, self.patrons[1])
+        second = holds.place(self.book, self.patrons[2])
+        loans.return_copy(self.copy.pk)
+
+        BookInstance.objects.get(pk=self.copy.pk).delete()
+        queue = holds.with_positions(Hold.objects.order_by('sequence'))
+        self.assertEqual([(hold.pk, holds.position(hold)) for hold in queue], [(first.pk, 1), (second.pk, 2)])
+        self.assertIsNone(Hold.objects.get(pk=first.pk).allocated_at)
+        third = holds.place(self.book, self.patrons[3])
+        self.assertEqual(holds.position(third), 3)
+
+        copies = bulk.create_instances([
+            {'book': self.book, 'imprint': 'New', 'status': BookInstance.AVAILABLE_STATUS},
+        ])
+        self.assertEqual(Hold.objects.get(pk=first.pk).copy_id, copies[0].pk)
+        self.assertEqual(bulk.delete_instances([copies[0].pk]), 1)
+        queue = holds.with_positions(Hold.objects.order_by('sequence'))
+        self.assertEqual(
+            [(hold.pk, holds.position(hold)) for hold in queue],
+            [(first.pk, 1), (second.pk, 2), (third.pk, 3)],
+        )
+
+    def test_requeued_holds_get_an_available_copy(self):
+        counters.rebuild()
+        hold = holds.place(self.book, self.patrons[1])
+        loans.return_copy(self.copy.pk)
+        spare = BookInstance.objects.create(
+            book=self.book, imprint='Spare', status=BookInstance.AVAILABLE_STATUS,
+        )
+
+        BookInstance.objects.get(pk=self.copy.pk).delete()
+        hold.refresh_from_db()
+        self.assertEqual(hold.copy_id, spare.pk)
+        self.assertEqual(BookInstance.objects.get(pk=spare.pk).status, BookInstance.RESERVED_STATUS)
+        self.assertEqual(counters.check(), {})
+        self.assertFalse(counters.drifted_books().exists())
+
+    def test_placing_a_hold_on_an_available_copy_reserves_it(self):
+        loans.return_copy(self.copy.pk)
+        hold = holds.place(self.book, self.patrons[1])
+        self.assertEqual(hold.copy_id, self.copy.pk)
+
+    def test_position_lookups_do_not_depend_on_queue_length(self):
+        User.objects.bulk_create([User(username='user{}'.format(num)) for num in range(3000)])
+        Hold.objects.bulk_create([
+            Hold(book=self.book, patron=user, sequence=num)
+            for num, user in enumerate(User.objects.filter(username__startswith='user'), start=1)
+        ])
+        hold = Hold.objects.get(sequence=2500)
+        with self.assertNumQueries(1):
+            self.assertEqual(holds.position(hold), 2500)
+        with self.assertNumQueries(1):
+            hold = holds.with_positions(Hold.objects.filter(sequence=2999)).get()
+            self.assertEqual(holds.position(hold), 2999)
+
+
+class HoldApiTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = Book.objects.create(title='Title')
+        cls.alice = User.objects.create_user(username='alice', password='12345')
+        cls.bob = User.objects.create_user(username='bob', password='12345')
+
+    def test_join_list_and_leave(self):
+        resp = self.client.post('/api/catalog/holds/', {'book': self.book.pk, 'patron': self.alice.pk})
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(resp.data['position'], 1)
+        first = resp.data['id']
+        resp = self.client.post('/api/catalog/holds/', {'book': self.book.pk, 'patron': self.bob.pk})
+        self.assertEqual(resp.data['position'], 2)
+        resp = self.client.post('/api/catalog/holds/', {'book': self.book.pk, 'patron': self.bob.pk})
+        self.assertEqual(resp.status_code, 400)
+
+        resp = self.client.get('/api/catalog/holds/', {'book': self.book.pk})
+        self.assertEqual([hold['position'] for hold in resp.data['results']], [1, 2])
+
+        self.assertEqual(self.client.delete('/api/catalog/holds/{}/'.format(first)).status_code, 204)
+        resp = self.client.get('/api/catalog/holds/', {'patron': self.bob.pk})
+        self.assertEqual(resp.data['results'][0]['position'], 1)
+        self.assertEqual(self.client.get('/api/catalog/holds/', {'book': 'x'}).status_code, 400)
+
+    def test_api_status_changes_commit_with_their_allocation(self):
+        copy = BookInstance.objects.create(book=self.book, imprint='Imprint')
+        holds.place(self.book, self.alice)
+        allocate = holds.allocate
+
+        def locked(copies):
+            raise DatabaseError('database is locked')
+
+        holds.allocate = locked
+        self.addCleanup(setattr, holds, 'allocate', allocate)
+        with self.assertRaises(DatabaseError):
+            self.client.patch(
+                '/api/catalog/book-instances/{}/'.format(copy.pk),
+                json.dumps({'status': BookInstance.AVAILABLE_STATUS}),
+                content_type='application/json',
+            )
+        self.assertEqual(BookInstance.objects.get(pk=copy.pk).status, BookInstance.MAINTENANCE_STATUS)
@@ -0,0 +1,138 @@
+import json
+import os
+import shutil
+import tempfile
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.utils.six import StringIO
+
+from catalog import counters
+from catalog.models import Author, Book, BookInstance, Genre, Language
+
+
+class ImportCatalogCommandTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        Author.objects.create(first_name='John', last_name='Smith')
+        counters.rebuild()
+
+    def _write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as source:
+            source.write(content)
+        return path
+
+    def _jsonl(self, records):
+        return self._write('books.jsonl', ''.join(json.dumps(record) + '\n' for record in records))
+
+    def _records(self, number):
+        return [
+            {
+                'title': 'Title {}'.format(num),
+                'author_first_name': 'John' if num % 2 else 'Jane',
+                'author_last_name': 'Smith',
+                'language': 'English',
+                'genres': ['Fantasy', 'Poetry'] if num % 3 else ['Fantasy'],
+                'copies': 2,
+                'imprint': 'Imprint',
+            }
+            for num in range(number)
+        ]
+
+    def _import(self, path, **options):
+        out, err = StringIO(), StringIO()
+        call_command('import_catalog', path, stdout=out, stderr=err, **options)
+        return out.getvalue(), err.getvalue()
+
+    def test_imports_books_with_lookups_and_copies(self):
+        out, _ = self._import(self._jsonl(self._records(25)), chunk_size=10, batch_size=4)
+        self.assertEqual(Book.objects.count(), 25)
+        self.assertEqual(BookInstance.objects.count(), 50)
+        self.assertEqual(Author.objects.count(), 2)
+        self.assertEqual(Language.objects.count(), 1)
+        self.assertEqual(Genre.objects.count(), 2)
+        book = Book.objects.get(title='Title 1')
+        self.assertEqual(str(book.author), 'Smith, John')
+        self.assertEqual(sorted(book.genre.values_list('name', flat=True)), ['Fantasy', 'Poetry'])
+        self.assertEqual(book.bookinstance_set.count(), 2)
+        self.assertEqual(book.copies_total, 2)
+        self.assertIn('records/s', out)
+        self.assertEqual(counters.check(), {})
+        self.assertFalse(counters.drifted_books().exists())
+
+    def test_imports_csv(self):
+        path = self._write(
+            'books.csv',
+            'title,author_first_name,author_last_name,genres,copies\n'
+            'First,Ann,Lee,Fantasy;Poetry,1\n'
+            'Second,Ann,Lee,,0\n',
+        )
+        self._import(path)
+        self.assertEqual(Book.objects.count(), 2)
+        self.assertEqual(Book.objects.get(title='First').genre.count(), 2)
+        self.assertEqual(Author.objects.filter(last_name='Lee').count(), 1)
+
+    def test_dry_run_validates_without_writing(self):
+        records = self._records(3)
+        records[1]['title'] = ''
+        records[2]['copies'] = 'many'
+        with self.assertRaises(CommandError):
+            self._import(self._jsonl(records), dry_run=True)
+        self.assertFalse(Book.objects.exists())
+
+        out, _ = self._import(self._jsonl(self._records(3)), dry_run=True)
+        self.assertIn('3 records are valid', out)
+        self.assertFalse(Book.objects.exists())
+
+    def test_invalid_records_stop_import_unless_skipped(self):
+        records = self._records(4)
+        records[3]['status'] = 'x'
+        path = self._jsonl(records)
+        with self.assertRaises(CommandError):
+            self._import(path, chunk_size=2)
+        self.assertEqual(Book.objects.count(), 2)
+
+        Book.objects.all().delete()
+        self._import(path, skip_invalid=True)
+        self.assertEqual(Book.objects.count(), 3)
+
+    def test_resumes_from_checkpoint(self):
+        path = self._jsonl(self._records(10))
+        checkpoint = os.path.join(self.directory, 'checkpoint.json')
+        with open(checkpoint, 'w') as state:
+            json.dump({'source': os.path.abspath(path), 'records': 6}, state)
+
+        self._import(path, checkpoint=checkpoint, chunk_size=3)
+        self.assertEqual(
+            sorted(Book.objects.values_list('title', flat=True)),
+            ['Title 6', 'Title 7', 'Title 8', 'Title 9'],
+        )
+        with open(checkpoint) as state:
+            self.assertEqual(json.load(state)['records'], 10)
+
+        self._import(path, checkpoint=checkpoint)
+        self.assertEqual(Book.objects.count(), 4)
+
+    def test_checkpoints_of_uncommitted_chunks_are_ignored(self):
+        path = self._jsonl(self._records(10))
+        checkpoint = os.path.join(self.directory, 'checkpoint.json')
+        committed = Book.objects.create(title='Committed')
+        for book, resumed_at in ((committed.pk, 6), (committed.pk + 1, 3)):
+            Book.objects.exclude(pk=committed.pk).delete()
+            with open(checkpoint, 'w') as state:
+                # saved by the chunk of records 4-6 before its transaction ended
+                json.dump({'source': os.path.abspath(path), 'records': 6, 'book': book, 'committed': 3}, state)
+            self._import(path, checkpoint=checkpoint)
+            self.assertEqual(Book.objects.exclude(pk=committed.pk).count(), 10 - resumed_at)
+            with open(checkpoint) as state:
+                self.assertEqual(json.load(state), {'source': os.path.abspath(path), 'records': 10})
+
+    def test_ids_of_deleted_books_are_not_reused(self):
+        deleted = Book.objects.create(title='Deleted').pk
+        Book.objects.filter(pk=deleted).delete()
+        self._import(self._jsonl(self._records(2)))
+        self.assertGreater(Book.objects.order_by('pk').first().pk, deleted)
@@ -0,0 +1,91 @@
+import datetime
+import re
+import unittest
+
+from django.contrib.auth.models import Permission, User
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from catalog.models import Author, Book, BookInstance
+
+
+TABLE_SCAN = re.compile(r'^SCAN (TABLE )?catalog_\w+( AS \w+)?$')
+INDEX_SCAN = re.compile(r'^SCAN (TABLE )?catalog_\w+ .*USING (COVERING )?INDEX')
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN output is SQLite specific')
+class QueryPlanTest(TestCase):
+    """
+    Fail when a hot catalog query falls back to a full table scan.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='librarian', password='12345')
+        cls.user.user_permissions.add(Permission.objects.get(name='Set book as returned'))
+
+        today = datetime.date.today()
+        for num in range(30):
+            author = Author.objects.create(first_name='First {}'.format(num), last_name='Last {}'.format(num % 7))
+            book = Book.objects.create(title='Title {}'.format(num % 9), isbn='{:013d}'.format(num), author=author)
+            for copy_num in range(3):
+                BookInstance.objects.create(
+                    book=book,
+                    imprint='Imprint',
+                    due_back=today + datetime.timedelta(days=num % 11),
+                    status=BookInstance.ON_LOAN_STATUS if copy_num else BookInstance.AVAILABLE_STATUS,
+                    borrower=cls.user if copy_num else None,
+                )
+
+    def setUp(self):
+        self.client.login(username='librarian', password='12345')
+
+    def _plan(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def _full_scans(self, sql):
+        plan = self._plan(sql)
+        # walking an index is only cheap when it yields rows in the wanted order
+        sorts_all_rows = 'USE TEMP B-TREE FOR ORDER BY' in plan
+        return [
+            detail for detail in plan
+            if TABLE_SCAN.search(detail) or (sorts_all_rows and INDEX_SCAN.search(detail))
+        ]
+
+    def assertNoFullScans(self, url_name):
+        """
+        Request the first two pages of a list view and check every catalog query.
+        """
+        with CaptureQueriesContext(connection) as context:
+            resp = self.client.get(reverse(url_name))
+            self.assertEqual(resp.status_code, 200)
+            self.assertTrue(resp.context['page_obj'].has_next())
+            self.client.get(reverse(url_name), {'cursor': resp.context['page_obj'].next_cursor})
+
+        queries = [query['sql'] for query in context.captured_queries if 'catalog_' in query['sql']]
+        self.assertTrue(queries)
+        for sql in queries:
+            self.assertEqual(self._full_scans(sql), [], sql)
+
+    def test_loaned_books_view_uses_indexes(self):
+        self.assertNoFullScans('borrowed')
+
+    def test_loaned_books_by_user_view_uses_indexes(self):
+        self.assertNoFullScans('my-borrowed')
+
+    def test_author_list_view_uses_indexes(self):
+        self.assertNoFullScans('author-list')
+
+    def test_book_list_view_uses_indexes(self):
+        self.assertNoFullScans('book-list')
+
+    def test_isbn_lookup_uses_index(self):
+        with CaptureQueriesContext(connection) as context:
+            list(Book.objects.filter(isbn='0000000000007'))
+        sql = context.captured_queries[0]['sql']
+        self.assertTrue(any('USING INDEX' in detail for detail in self._plan(sql)), sql)
+        self.assertEqual(self._full_scans(sql), [], sql)
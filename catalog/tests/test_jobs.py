@@ -0,0 +1,185 @@
+import datetime
+import json
+import os
+import shutil
+import tempfile
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from catalog import jobs
+from catalog.models import Book, Job
+
+
+class FlakyTask(object):
+    """
+    Registered as the task ``flaky`` for a test; raises ``failures`` times.
+    """
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = 0
+
+    def __call__(self, value):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise ValueError('attempt {}'.format(self.calls))
+        return {'value': value}
+
+    def __enter__(self):
+        jobs.TASKS['flaky'] = (self, None)
+        return self
+
+    def __exit__(self, *exc_info):
+        del jobs.TASKS['flaky']
+
+
+@override_settings(JOBS_RETRY_DELAY=0)
+class JobQueueTest(TestCase):
+
+    def test_enqueued_jobs_run_once(self):
+        Book.objects.create(title='Title')
+        job = jobs.enqueue('rebuild_counters')
+        self.assertEqual(jobs.Worker().run(burst=True), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE_STATUS)
+        self.assertEqual(job.attempts, 1)
+        self.assertEqual(json.loads(job.result)['num_books'], 1)
+        self.assertIsNotNone(job.finished_at)
+        self.assertIsNone(jobs.claim('worker'))
+
+    def test_invalid_jobs_are_refused(self):
+        with self.assertRaises(jobs.JobError):
+            jobs.enqueue('missing')
+        with self.assertRaises(jobs.JobError):
+            jobs.enqueue('rebuild_counters', {'extra': 1})
+        self.assertFalse(Job.objects.exists())
+
+    def test_future_jobs_wait(self):
+        jobs.enqueue('rebuild_counters', run_at=timezone.now() + datetime.timedelta(hours=1))
+        self.assertIsNone(jobs.claim('worker'))
+
+    def test_failures_are_retried_until_max_attempts(self):
+        with FlakyTask(failures=1) as task, self.assertLogs('catalog.jobs', 'WARNING'):
+            job = jobs.enqueue('flaky', {'value': 3})
+            jobs.Worker().run(burst=True)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, task.calls), (Job.DONE_STATUS, 2, 2))
+        self.assertEqual(json.loads(job.result), {'value': 3})
+        self.assertIn('ValueError: attempt 1', job.last_error)
+
+        with FlakyTask(failures=5), self.assertLogs('catalog.jobs', 'WARNING') as logs:
+            job = jobs.enqueue('flaky', {'value': 3}, max_attempts=3)
+            jobs.Worker().run(burst=True)
+        self.assertIn('giving up', logs.output[-1])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED_STATUS, 3))
+        self.assertIn('ValueError: attempt 3', job.last_error)
+
+    def test_retries_back_off(self):
+        with self.settings(JOBS_RETRY_DELAY=10, JOBS_RETRY_MAX_DELAY=60):
+            self.assertTrue(5 <= jobs.backoff(1) <= 10)
+            self.assertTrue(20 <= jobs.backoff(3) <= 40)
+            self.assertTrue(30 <= jobs.backoff(10) <= 60)
+            with FlakyTask(failures=1), self.assertLogs('catalog.jobs', 'WARNING'):
+                job = jobs.enqueue('flaky', {'value': 3})
+                jobs.Worker().run(burst=True)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.QUEUED_STATUS)
+        self.assertGreater(job.run_at, timezone.now())
+
+    def test_expired_leases_are_claimed_again(self):
+        job = jobs.enqueue('rebuild_counters', max_attempts=2)
+        stale = jobs.claim('dead')
+        self.assertEqual(stale.pk, job.pk)
+        Job.objects.filter(pk=job.pk).update(locked_until=timezone.now() - datetime.timedelta(seconds=1))
+
+        fresh = jobs.claim('alive')
+        self.assertEqual((fresh.pk, fresh.attempts), (job.pk, 2))
+        # the first worker finishing late must not overwrite the second attempt
+        with self.assertLogs('catalog.jobs', 'WARNING'):
+            self.assertFalse(jobs.run(stale))
+        self.assertTrue(jobs.run(fresh))
+
+    def test_expired_last_attempts_fail(self):
+        job = jobs.enqueue('rebuild_counters', max_attempts=1)
+        jobs.claim('dead')
+        Job.objects.filter(pk=job.pk).update(locked_until=timezone.now() - datetime.timedelta(seconds=1))
+        self.assertIsNone(jobs.claim('alive'))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED_STATUS)
+        self.assertTrue(job.last_error)
+
+    def test_tasks_get_longer_leases(self):
+        jobs.enqueue('scan_overdue')
+        job = jobs.claim('worker')
+        self.assertGreater(job.locked_until, timezone.now() + datetime.timedelta(minutes=30))
+
+    def test_export_task_writes_under_export_root(self):
+        Book.objects.create(title='Title')
+        export_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, export_root)
+        with self.settings(EXPORT_ROOT=export_root):
+            job = jobs.enqueue('export_catalog', {'dataset': 'books', 'fmt': 'csv'})
+            call_command('run_workers', burst=True)
+        job.refresh_from_db()
+        result = json.loads(job.result)
+        self.assertEqual(result['rows'], 1)
+        self.assertEqual(os.path.dirname(result['path']), export_root)
+        self.assertTrue(os.path.exists(result['path']))
+
+
+class JobAPITest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create_superuser('librarian', 'librarian@example.com', '12345')
+        User.objects.create_user(username='borrower', password='12345')
+
+    def test_staff_queue_and_poll_jobs(self):
+        self.client.login(username='librarian', password='12345')
+        response = self.client.post(
+            '/api/catalog/jobs/',
+            json.dumps({'name': 'scan_overdue', 'kwargs': {'date': '2026-01-01'}}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['status'], Job.QUEUED_STATUS)
+        self.assertEqual(response.data['kwargs'], {'date': '2026-01-01'})
+
+        jobs.Worker().run(burst=True)
+        response = self.client.get('/api/catalog/jobs/{}/'.format(response.data['id']))
+        self.assertEqual(response.data['status'], Job.DONE_STATUS)
+        self.assertEqual(response.data['result']['borrowers'], 0)
+        response = self.client.get('/api/catalog/jobs/?status=d')
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_invalid_jobs_are_refused(self):
+        self.client.login(username='librarian', password='12345')
+        response = self.client.post('/api/catalog/jobs/', {'name': 'missing'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('name', response.data)
+        response = self.client.post(
+            '/api/catalog/jobs/',
+            json.dumps({'name': 'rebuild_counters', 'kwargs': {'extra': 1}}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('kwargs', response.data)
+        # names of enqueue() arguments are task arguments like any other
+        for key in ('name', 'run_at', 'max_attempts'):
+            response = self.client.post(
+                '/api/catalog/jobs/',
+                json.dumps({'name': 'rebuild_counters', 'kwargs': {key: 1}}),
+                content_type='application/json',
+            )
+            self.assertEqual(response.status_code, 400, key)
+            self.assertIn('kwargs', response.data)
+        self.assertFalse(Job.objects.exists())
+
+    def test_only_staff_see_jobs(self):
+        self.client.login(username='borrower', password='12345')
+        self.assertEqual(self.client.post('/api/catalog/jobs/', {'name': 'rebuild_counters'}).status_code, 403)
+        self.assertEqual(self.client.get('/api/catalog/jobs/').status_code, 403)
@@ -0,0 +1,213 @@
+import datetime
+import os
+import random
+import shutil
+import tempfile
+import threading
+import unittest
+
+from django.contrib.auth.models import Permission, User
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+
+from catalog import counters, loans
+from catalog.models import Book, BookInstance
+
+
+class LoansTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user(username='alice', password='12345')
+        cls.bob = User.objects.create_user(username='bob', password='12345')
+        cls.book = Book.objects.create(title='Title')
+        cls.copy = BookInstance.objects.create(
+            book=cls.book, imprint='Imprint', status=BookInstance.AVAILABLE_STATUS,
+        )
+
+    def test_checkout_and_return(self):
+        counters.rebuild()
+        copy = loans.checkout(self.copy.pk, self.alice)
+        self.assertEqual(copy.status, BookInstance.ON_LOAN_STATUS)
+        self.assertEqual(copy.borrower, self.alice)
+        self.assertEqual(copy.due_back, datetime.date.today() + loans.LOAN_PERIOD)
+        self.assertEqual(counters.read().num_instances_available, 0)
+
+        copy = loans.return_copy(self.copy.pk)
+        self.assertEqual(copy.status, BookInstance.AVAILABLE_STATUS)
+        self.assertIsNone(copy.borrower)
+        self.assertIsNone(copy.due_back)
+        self.assertEqual(counters.read().num_instances_available, 1)
+
+    def test_second_checkout_of_a_stale_copy_conflicts(self):
+        # both librarians loaded the copy while it was available
+        stale = BookInstance.objects.get(pk=self.copy.pk)
+        loans.checkout(self.copy.pk, self.alice)
+        self.assertEqual(stale.status, BookInstance.AVAILABLE_STATUS)
+        with self.assertRaises(loans.LoanConflict) as context:
+            loans.checkout(stale.pk, self.bob)
+        self.assertEqual(context.exception.copy.borrower, self.alice)
+        self.assertEqual(BookInstance.objects.get(pk=self.copy.pk).borrower, self.alice)
+
+    def test_return_and_renew_need_a_loan(self):
+        with self.assertRaises(loans.LoanConflict):
+            loans.return_copy(self.copy.pk)
+        with self.assertRaises(loans.LoanConflict):
+            loans.renew(self.copy.pk, datetime.date.today())
+
+    def test_renew_checks_the_borrower(self):
+        loans.checkout(self.copy.pk, self.alice)
+        due_back = datetime.date.today() + datetime.timedelta(days=10)
+        with self.assertRaises(loans.LoanConflict):
+            loans.renew(self.copy.pk, due_back, borrower=self.bob)
+        self.assertEqual(loans.renew(self.copy.pk, due_back, borrower=self.alice).due_back, due_back)
+
+    def test_missing_copy(self):
+        BookInstance.objects.filter(pk=self.copy.pk).delete()
+        with self.assertRaises(BookInstance.DoesNotExist):
+            loans.checkout(self.copy.pk, self.alice)
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'Copies the test database into a file')
+class CheckoutRaceTest(TransactionTestCase):
+    """
+    50 threads race for 10 copies on a file copy of the test database, which
+    (unlike the shared in-memory one) takes SQLite's file locks.
+    """
+    clients = 50
+    copies = 10
+
+    def setUp(self):
+        book = Book.objects.create(title='Title')
+        BookInstance.objects.bulk_create([
+            BookInstance(book=book, imprint='Imprint', status=BookInstance.AVAILABLE_STATUS)
+            for _ in range(self.copies)
+        ])
+        User.objects.bulk_create([
+            User(username='borrower{}'.format(num)) for num in range(self.clients)
+        ])
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        name = os.path.join(directory, 'race.sqlite3')
+        with connection.cursor() as cursor:
+            cursor.execute('VACUUM INTO %s', [name])
+        # new (thread) connections open the file; this one keeps the test database
+        memory = connections.databases[DEFAULT_DB_ALIAS]
+        connections.databases[DEFAULT_DB_ALIAS] = dict(memory, NAME=name, TEST={})
+        self.addCleanup(connections.databases.__setitem__, DEFAULT_DB_ALIAS, memory)
+
+    def claim(self, borrower, copy_ids, barrier, outcomes):
+        random.Random(borrower.pk).shuffle(copy_ids)
+        outcome = {'claimed': None, 'conflicts': 0, 'errors': []}
+        barrier.wait()
+        try:
+            for pk in copy_ids:
+                try:
+                    outcome['claimed'] = loans.checkout(pk, borrower).pk
+                    break
+                except loans.LoanConflict:
+                    outcome['conflicts'] += 1
+        except Exception as exc:
+            outcome['errors'].append(exc)
+        finally:
+            connections.close_all()
+        outcomes.append(outcome)
+
+    def test_exactly_one_client_gets_each_copy(self):
+        copy_ids = list(BookInstance.objects.values_list('pk', flat=True))
+        barrier, outcomes = threading.Barrier(self.clients), []
+        threads = [
+            threading.Thread(target=self.claim, args=(borrower, list(copy_ids), barrier, outcomes))
+            for borrower in User.objects.all()
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([outcome['errors'] for outcome in outcomes if outcome['errors']], [])
+        claimed = [outcome['claimed'] for outcome in outcomes if outcome['claimed']]
+        self.assertEqual(sorted(claimed), sorted(copy_ids))
+        # everyone else found every copy taken
+        self.assertEqual(
+            [outcome['conflicts'] for outcome in outcomes if not outcome['claimed']],
+            [self.copies] * (self.clients - self.copies),
+        )
+
+
+class LoansApiTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user(username='alice', password='12345')
+        cls.bob = User.objects.create_user(username='bob', password='12345')
+        cls.copy = BookInstance.objects.create(
+            book=Book.objects.create(title='Title'),
+            imprint='Imprint',
+            status=BookInstance.AVAILABLE_STATUS,
+        )
+
+    def url(self, action):
+        return '/api/catalog/book-instances/{}/{}/'.format(self.copy.pk, action)
+
+    def test_checkout_conflict_and_return(self):
+        resp = self.client.post(self.url('checkout'), {'borrower': self.alice.pk})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data['status'], BookInstance.ON_LOAN_STATUS)
+        self.assertEqual(resp.data['borrower'], self.alice.pk)
+
+        resp = self.client.post(self.url('checkout'), {'borrower': self.bob.pk})
+        self.assertEqual(resp.status_code, 409)
+        self.assertEqual(resp.data, {
+            'detail': 'This copy is not available.',
+            'status': BookInstance.ON_LOAN_STATUS,
+        })
+
+        resp = self.client.post(self.url('return'))
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data['status'], BookInstance.AVAILABLE_STATUS)
+        self.assertEqual(self.client.post(self.url('return')).status_code, 409)
+
+    def test_renew(self):
+        due_back = datetime.date.today() + datetime.timedelta(days=7)
+        resp = self.client.post(self.url('renew'), {'due_back': due_back.isoformat()})
+        self.assertEqual(resp.status_code, 409)
+
+        self.client.post(self.url('checkout'), {'borrower': self.alice.pk})
+        resp = self.client.post(
+            self.url('renew'), {'due_back': due_back.isoformat(), 'borrower': self.bob.pk},
+        )
+        self.assertEqual(resp.status_code, 409)
+        resp = self.client.post(self.url('renew'), {'due_back': due_back.isoformat()})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data['due_back'], due_back.isoformat())
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.client.post(self.url('checkout')).status_code, 400)
+        resp = self.client.post(
+            '/api/catalog/book-instances/not-a-uuid/checkout/', {'borrower': self.alice.pk},
+        )
+        self.assertEqual(resp.status_code, 404)
+        BookInstance.objects.filter(pk=self.copy.pk).delete()
+        self.assertEqual(self.client.post(self.url('return')).status_code, 404)
+
+
+class RenewConflictViewTest(TestCase):
+
+    def test_renewing_a_returned_copy_conflicts(self):
+        librarian = User.objects.create_user(username='librarian', password='12345')
+        librarian.user_permissions.add(Permission.objects.get(codename='can_mark_returned'))
+        copy = BookInstance.objects.create(
+            book=Book.objects.create(title='Title'),
+            imprint='Imprint',
+            status=BookInstance.AVAILABLE_STATUS,
+        )
+        self.client.login(username='librarian', password='12345')
+        resp = self.client.post(
+            reverse('renew-book-librarian', kwargs={'pk': copy.pk}),
+            {'renewal_date': datetime.date.today().isoformat()},
+        )
+        self.assertEqual(resp.status_code, 409)
+        self.assertFormError(resp, 'form', None, 'This copy is not on loan.')
@@ -0,0 +1,87 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
+from django.template.loader import render_to_string
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from catalog import nplusone
+from catalog.models import Book, BookInstance
+
+
+class FingerprintTest(SimpleTestCase):
+
+    def test_values_and_in_lists_are_taken_out(self):
+        self.assertEqual(
+            nplusone.fingerprint('SELECT * FROM "t" WHERE "a" IN (%s, %s, %s) AND "b" = \'x\' LIMIT 21'),
+            'SELECT * FROM "t" WHERE "a" IN (...) AND "b" = ? LIMIT ?',
+        )
+        self.assertEqual(
+            nplusone.fingerprint('SELECT * FROM "t" WHERE "a" IN (%s)'),
+            nplusone.fingerprint('SELECT * FROM "t" WHERE "a" IN (%s, %s)'),
+        )
+
+    def test_unknown_mode(self):
+        with override_settings(NPLUSONE_MODE='loud'):
+            with self.assertRaises(ImproperlyConfigured):
+                nplusone.NPlusOneMiddleware(lambda request: None)
+
+
+class DetectorTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='borrower', password='12345')
+        for num in range(6):
+            BookInstance.objects.create(
+                book=Book.objects.create(title='Book {}'.format(num)),
+                imprint='Imprint',
+                status=BookInstance.ON_LOAN_STATUS,
+                borrower=cls.user,
+                due_back=datetime.date.today(),
+            )
+
+    def test_repeats_are_attributed_to_the_code_line(self):
+        with nplusone.detect(threshold=5) as detector:
+            titles = [copy.book.title for copy in BookInstance.objects.all()]
+        self.assertEqual(len(titles), 6)
+        repeat, = detector.repeats()
+        self.assertEqual(repeat.count, 6)
+        self.assertIn('FROM "catalog_book" WHERE "catalog_book"."id" = %s', repeat.fingerprint)
+        self.assertTrue(repeat.location.startswith('catalog/tests/test_nplusone.py:'))
+
+        with nplusone.detect(threshold=5) as detector:
+            [copy.book.title for copy in BookInstance.objects.select_related('book')]
+        self.assertEqual(detector.repeats(), [])
+
+    def test_repeats_are_attributed_to_the_template_line(self):
+        with nplusone.detect(threshold=5) as detector:
+            render_to_string('catalog/bookinstance_list_borrowed_by_user.html', {
+                'bookinstance_list': BookInstance.objects.all(),
+            })
+        self.assertEqual(
+            [repeat.location for repeat in detector.repeats()],
+            ['catalog/bookinstance_list_borrowed_by_user.html:10'],
+        )
+
+    def test_allowed_queries_are_not_counted(self):
+        with nplusone.detect(threshold=2) as detector:
+            with nplusone.allow():
+                [copy.book.title for copy in BookInstance.objects.all()]
+        self.assertEqual(detector.repeats(), [])
+
+    @override_settings(NPLUSONE_MODE='raise')
+    def test_borrowed_pages_do_not_repeat_queries(self):
+        User.objects.create_superuser('librarian', 'librarian@example.com', '12345')
+        self.client.login(username='librarian', password='12345')
+        self.assertEqual(self.client.get(reverse('borrowed')).status_code, 200)
+        self.client.login(username='borrower', password='12345')
+        self.assertEqual(self.client.get(reverse('my-borrowed')).status_code, 200)
+        self.assertEqual(self.client.get(reverse('book-list')).status_code, 200)
+
+    @override_settings(NPLUSONE_MODE='log', NPLUSONE_THRESHOLD=1)
+    def test_log_mode(self):
+        with self.assertLogs('catalog.nplusone', 'WARNING') as logs:
+            self.assertEqual(self.client.get(reverse('book-list')).status_code, 200)
+        self.assertIn('Repeated queries in GET /catalog/books/', logs.output[0])
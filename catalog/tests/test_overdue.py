@@ -0,0 +1,158 @@
+import datetime
+from smtplib import SMTPException
+
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.mail.backends import locmem
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils.six import StringIO
+
+from catalog import overdue
+from catalog.models import Author, Book, BookInstance, OverdueReminder
+
+
+class FailingBackend(locmem.EmailBackend):
+    """
+    Fails to send any email after the first ``limit``.
+    """
+
+    def __init__(self, limit, **kwargs):
+        super(FailingBackend, self).__init__(**kwargs)
+        self.limit = limit
+
+    def send_messages(self, messages):
+        if len(mail.outbox) >= self.limit:
+            raise SMTPException('connection lost')
+        return super(FailingBackend, self).send_messages(messages)
+
+
+class ScanOverdueTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.today = datetime.date(2017, 7, 1)
+        author = Author.objects.create(first_name='John', last_name='Smith')
+        book = Book.objects.create(title='Overdue Book', author=author)
+        cls.borrowers = []
+        for num in range(5):
+            borrower = User.objects.create_user(
+                username='user{}'.format(num),
+                email='user{}@example.com'.format(num),
+                password='12345',
+            )
+            cls.borrowers.append(borrower)
+            for days in (3, 10):
+                BookInstance.objects.create(
+                    book=book, imprint='Imprint', borrower=borrower,
+                    status=BookInstance.ON_LOAN_STATUS,
+                    due_back=cls.today - datetime.timedelta(days=days),
+                )
+        # neither due yet nor on loan
+        BookInstance.objects.create(
+            book=book, imprint='Imprint', borrower=cls.borrowers[0],
+            status=BookInstance.ON_LOAN_STATUS, due_back=cls.today,
+        )
+        BookInstance.objects.create(
+            book=book, imprint='Imprint', borrower=cls.borrowers[1],
+            status=BookInstance.RESERVED_STATUS,
+            due_back=cls.today - datetime.timedelta(days=1),
+        )
+        User.objects.create_user(username='nomail', password='12345')
+        BookInstance.objects.create(
+            book=book, imprint='Imprint', borrower=User.objects.get(username='nomail'),
+            status=BookInstance.ON_LOAN_STATUS,
+            due_back=cls.today - datetime.timedelta(days=1),
+        )
+
+    def test_one_email_per_borrower_listing_overdue_copies(self):
+        stats = overdue.scan(today=self.today, chunk_size=2)
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(stats.reminded, 5)
+        self.assertEqual(stats.skipped, 1)
+        self.assertEqual(stats.copies, 11)
+        self.assertEqual(mail.outbox[0].to, ['user0@example.com'])
+        self.assertEqual(mail.outbox[0].body.count('Overdue Book'), 2)
+        self.assertEqual(OverdueReminder.objects.filter(sent_on=self.today).count(), 5)
+
+    def test_emails_are_not_html_escaped(self):
+        Book.objects.update(title='Pride & Prejudice <1813>')
+        overdue.scan(today=self.today)
+        self.assertIn('* Pride & Prejudice <1813> (due back', mail.outbox[0].body)
+        self.assertNotIn('&amp;', mail.outbox[0].body)
+
+    def test_borrowers_are_reminded_once_a_day(self):
+        overdue.scan(today=self.today)
+        stats = overdue.scan(today=self.today)
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(stats.reminded, 0)
+
+        overdue.scan(today=self.today + datetime.timedelta(days=1))
+        self.assertEqual(len(mail.outbox), 10)
+
+    def test_borrowers_claimed_by_a_concurrent_scan_are_skipped(self):
+        build_message = overdue.build_message
+
+        def claim_concurrently(borrower, copies):
+            # between looking up today's reminders and claiming them
+            if borrower == self.borrowers[1]:
+                OverdueReminder.objects.create(borrower=borrower, sent_on=self.today, copies=0)
+            return build_message(borrower, copies)
+
+        overdue.build_message = claim_concurrently
+        self.addCleanup(setattr, overdue, 'build_message', build_message)
+        stats = overdue.scan(today=self.today)
+        self.assertEqual(stats.reminded, 4)
+        self.assertEqual(stats.skipped, 2)
+        self.assertEqual(len(mail.outbox), 4)
+        self.assertNotIn(['user1@example.com'], [message.to for message in mail.outbox])
+        self.assertEqual(OverdueReminder.objects.get(borrower=self.borrowers[1]).copies, 0)
+
+    def test_failed_emails_give_their_claims_back(self):
+        with self.assertRaises(SMTPException):
+            overdue.scan(today=self.today, connection=FailingBackend(limit=2))
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(
+            set(OverdueReminder.objects.values_list('borrower', flat=True)),
+            {self.borrowers[0].pk, self.borrowers[1].pk},
+        )
+
+        stats = overdue.scan(today=self.today)
+        self.assertEqual(stats.reminded, 3)
+        self.assertEqual(len(mail.outbox), 5)
+
+    def test_borrowers_who_returned_their_copies_meanwhile_are_skipped(self):
+        overdue_loans = overdue.overdue_loans
+
+        calls = []
+
+        def returned_meanwhile(today):
+            # the first call lists the borrowers; user2 returns their copies before the next one
+            calls.append(today)
+            queryset = overdue_loans(today)
+            return queryset if len(calls) == 1 else queryset.exclude(borrower=self.borrowers[2])
+
+        overdue.overdue_loans = returned_meanwhile
+        self.addCleanup(setattr, overdue, 'overdue_loans', overdue_loans)
+        stats = overdue.scan(today=self.today)
+        self.assertEqual(stats.reminded, 4)
+        self.assertEqual(stats.skipped, 2)
+        self.assertNotIn(['user2@example.com'], [message.to for message in mail.outbox])
+
+    def test_queries_per_chunk_are_constant(self):
+        # per chunk: borrowers, reminders, copies, users and the reminder insert
+        # in its own savepoint, plus the final empty chunk
+        with self.assertNumQueries(7 * 3 + 1):
+            overdue.scan(today=self.today, chunk_size=2)
+
+    def test_dry_run_sends_nothing(self):
+        stats = overdue.scan(today=self.today, dry_run=True)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(stats.copies, 11)
+        self.assertFalse(OverdueReminder.objects.exists())
+
+    def test_command(self):
+        out = StringIO()
+        call_command('scan_overdue', '--date', '2017-07-01', stdout=out)
+        self.assertIn('5 reminded', out.getvalue())
+        self.assertEqual(len(mail.outbox), 5)
@@ -0,0 +1,102 @@
+import datetime
+
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+
+from catalog.models import Book, BookInstance
+from catalog.pagination import KeysetPaginator
+
+
+class KeysetPaginatorTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        # duplicate titles so the id tie-breaker matters
+        for book_num in range(25):
+            Book.objects.create(title='Title {}'.format(book_num % 4))
+
+        book = Book.objects.first()
+        today = datetime.date.today()
+        for copy_num in range(23):
+            due_back = None if copy_num % 5 == 0 else today + datetime.timedelta(days=copy_num % 3)
+            BookInstance.objects.create(book=book, imprint='Imprint', due_back=due_back)
+
+    def _walk(self, paginator):
+        pages = [paginator.page()]
+        while pages[-1].has_next():
+            pages.append(paginator.page(pages[-1].next_cursor))
+        return pages
+
+    def _walk_back(self, paginator, page):
+        pages = [page]
+        while pages[-1].has_previous():
+            pages.append(paginator.page(pages[-1].previous_cursor))
+        return list(reversed(pages))
+
+    def _assert_walks(self, queryset, ordering):
+        expected = list(queryset.order_by(*ordering))
+        paginator = KeysetPaginator(queryset, ordering, 10)
+
+        pages = self._walk(paginator)
+        self.assertEqual([len(page) for page in pages], [10, 10, len(expected) - 20])
+        self.assertEqual([obj for page in pages for obj in page], expected)
+        self.assertFalse(pages[0].has_previous())
+
+        back = self._walk_back(paginator, pages[-1])
+        self.assertEqual(
+            [list(page) for page in back],
+            [list(page) for page in pages],
+        )
+
+    def test_walks_all_books_in_order(self):
+        self._assert_walks(Book.objects.all(), ('title', 'id'))
+
+    def test_walks_descending_ordering(self):
+        self._assert_walks(Book.objects.all(), ('-title', 'id'))
+
+    def test_walks_nullable_ordering(self):
+        self._assert_walks(BookInstance.objects.all(), ('due_back', 'id'))
+        self._assert_walks(BookInstance.objects.all(), ('-due_back', '-id'))
+
+    def test_ordering_must_end_with_primary_key(self):
+        with self.assertRaises(ValueError):
+            KeysetPaginator(Book.objects.all(), ('title',), 10)
+
+
+class KeysetListViewTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        for book_num in range(45):
+            Book.objects.create(title='Title {:02d}'.format(book_num))
+
+    def test_pages_do_not_count_rows(self):
+        # table versions for the ETag, then the page itself
+        with self.assertNumQueries(2):
+            resp = self.client.get(reverse('book-list'))
+        self.assertIsNone(resp.context['paginator'])
+
+    def test_deep_page_costs_the_same_as_first_page(self):
+        resp = self.client.get(reverse('book-list'))
+        for _ in range(4):
+            cursor = resp.context['page_obj'].next_cursor
+            with self.assertNumQueries(2):
+                resp = self.client.get(reverse('book-list'), {'cursor': cursor})
+        titles = [book.title for book in resp.context['book_list']]
+        self.assertEqual(titles, ['Title 40', 'Title 41', 'Title 42', 'Title 43', 'Title 44'])
+        self.assertFalse(resp.context['page_obj'].has_next())
+
+    def test_pagination_links_render_cursors(self):
+        resp = self.client.get(reverse('book-list'))
+        self.assertContains(resp, '?cursor=')
+        self.assertNotContains(resp, 'Page 1 of')
+
+    def test_invalid_cursor_returns_not_found(self):
+        resp = self.client.get(reverse('book-list'), {'cursor': 'tampered'})
+        self.assertEqual(resp.status_code, 404)
+
+    def test_page_number_links_still_work(self):
+        resp = self.client.get(reverse('book-list'), {'page': 2})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.context['book_list'][0].title, 'Title 10')
+        self.assertContains(resp, 'Page 2 of 5')
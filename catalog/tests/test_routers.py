@@ -0,0 +1,159 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection, connections
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, SimpleTestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils.six import StringIO
+
+from catalog import routers, search
+from catalog.middleware import PIN_COOKIE_NAME, ReplicaMiddleware
+from catalog.models import Author, Book, BookInstance
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1', 'replica_2'])
+class ReplicaRouterTest(SimpleTestCase):
+
+    def setUp(self):
+        self.router = routers.ReplicaRouter()
+
+    def test_reads_go_to_the_primary_by_default(self):
+        self.assertEqual(self.router.db_for_read(Author), 'default')
+
+    def test_catalog_reads_go_to_a_replica_when_enabled(self):
+        with routers.use_replicas():
+            self.assertIn(self.router.db_for_read(Author), ['replica_1', 'replica_2'])
+            self.assertEqual(self.router.db_for_read(User), 'default')
+            self.assertEqual(self.router.db_for_write(Author), 'default')
+        self.assertFalse(routers.replicas_enabled())
+        self.assertIsNone(routers.current_replica())
+
+    def test_reads_stay_on_one_replica_while_enabled(self):
+        seen = set()
+        for _ in range(20):
+            with routers.use_replicas():
+                aliases = {self.router.db_for_read(Author) for _ in range(20)}
+            self.assertEqual(len(aliases), 1)
+            seen.update(aliases)
+        self.assertEqual(seen, {'replica_1', 'replica_2'})
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_replicas_configured(self):
+        with routers.use_replicas():
+            self.assertEqual(self.router.db_for_read(Author), 'default')
+
+    def test_replicas_are_not_migrated(self):
+        self.assertTrue(self.router.allow_migrate('default', 'catalog'))
+        self.assertFalse(self.router.allow_migrate('replica_1', 'catalog'))
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1'], REPLICA_PIN_SECONDS=10)
+class ReplicaMiddlewareTest(SimpleTestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.seen = []
+
+        def view(request):
+            self.seen.append(routers.replicas_enabled())
+            return HttpResponse()
+
+        self.middleware = ReplicaMiddleware(view)
+
+    def test_safe_requests_read_from_replicas(self):
+        response = self.middleware(self.factory.get('/'))
+        self.assertEqual(self.seen, [True])
+        self.assertNotIn(PIN_COOKIE_NAME, response.cookies)
+        self.assertFalse(routers.replicas_enabled())
+
+    def test_writes_pin_the_client_to_the_primary(self):
+        response = self.middleware(self.factory.post('/'))
+        self.assertEqual(self.seen, [False])
+        self.assertEqual(response.cookies[PIN_COOKIE_NAME]['max-age'], 10)
+
+        request = self.factory.get('/')
+        request.COOKIES[PIN_COOKIE_NAME] = '1'
+        self.middleware(request)
+        self.assertEqual(self.seen, [False, False])
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'Local replicas are SQLite files')
+class SqliteReplicaTest(TransactionTestCase):
+    """
+    A second SQLite file, refreshed by sync_replicas, stands in for a replica.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        connections.databases['replica_1'] = dict(
+            connection.settings_dict,
+            NAME=os.path.join(self.directory, 'replica.sqlite3'),
+            TEST={},
+        )
+        self.addCleanup(self.remove_replica)
+        replicas = override_settings(DATABASE_REPLICAS=['replica_1'])
+        replicas.enable()
+        self.addCleanup(replicas.disable)
+
+        self.author = Author.objects.create(first_name='Ursula', last_name='Le Guin')
+        call_command('sync_replicas', stdout=StringIO())
+
+    def remove_replica(self):
+        connections['replica_1'].close()
+        del connections['replica_1']
+        del connections.databases['replica_1']
+        shutil.rmtree(self.directory)
+
+    def test_reads_see_the_replica_until_the_client_writes(self):
+        url = reverse('author-detail', args=[self.author.pk])
+        Author.objects.filter(pk=self.author.pk).update(first_name='Ursula K.')
+        self.assertNotContains(self.client.get(url), 'Ursula K.')
+
+        response = self.client.post(
+            reverse('author_update', args=[self.author.pk]),
+            {'first_name': 'Ursula Kroeber', 'last_name': 'Le Guin'},
+            follow=True,
+        )
+        self.assertContains(response, 'Ursula Kroeber')
+        self.assertContains(self.client.get(url), 'Ursula Kroeber')
+        # Other clients keep reading the (stale) replica.
+        self.assertNotContains(Client().get(url), 'Ursula K')
+        self.assertContains(Client().get(url), 'Ursula')
+
+    def test_copies_sections_are_never_cached_from_a_replica(self):
+        book = Book.objects.create(title='The Dispossessed', author=self.author)
+        copy = BookInstance.objects.create(
+            book=book, imprint='First printing', status=BookInstance.AVAILABLE_STATUS,
+        )
+        call_command('sync_replicas', stdout=StringIO())
+        url = reverse('book-detail', args=[book.pk])
+        self.assertContains(Client().get(url), 'First printing')
+
+        copy.imprint = 'Second printing'
+        copy.save()
+        # an unpinned client renders the section first, with the book read from the replica
+        self.assertContains(Client().get(url), 'Second printing')
+        writer = Client()
+        writer.cookies[PIN_COOKIE_NAME] = '1'
+        self.assertContains(writer.get(url), 'Second printing')
+
+    @unittest.skipUnless(search.is_indexed(), 'Ranked search needs the FTS index')
+    def test_search_reads_the_index_and_the_books_from_one_database(self):
+        Book.objects.create(title='The Dispossessed', author=self.author)
+        with routers.use_replicas():
+            results = search.search('dispossessed')
+            self.assertEqual((results.count(), list(results)), (0, []))
+        call_command('sync_replicas', stdout=StringIO())
+        with routers.use_replicas():
+            results = search.search('dispossessed')
+            self.assertEqual((results.count(), [book.title for book in results]), (1, ['The Dispossessed']))
+
+    def test_sync_replicas_copies_the_primary(self):
+        Author.objects.create(first_name='Octavia', last_name='Butler')
+        call_command('sync_replicas', stdout=StringIO())
+        self.assertEqual(Author.objects.using('replica_1').count(), 2)
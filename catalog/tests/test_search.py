@@ -0,0 +1,94 @@
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.urls import reverse
+from django.utils.six import StringIO
+
+from catalog import search
+from catalog.models import Author, Book, Genre
+
+
+class SearchTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tolkien = Author.objects.create(first_name='John', last_name='Tolkien')
+        cls.austen = Author.objects.create(first_name='Jane', last_name='Austen')
+        cls.hobbit = Book.objects.create(
+            title='The Hobbit', author=cls.tolkien,
+            summary='A dragon guards a treasure under the Lonely Mountain.',
+        )
+        cls.rings = Book.objects.create(
+            title='The Lord of the Rings', author=cls.tolkien,
+            summary='A hobbit carries a ring to Mount Doom.',
+        )
+        cls.emma = Book.objects.create(
+            title='Emma', author=cls.austen,
+            summary='A young woman plays matchmaker in an English village.',
+        )
+
+    def titles(self, query):
+        return [book.title for book in search.search(query)]
+
+    def test_to_match_quotes_words_and_prefixes_the_last(self):
+        self.assertEqual(search.to_match('lord "of* rin'), '"lord" "of" "rin"*')
+        self.assertIsNone(search.to_match(' ?! '))
+
+    def test_title_matches_rank_above_summary_matches(self):
+        self.assertEqual(self.titles('hobbit'), ['The Hobbit', 'The Lord of the Rings'])
+
+    def test_matches_author_names_and_prefixes(self):
+        self.assertEqual(self.titles('austen'), ['Emma'])
+        self.assertEqual(self.titles('matchm'), ['Emma'])
+        self.assertEqual(self.titles('tolkien ring'), ['The Lord of the Rings'])
+        self.assertEqual(self.titles(''), [])
+
+    def test_index_follows_writes(self):
+        self.emma.title = 'Persuasion'
+        self.emma.save()
+        self.assertEqual(self.titles('persuasion'), ['Persuasion'])
+        self.assertEqual(self.titles('emma'), [])
+
+        self.austen.last_name = 'Bronte'
+        self.austen.save()
+        self.assertEqual(self.titles('bronte'), ['Persuasion'])
+
+        Book.objects.filter(pk=self.hobbit.pk).delete()
+        self.assertEqual(self.titles('dragon'), [])
+
+    def test_rebuild(self):
+        if search.is_indexed():
+            with connection.cursor() as cursor:
+                cursor.execute('DELETE FROM catalog_book_fts')
+        self.assertEqual(self.titles('emma'), [] if search.is_indexed() else ['Emma'])
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertEqual(self.titles('emma'), ['Emma'])
+
+    def test_search_view(self):
+        resp = self.client.get(reverse('book-search'), {'q': 'tolkien'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertTemplateUsed(resp, 'catalog/book_search.html')
+        self.assertEqual(
+            [book.title for book in resp.context['book_list']],
+            ['The Hobbit', 'The Lord of the Rings'],
+        )
+
+    def test_search_view_paginates_with_the_query(self):
+        Book.objects.bulk_create([
+            Book(title='Dragon {}'.format(num), summary='dragon') for num in range(12)
+        ])
+        resp = self.client.get(reverse('book-search'), {'q': 'dragon'})
+        self.assertTrue(resp.context['is_paginated'])
+        self.assertEqual(resp.context['paginator'].count, 13)
+        self.assertContains(resp, '?q=dragon&amp;page=2')
+
+    def test_api_search(self):
+        self.hobbit.genre.add(Genre.objects.create(name='Fantasy'))
+        # count, ranked ids, books and their genres
+        with self.assertNumQueries(4):
+            resp = self.client.get('/api/catalog/books/search/', {'q': 'tolkien', 'limit': 1})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data['count'], 2)
+        self.assertEqual([book['title'] for book in resp.data['results']], ['The Hobbit'])
+        self.assertIn('offset=1', resp.data['next'])
@@ -0,0 +1,82 @@
+import re
+
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from catalog import timing
+from catalog.models import Author, Book
+
+
+def server_timing(response):
+    """
+    {name: (duration in ms, description)} from the Server-Timing header.
+    """
+    entries = {}
+    for entry in response['Server-Timing'].split(', '):
+        name, _, params = entry.partition(';')
+        duration = re.search(r'dur=([\d.]+)', params)
+        description = re.search(r'desc="([^"]*)"', params)
+        entries[name] = (
+            float(duration.group(1)) if duration else None,
+            description.group(1) if description else None,
+        )
+    return entries
+
+
+class TimingMiddlewareTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(first_name='First', last_name='Last')
+        Book.objects.create(title='Title', author=author)
+
+    def setUp(self):
+        timing.registry.reset()
+
+    def test_server_timing_header(self):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(reverse('book-list'))
+        entries = server_timing(response)
+        self.assertEqual(set(entries), {'db', 'view', 'render', 'total'})
+        self.assertEqual(entries['db'][1], '{} queries'.format(len(captured)))
+        self.assertGreater(entries['render'][0], 0)
+        self.assertGreaterEqual(entries['total'][0], entries['view'][0] + entries['render'][0])
+
+        entries = server_timing(self.client.get('/api/catalog/books/'))
+        self.assertEqual(entries['render'][0], 0)
+        self.assertNotEqual(entries['db'][1], '0 queries')
+
+    def test_metrics_aggregate_per_route(self):
+        self.client.get(reverse('book-list'))
+        self.client.get(reverse('book-list'))
+        self.client.get('/no-such-page/')
+
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        body = response.content.decode()
+        self.assertIn('# TYPE catalog_request_duration_seconds histogram', body)
+        self.assertIn('catalog_request_queries_count{route="book-list"} 2', body)
+        self.assertIn('catalog_request_render_duration_seconds_bucket{route="book-list",le="+Inf"} 2', body)
+        self.assertIn('catalog_request_duration_seconds_count{route="unresolved"} 1', body)
+
+    def test_queries_outside_requests_are_not_recorded(self):
+        self.assertIsNone(timing.current())
+        list(Book.objects.all())
+        self.assertEqual(timing.registry.routes, {})
+
+
+class RegistryTest(SimpleTestCase):
+
+    def test_buckets_are_cumulative(self):
+        histogram = timing.Histogram((1, 5))
+        for value in (0, 1, 3, 7):
+            histogram.observe(value)
+        self.assertEqual(list(histogram.cumulative()), [(1, 2), (5, 3), (float('inf'), 4)])
+        self.assertEqual((histogram.sum, histogram.count), (11, 4))
+
+    def test_route_labels_are_escaped(self):
+        registry = timing.Registry()
+        registry.observe('a"b\\c', timing.RequestTimings())
+        self.assertIn('catalog_request_queries_count{route="a\\"b\\\\c"} 1', registry.render())
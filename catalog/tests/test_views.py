@@ -2,10 +2,12 @@ import datetime
 import uuid
 
 from django.contrib.auth.models import User, Permission
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
 from django.test import TestCase
 from django.utils import timezone
 
+from catalog import counters
 from catalog.models import Author, Book, BookInstance,Language, Genre
 
 
@@ -73,6 +75,41 @@ class AuthorDetailsViewTest(TestCase):
         self.assertEqual(resp.context['author'], self.author)
 
 
+class AuthorDetailViewQueryBudgetTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(first_name='Prolific', last_name='Writer')
+        number_of_books = 300
+        Book.objects.bulk_create([
+            Book(title='Title {:03d}'.format(book_num), author=cls.author)
+            for book_num in range(number_of_books)
+        ])
+        statuses = [BookInstance.AVAILABLE_STATUS, BookInstance.ON_LOAN_STATUS, BookInstance.MAINTENANCE_STATUS]
+        BookInstance.objects.bulk_create([
+            BookInstance(book=book, imprint='Imprint', status=statuses[copy_num])
+            for book in Book.objects.filter(author=cls.author)[:100]
+            for copy_num in range(3)
+        ])
+        # bulk_create skips the signals that keep the book counters
+        counters.reconcile_books()
+
+    def test_view_renders_with_fixed_number_of_queries(self):
+        url = reverse('author-detail', kwargs={'pk': self.author.pk})
+        # ETag validators (author stamp, table versions), author, books
+        with self.assertNumQueries(4):
+            resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        books = resp.context['author'].book_set.all()
+        self.assertEqual(len(books), 300)
+        self.assertEqual(
+            [(book.copies_total, book.copies_available, book.copies_on_loan) for book in books[:2]],
+            [(3, 1, 1), (3, 1, 1)],
+        )
+        self.assertEqual((books[299].copies_total, books[299].copies_available), (0, 0))
+        self.assertContains(resp, '1 available, 1 on loan', count=100)
+
+
 class BookListViewTest(TestCase):
 
     @classmethod
@@ -135,6 +172,56 @@ class BookDetailsViewTest(TestCase):
         self.assertEqual(resp.context['book'], self.book)
 
 
+class BookDetailViewQueryBudgetTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(first_name='John', last_name='Smith')
+        language = Language.objects.create(name='English')
+        cls.book = Book.objects.create(
+            title='Popular Title',
+            author=author,
+            language=language,
+        )
+        for genre_num in range(5):
+            cls.book.genre.add(Genre.objects.create(name='Genre {}'.format(genre_num)))
+
+        statuses = [status for status, _ in BookInstance.LOAN_STATUS]
+        number_of_book_copies = 500
+        BookInstance.objects.bulk_create([
+            BookInstance(
+                book=cls.book,
+                imprint='Imprint {}'.format(book_copy),
+                due_back=datetime.date.today() + datetime.timedelta(days=book_copy % 7),
+                status=statuses[book_copy % len(statuses)],
+            )
+            for book_copy in range(number_of_book_copies)
+        ])
+
+    def setUp(self):
+        cache.clear()
+
+    def test_view_renders_with_fixed_number_of_queries(self):
+        url = reverse('book-detail', kwargs={'pk': self.book.pk})
+        # ETag validators (book stamp, lookup table versions), then
+        # book with author and language, genres, copies
+        with self.assertNumQueries(5):
+            resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(resp.context['copies']), 500)
+
+        # the copies come from the fragment cache on the next view
+        with self.assertNumQueries(4):
+            resp = self.client.get(url)
+        self.assertEqual(resp.content.count(b'Imprint:'), 500)
+
+    def test_copies_are_ordered_by_status(self):
+        url = reverse('book-detail', kwargs={'pk': self.book.pk})
+        resp = self.client.get(url)
+        statuses = [copy.status for copy in resp.context['copies']]
+        self.assertEqual(statuses, sorted(statuses))
+
+
 class LoanedBookInstancesByUserListViewTest(TestCase):
 
     def setUp(self):
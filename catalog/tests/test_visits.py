@@ -0,0 +1,115 @@
+import uuid
+
+from django.core.urlresolvers import reverse
+from django.db import OperationalError, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from catalog import visits
+from catalog.models import VisitCount
+
+
+def _writes(context):
+    return [
+        query['sql'] for query in context.captured_queries
+        if query['sql'].split(' ', 1)[0] in ('INSERT', 'UPDATE', 'DELETE')
+    ]
+
+
+class VisitCounterTest(TestCase):
+
+    def setUp(self):
+        visits.buffer.reset()
+
+    def _visit(self):
+        return self.client.get(reverse('index')).context['num_visits']
+
+    @override_settings(VISITS_MODE=visits.SESSION_MODE)
+    def test_session_mode_counts_visits(self):
+        self.assertEqual([self._visit() for _ in range(3)], [0, 1, 2])
+        self.assertEqual(self.client.session['num_visits'], 3)
+
+    @override_settings(VISITS_MODE=visits.COOKIE_MODE)
+    def test_cookie_mode_counts_visits_without_server_writes(self):
+        self._visit()
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual([self._visit() for _ in range(3)], [1, 2, 3])
+        self.assertEqual(_writes(context), [])
+
+    @override_settings(VISITS_MODE=visits.COOKIE_MODE)
+    def test_cookie_mode_ignores_tampered_cookie(self):
+        self.client.cookies[visits.COOKIE_NAME] = '1000'
+        self.assertEqual(self._visit(), 0)
+
+    @override_settings(
+        VISITS_MODE=visits.BUFFERED_MODE,
+        VISITS_FLUSH_SIZE=5,
+        VISITS_FLUSH_INTERVAL=3600,
+    )
+    def test_buffered_mode_flushes_in_batches(self):
+        with CaptureQueriesContext(connection) as context:
+            counts = [self._visit() for _ in range(4)]
+        self.assertEqual(counts, [0, 1, 2, 3])
+        self.assertFalse(VisitCount.objects.exists())
+        self.assertEqual(len(_writes(context)), 1)  # counters row built on first read
+
+        self._visit()
+        visit_count = VisitCount.objects.get()
+        self.assertEqual(visit_count.count, 5)
+
+        self.assertEqual(self._visit(), 5)
+        visits.buffer.flush()
+        visit_count.refresh_from_db()
+        self.assertEqual(visit_count.count, 6)
+        self.assertEqual(visits.buffer.visits, 6)
+        self.assertEqual(visits.buffer.writes, 2)
+
+    def test_visitors_inserted_by_a_concurrent_flush_are_updated(self):
+        known, new = uuid.uuid4(), uuid.uuid4()
+        for visitor_id in (known, known, new):
+            visits.buffer._pending[visitor_id] += 1
+        VisitCount.objects.create(visitor_id=known, count=10)
+
+        def stale_lookup(**kwargs):
+            # as if another process inserted ``known`` right after this lookup
+            del VisitCount.objects.filter
+            return VisitCount.objects.none()
+
+        VisitCount.objects.filter = stale_lookup
+        self.addCleanup(lambda: VisitCount.objects.__dict__.pop('filter', None))
+
+        visits.buffer.flush()
+        self.assertEqual(dict(VisitCount.objects.values_list('visitor_id', 'count')), {known: 12, new: 1})
+        self.assertEqual(visits.buffer.pending(known), 0)
+
+    def test_failed_flushes_keep_the_increments(self):
+        visitor_id = uuid.uuid4()
+        visits.buffer._pending[visitor_id] += 2
+
+        def fail(objs):
+            del VisitCount.objects.bulk_create
+            raise ValueError('database is gone')
+
+        VisitCount.objects.bulk_create = fail
+        self.addCleanup(lambda: VisitCount.objects.__dict__.pop('bulk_create', None))
+        with self.assertRaises(ValueError):
+            visits.buffer.flush()
+        self.assertEqual(visits.buffer.pending(visitor_id), 2)
+        visits.buffer.flush()
+        self.assertEqual(VisitCount.objects.get().count, 2)
+
+    @override_settings(VISITS_MODE=visits.BUFFERED_MODE, VISITS_FLUSH_SIZE=1)
+    def test_failed_flushes_do_not_fail_the_page(self):
+        def locked(objs):
+            raise OperationalError('database is locked')
+
+        VisitCount.objects.bulk_create = locked
+        self.addCleanup(lambda: VisitCount.objects.__dict__.pop('bulk_create', None))
+        with self.assertLogs('catalog.visits', 'ERROR'):
+            response = self.client.get(reverse('index'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sum(visits.buffer._pending.values()), 1)
+
+        del VisitCount.objects.bulk_create
+        visits.buffer.flush()
+        self.assertEqual(VisitCount.objects.get().count, 1)
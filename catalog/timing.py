@@ -0,0 +1,244 @@
+"""
+Per-request timings: SQL queries and their time, view time and template
+rendering time.
+
+``TimingMiddleware`` sends them back in a ``Server-Timing`` header, which
+browsers show in the network panel, and adds them to per-route histograms
+that the ``metrics`` view serves in the Prometheus text format.
+
+Queries are timed by the cursors of every database connection (see
+``install_cursors``) and rendering by the ``TimedDjangoTemplates``
+template backend; both only record while the middleware is timing a
+request. The cursors also feed ``catalog.nplusone``. Histograms live in
+the process, so each worker reports its own requests, and the body of a
+streaming response is produced after they are recorded.
+"""
+import threading
+from bisect import bisect_left
+from time import perf_counter
+
+from django.db.backends import utils
+from django.template.backends.django import DjangoTemplates, Template
+
+from . import nplusone
+
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+UNRESOLVED_ROUTE = 'unresolved'
+
+_local = threading.local()
+
+
+class RequestTimings(object):
+    __slots__ = ('started', 'view_started', 'total', 'view', 'queries', 'sql', 'render')
+
+    def __init__(self):
+        self.started = perf_counter()
+        self.view_started = None
+        self.total = self.view = self.sql = self.render = 0.0
+        self.queries = 0
+
+    def finish(self):
+        finished = perf_counter()
+        self.total = finished - self.started
+        if self.view_started is not None:
+            self.view = max(finished - self.view_started - self.render, 0.0)
+
+    def server_timing(self):
+        return (
+            'db;dur={:.1f};desc="{} queries", view;dur={:.1f}, render;dur={:.1f}, total;dur={:.1f}'
+        ).format(self.sql * 1000, self.queries, self.view * 1000, self.render * 1000, self.total * 1000)
+
+
+def current():
+    """
+    The timings of the request this thread is handling, if it is being timed.
+    """
+    return getattr(_local, 'timings', None)
+
+
+class TimingMiddleware(object):
+    """
+    Time every request; put it first in MIDDLEWARE so the total covers the others.
+
+    View time runs from the view being called, through the response phase
+    of the middleware below this one, less template rendering.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timings = _local.timings = RequestTimings()
+        try:
+            response = self.get_response(request)
+        finally:
+            _local.timings = None
+        timings.finish()
+        response['Server-Timing'] = timings.server_timing()
+        match = request.resolver_match
+        registry.observe(match.view_name if match else UNRESOLVED_ROUTE, timings)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timings = current()
+        if timings is not None:
+            timings.view_started = perf_counter()
+
+
+class TimedCursorMixin(object):
+
+    def _timed(self, method, *args):
+        nplusone.record(args[0])
+        timings = current()
+        if timings is None:
+            return method(*args)
+        started = perf_counter()
+        try:
+            return method(*args)
+        finally:
+            timings.sql += perf_counter() - started
+            timings.queries += 1
+
+    def callproc(self, procname, params=None):
+        return self._timed(super(TimedCursorMixin, self).callproc, procname, params)
+
+    def execute(self, sql, params=None):
+        return self._timed(super(TimedCursorMixin, self).execute, sql, params)
+
+    def executemany(self, sql, param_list):
+        return self._timed(super(TimedCursorMixin, self).executemany, sql, param_list)
+
+
+class TimedCursorWrapper(TimedCursorMixin, utils.CursorWrapper):
+    pass
+
+
+class TimedCursorDebugWrapper(TimedCursorMixin, utils.CursorDebugWrapper):
+    pass
+
+
+def install_cursors(sender, connection, **kwargs):
+    """
+    ``connection_created`` receiver that makes ``connection`` hand out timed cursors.
+    """
+    connection.make_cursor = lambda cursor: TimedCursorWrapper(cursor, connection)
+    connection.make_debug_cursor = lambda cursor: TimedCursorDebugWrapper(cursor, connection)
+
+
+class TimedTemplate(Template):
+
+    def render(self, context=None, request=None):
+        timings = current()
+        if timings is None:
+            return super(TimedTemplate, self).render(context, request)
+        started = perf_counter()
+        try:
+            return super(TimedTemplate, self).render(context, request)
+        finally:
+            timings.render += perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """
+    The Django template backend, timing each top-level render.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(super(TimedDjangoTemplates, self).from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super(TimedDjangoTemplates, self).get_template(template_name).template, self)
+
+
+class Histogram(object):
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # the last count is for values above every bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """
+        (upper bound, observations at or below it) pairs, ending with +Inf.
+        """
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            yield bound, total
+
+
+# (name, help, buckets, RequestTimings attribute)
+METRICS = (
+    ('catalog_request_duration_seconds', 'Time spent handling the request.', SECONDS_BUCKETS, 'total'),
+    ('catalog_request_view_duration_seconds', 'Time spent in the view, less template rendering.',
+     SECONDS_BUCKETS, 'view'),
+    ('catalog_request_sql_duration_seconds', 'Time spent running SQL queries.', SECONDS_BUCKETS, 'sql'),
+    ('catalog_request_render_duration_seconds', 'Time spent rendering templates.', SECONDS_BUCKETS, 'render'),
+    ('catalog_request_queries', 'SQL queries run by the request.', QUERY_BUCKETS, 'queries'),
+)
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_bound(bound):
+    return '+Inf' if bound == float('inf') else repr(float(bound))
+
+
+class Registry(object):
+    """
+    One histogram per metric and route, shared by the threads of the process.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            # route -> histograms in METRICS order
+            self.routes = {}
+
+    def observe(self, route, timings):
+        with self.lock:
+            histograms = self.routes.get(route)
+            if histograms is None:
+                histograms = self.routes[route] = [Histogram(buckets) for _, _, buckets, _ in METRICS]
+            for histogram, (_, _, _, attribute) in zip(histograms, METRICS):
+                histogram.observe(getattr(timings, attribute))
+
+    def render(self):
+        """
+        The histograms in the Prometheus text exposition format.
+        """
+        with self.lock:
+            routes = sorted(
+                (route, [(list(h.cumulative()), h.sum, h.count) for h in histograms])
+                for route, histograms in self.routes.items()
+            )
+        lines = []
+        for index, (name, help_text, _, _) in enumerate(METRICS):
+            lines.append('# HELP {} {}'.format(name, help_text))
+            lines.append('# TYPE {} histogram'.format(name))
+            for route, histograms in routes:
+                cumulative, total, count = histograms[index]
+                label = 'route="{}"'.format(_escape(route))
+                for bound, observed in cumulative:
+                    lines.append('{}_bucket{{{},le="{}"}} {}'.format(name, label, _format_bound(bound), observed))
+                lines.append('{}_sum{{{}}} {!r}'.format(name, label, float(total)))
+                lines.append('{}_count{{{}}} {}'.format(name, label, count))
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
@@ -5,12 +5,15 @@ from . import views
 urlpatterns = [
     url(r'^$', views.index, name='index'),
     url(r'^books/$', views.BookListView.as_view(), name='book-list'),
+    url(r'^search/$', views.BookSearchView.as_view(), name='book-search'),
     url(r'^books/(?P<pk>\d+)$', views.BookDetailView.as_view(), name='book-detail'),
     url(r'^authors/$', views.AuthorListView.as_view(), name='author-list'),
     url(r'^authors/(?P<pk>\d+)$', views.AuthorDetailView.as_view(), name='author-detail'),
     url(r'^mybooks/$', views.LoanedBooksByUserListView.as_view(), name='my-borrowed'),
     url(r'^borrowed/$', views.LoanedBooksListView.as_view(), name='borrowed'),
     url(r'^book/(?P<pk>[-\w]+)/renew/$', views.renew_book_librarian, name='renew-book-librarian'),
+    url(r'^cache-stats/$', views.cache_stats, name='cache-stats'),
+    url(r'^export/(?P<dataset>[-\w]+)\.(?P<fmt>ndjson|csv)$', views.export_catalog, name='catalog-export'),
 
     url(r'^author/create/$', views.AuthorCreate.as_view(), name='author-create'),
     url(r'^author/(?P<pk>\d+)/update/$', views.AuthorUpdate.as_view(), name='author_update'),
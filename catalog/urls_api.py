@@ -11,6 +11,8 @@ router.register(r'languages', views_api.LanguageViewSet, 'api-languages')
 router.register(r'books', views_api.BookViewSet, 'api-books')
 router.register(r'book-instances', views_api.BookInstanceViewSet, 'api-book-instances')
 router.register(r'authors', views_api.AuthorViewSet, 'api-authors')
+router.register(r'holds', views_api.HoldViewSet, 'api-holds')
+router.register(r'jobs', views_api.JobViewSet, 'api-jobs')
 
 urlpatterns = [
     url(r'^', include(router.urls))
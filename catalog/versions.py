@@ -0,0 +1,46 @@
+"""
+Table-level version stamps used as validators for conditional GETs.
+
+Every write to a catalog table bumps its TableVersion row: single-object
+writes through catalog.signals, bulk writes explicitly. Anything rendered
+only from a set of tables is unchanged as long as their versions are.
+"""
+from django.db.models import F
+from django.utils import timezone
+
+from .models import TableVersion
+
+
+def table_of(model):
+    return model._meta.db_table
+
+
+def bump(*models):
+    """
+    Mark the tables of ``models`` as changed.
+    """
+    now = timezone.now()
+    for model in models:
+        table = table_of(model)
+        updated = TableVersion.objects \
+                              .filter(pk=table) \
+                              .update(version=F('version') + 1, updated_at=now)
+        if not updated:
+            TableVersion.objects.get_or_create(table=table, defaults={'version': 1})
+
+
+def stamp(*models):
+    """
+    Return ``(versions, last_modified)`` for the tables of ``models`` in a
+    single query; ``versions`` is a tuple suitable for an ETag.
+    """
+    tables = sorted({table_of(model) for model in models})
+    rows = {
+        table: (version, updated_at)
+        for table, version, updated_at in TableVersion.objects
+                                                      .filter(pk__in=tables)
+                                                      .values_list('table', 'version', 'updated_at')
+    }
+    versions = tuple((table, rows.get(table, (0, None))[0]) for table in tables)
+    modified = [updated_at for _, updated_at in rows.values()]
+    return versions, max(modified) if modified else None
@@ -1,81 +1,139 @@
 import datetime
 
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import permission_required
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
 from django.core.urlresolvers import reverse
-from django.http import HttpResponseRedirect
+from django.db.models import Prefetch
+from django.http import Http404, HttpResponse, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, render
 from django.urls import reverse_lazy
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
 from django.views import generic
 from django.views.generic.edit import CreateView, UpdateView, DeleteView
 
+from . import counters, export, fragments, loans, search, timing, visits
+from .conditional import ConditionalGetMixin, author_validators, book_validators, table_validators
 from .forms import RenewBookForm
-from .models import Author, Book, BookInstance, Genre
+from .models import Author, Book, BookInstance
+from .pagination import KeysetPaginationMixin
 
 
 def index(request):
-    num_books = Book.objects.all().count()
-    num_instances = BookInstance.objects.all().count()
-    num_instances_available = BookInstance.objects.filter(
-                                status__exact=BookInstance.AVAILABLE_STATUS
-                              ).count()
-    num_authors = Author.objects.all().count()
-    num_genries = Genre.objects.all().count()
-    num_visits = request.session.get('num_visits', 0)
-    request.session['num_visits'] = num_visits + 1
-
-    return render(
+    totals = counters.read()
+    num_visits = visits.previous_visits(request)
+
+    response = render(
         request,
         'index.html',
         context={
-            'num_books': num_books,
-            'num_instances': num_instances,
-            'num_instances_available': num_instances_available,
-            'num_authors': num_authors,
-            'num_genries': num_genries,
+            'num_books': totals.num_books,
+            'num_instances': totals.num_instances,
+            'num_instances_available': totals.num_instances_available,
+            'num_authors': totals.num_authors,
+            'num_genries': totals.num_genres,
             'num_visits': num_visits,
         },
     )
+    return visits.record_visit(request, response, num_visits)
 
 
-class BookListView(generic.ListView):
+class BookListView(ConditionalGetMixin, KeysetPaginationMixin, generic.ListView):
     model = Book
     paginate_by = 10
+    keyset_ordering = ('title', 'id')
+
+    def get_validators(self):
+        # every row shows the book's available copies
+        return table_validators(Book, Author, BookInstance)
+
+    def get_keyset_ordering(self):
+        if self.request.GET.get('sort') == 'available':
+            return Book.AVAILABILITY_ORDERING
+        return self.keyset_ordering
+
+    def get_queryset(self):
+        queryset = Book.objects.select_related('author')
+        if self.request.GET.get('available'):
+            queryset = queryset.available()
+        return queryset
+
+
+class BookSearchView(generic.ListView):
+    template_name = 'catalog/book_search.html'
+    context_object_name = 'book_list'
+    paginate_by = 10
+
+    def get_queryset(self):
+        return search.search(self.request.GET.get('q', ''))
+
+    def get_context_data(self, **kwargs):
+        context = super(BookSearchView, self).get_context_data(**kwargs)
+        context['query'] = self.request.GET.get('q', '')
+        return context
 
 
-class BookDetailView(generic.DetailView):
+class BookDetailView(ConditionalGetMixin, generic.DetailView):
     model = Book
 
+    def get_validators(self):
+        return book_validators(self.kwargs['pk'])
+
+    def get_queryset(self):
+        # copies are loaded by fragments.render_copies only on a cache miss
+        return Book.objects \
+                   .select_related('author', 'language') \
+                   .prefetch_related('genre')
+
+    def get_context_data(self, **kwargs):
+        context = super(BookDetailView, self).get_context_data(**kwargs)
+        context['copies_html'] = fragments.render_copies(self.object)
+        return context
 
-class AuthorListView(generic.ListView):
+
+class AuthorListView(ConditionalGetMixin, KeysetPaginationMixin, generic.ListView):
     model = Author
     paginate_by = 10
+    keyset_ordering = ('last_name', 'first_name', 'id')
+
+    def get_validators(self):
+        return table_validators(Author)
 
 
-class AuthorDetailView(generic.DetailView):
+class AuthorDetailView(ConditionalGetMixin, generic.DetailView):
     model = Author
 
+    def get_validators(self):
+        return author_validators(self.kwargs['pk'])
+
+    def get_queryset(self):
+        books = Book.objects.order_by('title', 'id')
+        return Author.objects.prefetch_related(Prefetch('book_set', queryset=books))
 
-class LoanedBooksByUserListView(LoginRequiredMixin, generic.ListView):
+
+class LoanedBooksByUserListView(LoginRequiredMixin, KeysetPaginationMixin, generic.ListView):
     model = BookInstance
     template_name = 'catalog/bookinstance_list_borrowed_by_user.html'
     paginate_by = 10
+    keyset_ordering = ('due_back', 'id')
 
     def get_queryset(self):
         return BookInstance.objects \
+                           .select_related('book') \
                            .filter(borrower=self.request.user) \
                            .filter(status__exact=BookInstance.ON_LOAN_STATUS) \
                            .order_by('due_back')
 
-class LoanedBooksListView(PermissionRequiredMixin, LoginRequiredMixin, generic.ListView):
+class LoanedBooksListView(PermissionRequiredMixin, LoginRequiredMixin, KeysetPaginationMixin, generic.ListView):
     model = BookInstance
     template_name = 'catalog/bookinstance_list_borrowed.html'
     permission_required = 'catalog.can_mark_returned'
     paginate_by = 10
+    keyset_ordering = ('due_back', 'id')
 
     def get_queryset(self):
         return BookInstance.objects \
+                           .select_related('book', 'borrower') \
                            .filter(status__exact=BookInstance.ON_LOAN_STATUS) \
                            .order_by('due_back')
 
@@ -88,8 +146,13 @@ def renew_book_librarian(request, pk):
         form = RenewBookForm(request.POST)
 
         if form.is_valid():
-            book_inst.due_back = form.cleaned_data['renewal_date']
-            book_inst.save()
+            try:
+                loans.renew(book_inst.pk, form.cleaned_data['renewal_date'])
+            except loans.LoanConflict as exc:
+                # returned by someone else since this page was loaded
+                form.add_error(None, str(exc))
+                context = {'form': form, 'bookinst': exc.copy}
+                return render(request, 'catalog/book_renew_librarian.html', context, status=409)
             return HttpResponseRedirect(reverse('borrowed'))
 
     else:
@@ -99,6 +162,34 @@ def renew_book_librarian(request, pk):
     return render(request, 'catalog/book_renew_librarian.html', {'form': form, 'bookinst':book_inst})
 
 
+@permission_required('catalog.can_mark_returned')
+def export_catalog(request, dataset, fmt):
+    if dataset not in export.DATASETS or fmt not in export.FORMATS:
+        raise Http404
+    content_type = 'application/x-ndjson' if fmt == 'ndjson' else 'text/csv'
+    response = StreamingHttpResponse(
+        export.export(dataset, fmt, stats=export.ExportStats(dataset)),
+        content_type='{}; charset=utf-8'.format(content_type),
+    )
+    response['Content-Disposition'] = 'attachment; filename="{}.{}"'.format(dataset, fmt)
+    return response
+
+
+@staff_member_required
+def cache_stats(request):
+    """
+    Hit and miss counts of the book copies fragment cache.
+    """
+    return JsonResponse({'copies': fragments.stats()})
+
+
+def metrics(request):
+    """
+    Per-route request timing histograms for Prometheus to scrape.
+    """
+    return HttpResponse(timing.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 class AuthorCreate(CreateView):
     model = Author
     fields = '__all__'
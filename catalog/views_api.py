@@ -1,35 +1,454 @@
-from rest_framework import viewsets
+import uuid
 
-from .models import Genre, Language, Book, Author, BookInstance
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.db.models import Prefetch
+from django.http import Http404
+from rest_framework import mixins, permissions, serializers, status, viewsets
+from rest_framework.decorators import detail_route, list_route
+from rest_framework.response import Response
+
+from . import bulk, conditional, holds, jobs, loans
+from .models import Genre, Language, Book, Author, BookInstance, Hold, Job
+from .pagination_api import CatalogLimitOffsetPagination
+from .search import search as search_books
 from .serializers import (
     AuthorSerializer,
     BookSerializer,
+    BookInstanceBulkSerializer,
     BookInstanceSerializer,
+    CheckoutSerializer,
     GenreSerializer,
+    HoldSerializer,
+    JobSerializer,
     LanguageSerializer,
+    RenewSerializer,
 )
 
 
-class GenreViewSet(viewsets.ModelViewSet):
-    queryset = Genre.objects.all()
+class SparseFieldsetViewSetMixin(object):
+    """
+    Support ``?fields=a,b`` on reads: the serializer outputs only those
+    fields and the queryset loads only the matching columns.
+    """
+
+    fields_query_param = 'fields'
+
+    def get_requested_fields(self):
+        if self.request is None or self.request.method not in ('GET', 'HEAD'):
+            return None
+        value = self.request.query_params.get(self.fields_query_param)
+        if not value:
+            return None
+
+        requested = [name.strip() for name in value.split(',') if name.strip()]
+        available = self.get_serializer_class()().fields
+        unknown = [name for name in requested if name not in available]
+        if unknown:
+            raise serializers.ValidationError({
+                self.fields_query_param: 'Unknown fields: {}.'.format(', '.join(unknown)),
+            })
+        return requested
+
+    def get_queryset(self):
+        queryset = super(SparseFieldsetViewSetMixin, self).get_queryset()
+        requested = self.get_requested_fields()
+        model_fields = {field.name: field for field in queryset.model._meta.get_fields()}
+
+        if requested is None:
+            many_to_many = [
+                name for name, field in model_fields.items()
+                if field.many_to_many and not field.auto_created
+            ]
+            return queryset.prefetch_related(*many_to_many)
+
+        columns = {queryset.model._meta.pk.name}
+        for name in requested:
+            field = model_fields.get(name)
+            if field is None or field.auto_created:
+                continue
+            if field.many_to_many:
+                queryset = queryset.prefetch_related(
+                    Prefetch(name, queryset=field.related_model.objects.only('pk'))
+                )
+            elif field.concrete:
+                columns.add(name)
+        return queryset.only(*columns)
+
+    def get_serializer(self, *args, **kwargs):
+        requested = self.get_requested_fields()
+        if requested is not None:
+            kwargs['fields'] = requested
+        return super(SparseFieldsetViewSetMixin, self).get_serializer(*args, **kwargs)
+
+
+class ConditionalGetViewSetMixin(object):
+    """
+    Answer conditional GETs of list and detail endpoints before any
+    serializer work: lists are validated by the version of the model's
+    table, objects by their ``updated_at`` column when they have one.
+    """
+
+    def get_list_validators(self):
+        return conditional.table_validators(self.queryset.model)
+
+    def get_object_validators(self):
+        model = self.queryset.model
+        if not any(field.name == 'updated_at' for field in model._meta.concrete_fields):
+            return conditional.table_validators(model)
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            updated_at = model.objects \
+                              .filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]}) \
+                              .values_list('updated_at', flat=True) \
+                              .first()
+        except (TypeError, ValueError, DjangoValidationError):
+            return None
+        if updated_at is None:
+            return None
+        return (updated_at,), updated_at
+
+    def _representation(self, validators):
+        # the same resource renders differently as JSON and in the browsable API
+        if validators is None:
+            return None
+        parts, last_modified = validators
+        return (self.request.accepted_renderer.format,) + parts, last_modified
+
+    def list(self, request, *args, **kwargs):
+        render = super(ConditionalGetViewSetMixin, self).list
+        return conditional.respond(
+            request,
+            self._representation(self.get_list_validators()),
+            lambda: render(request, *args, **kwargs),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        render = super(ConditionalGetViewSetMixin, self).retrieve
+        return conditional.respond(
+            request,
+            self._representation(self.get_object_validators()),
+            lambda: render(request, *args, **kwargs),
+        )
+
+
+class GenreViewSet(ConditionalGetViewSetMixin, SparseFieldsetViewSetMixin, viewsets.ModelViewSet):
+    queryset = Genre.objects.order_by('name', 'id')
     serializer_class = GenreSerializer
+    cursor_ordering = ('name', 'id')
 
 
-class LanguageViewSet(viewsets.ModelViewSet):
-    queryset = Language.objects.all()
+class LanguageViewSet(ConditionalGetViewSetMixin, SparseFieldsetViewSetMixin, viewsets.ModelViewSet):
+    queryset = Language.objects.order_by('name', 'id')
     serializer_class = LanguageSerializer
+    cursor_ordering = ('name', 'id')
 
 
-class BookViewSet(viewsets.ModelViewSet):
-    queryset = Book.objects.all()
+class BookViewSet(ConditionalGetViewSetMixin, SparseFieldsetViewSetMixin, viewsets.ModelViewSet):
+    """
+    Books with their copy counts. List filter: ``?available=true``;
+    ``?sort=available`` lists the most available books first.
+    """
+    queryset = Book.objects.order_by('title', 'id')
     serializer_class = BookSerializer
 
+    @property
+    def cursor_ordering(self):
+        if self.request.query_params.get('sort') == 'available':
+            return Book.AVAILABILITY_ORDERING
+        return ('title', 'id')
+
+    def get_queryset(self):
+        queryset = super(BookViewSet, self).get_queryset()
+        if self.request.query_params.get('available') in ('1', 'true'):
+            queryset = queryset.available()
+        return queryset.order_by(*self.cursor_ordering)
+
+    # copy writes change the counts
+    def get_list_validators(self):
+        return conditional.table_validators(Book, BookInstance)
+
+    @list_route(methods=['get'], url_path='search')
+    def search(self, request):
+        """
+        Books matching ``?q=``, best matches first, paginated by limit and offset.
+        """
+        queryset = Book.objects.prefetch_related('genre')
+        results = search_books(request.query_params.get('q', ''), queryset)
+        paginator = CatalogLimitOffsetPagination()
+        page = paginator.paginate_queryset(results, request, view=self)
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
 
-class AuthorViewSet(viewsets.ModelViewSet):
-    queryset = Author.objects.all()
+class AuthorViewSet(ConditionalGetViewSetMixin, SparseFieldsetViewSetMixin, viewsets.ModelViewSet):
+    queryset = Author.objects.order_by('last_name', 'first_name', 'id')
     serializer_class = AuthorSerializer
+    cursor_ordering = ('last_name', 'first_name', 'id')
+
+    def get_queryset(self):
+        queryset = super(AuthorViewSet, self).get_queryset()
+        requested = self.get_requested_fields()
+        if requested is None or 'books' in requested:
+            books = Book.objects.order_by('title', 'id')
+            queryset = queryset.prefetch_related(Prefetch('book_set', queryset=books))
+        return queryset
+
+    # authors are listed with their books and copy counts
+    def get_list_validators(self):
+        return conditional.table_validators(Author, Book, BookInstance)
+
+    def get_object_validators(self):
+        try:
+            return conditional.author_validators(self.kwargs['pk'])
+        except ValueError:
+            return None
+
+
+class BookInstanceViewSet(ConditionalGetViewSetMixin, SparseFieldsetViewSetMixin, viewsets.ModelViewSet):
+    queryset = BookInstance.objects.order_by('id')
+    serializer_class = BookInstanceSerializer
+    cursor_ordering = ('id',)
+
+    # The post_save and post_delete handlers reserve or requeue copies for
+    # holds after save() and delete() have returned; wrap them together so
+    # the change and its hold bookkeeping commit as one.
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            serializer.save()
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            serializer.save()
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            instance.delete()
+
+    @list_route(methods=['post', 'patch', 'delete'], url_path='bulk')
+    def bulk(self, request):
+        """
+        Create (POST), update (PATCH) or delete (DELETE) a list of copies in
+        one transaction. Nothing is written unless every item is valid;
+        otherwise the response lists the errors of each item in order.
+        """
+        items = request.data
+        if not isinstance(items, list) or not items:
+            return Response(
+                {'detail': 'Expected a non-empty list of items.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        max_batch_size = getattr(settings, 'BULK_MAX_BATCH_SIZE', 5000)
+        if len(items) > max_batch_size:
+            return Response(
+                {'detail': 'At most {} items are accepted per request.'.format(max_batch_size)},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        if request.method == 'POST':
+            return self._bulk_create(items)
+        if request.method == 'PATCH':
+            return self._bulk_update(items)
+        return self._bulk_delete(items)
+
+    @detail_route(methods=['post'])
+    def checkout(self, request, pk=None):
+        """
+        Lend an available copy to ``borrower``; 409 if it is not available.
+        """
+        serializer = CheckoutSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return self._loan_action(loans.checkout, pk, **serializer.validated_data)
+
+    @detail_route(methods=['post'], url_path='return')
+    def return_copy(self, request, pk=None):
+        """
+        Take back a copy on loan; 409 if it is not on loan.
+        """
+        return self._loan_action(loans.return_copy, pk)
+
+    @detail_route(methods=['post'])
+    def renew(self, request, pk=None):
+        """
+        Set a new ``due_back`` on a copy on loan (to ``borrower``, if given);
+        409 if it is not.
+        """
+        serializer = RenewSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return self._loan_action(loans.renew, pk, **serializer.validated_data)
+
+    def _loan_action(self, action, pk, **kwargs):
+        try:
+            pk = uuid.UUID(pk)
+        except ValueError:
+            raise Http404
+        try:
+            copy = action(pk, **kwargs)
+        except BookInstance.DoesNotExist:
+            raise Http404
+        except loans.LoanConflict as exc:
+            return Response(
+                {'detail': str(exc), 'status': exc.copy.status},
+                status=status.HTTP_409_CONFLICT,
+            )
+        return Response(BookInstanceSerializer(copy).data)
+
+    def _parse_ids(self, values, errors):
+        """
+        Return the UUID of every value, recording per-item errors for
+        malformed and repeated ids.
+        """
+        ids = []
+        seen = set()
+        for index, value in enumerate(values):
+            try:
+                pk = uuid.UUID(str(value)) if value is not None else None
+            except ValueError:
+                pk = None
+                errors[index].setdefault('id', []).append('Must be a valid UUID.')
+            if pk is not None and pk in seen:
+                errors[index].setdefault('id', []).append('Duplicate id in this request.')
+            seen.add(pk)
+            ids.append(pk)
+        return ids
+
+    def _validate(self, items, errors, **kwargs):
+        serializer = BookInstanceBulkSerializer(data=items, many=True, **kwargs)
+        if not serializer.is_valid():
+            for index, item_errors in enumerate(serializer.errors):
+                for field, messages in item_errors.items():
+                    errors[index].setdefault(field, []).extend(messages)
+        return serializer
+
+    def _error_response(self, errors):
+        return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+    def _bulk_create(self, items):
+        errors = [{} for _ in items]
+        serializer = self._validate(items, errors)
+
+        given = [item.get('id') if isinstance(item, dict) else None for item in items]
+        ids = self._parse_ids(given, errors)
+        existing = bulk.in_bulk(BookInstance.objects.only('id'), [pk for pk in ids if pk])
+        for index, pk in enumerate(ids):
+            if pk in existing:
+                errors[index].setdefault('id', []).append('Book instance with this id already exists.')
+
+        if any(errors):
+            return self._error_response(errors)
+        instances = bulk.create_instances(serializer.validated_data)
+        return Response(
+            BookInstanceSerializer(instances, many=True).data,
+            status=status.HTTP_201_CREATED,
+        )
+
+    def _bulk_update(self, items):
+        errors = [{} for _ in items]
+        serializer = self._validate(items, errors, partial=True)
+
+        given = [item.get('id') if isinstance(item, dict) else None for item in items]
+        ids = self._parse_ids(given, errors)
+        instances = bulk.in_bulk(BookInstance.objects.all(), [pk for pk in ids if pk])
+        for index, pk in enumerate(ids):
+            if pk is None and not errors[index].get('id'):
+                errors[index]['id'] = ['This field is required.']
+            elif pk is not None and pk not in instances:
+                errors[index].setdefault('id', []).append('Book instance does not exist.')
+
+        if any(errors):
+            return self._error_response(errors)
+        changes = [
+            {name: value for name, value in item.items() if name != 'id'}
+            for item in serializer.validated_data
+        ]
+        updated = bulk.update_instances([instances[pk] for pk in ids], changes)
+        return Response(BookInstanceSerializer(updated, many=True).data)
+
+    def _bulk_delete(self, items):
+        errors = [{} for _ in items]
+        given = [item.get('id') if isinstance(item, dict) else item for item in items]
+        ids = self._parse_ids(given, errors)
+        existing = bulk.in_bulk(BookInstance.objects.only('id'), [pk for pk in ids if pk])
+        for index, pk in enumerate(ids):
+            if pk is None and not errors[index].get('id'):
+                errors[index]['id'] = ['This field is required.']
+            elif pk is not None and pk not in existing:
+                errors[index].setdefault('id', []).append('Book instance does not exist.')
+
+        if any(errors):
+            return self._error_response(errors)
+        bulk.delete_instances(ids)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class HoldViewSet(mixins.CreateModelMixin,
+                  mixins.RetrieveModelMixin,
+                  mixins.DestroyModelMixin,
+                  mixins.ListModelMixin,
+                  viewsets.GenericViewSet):
+    """
+    Hold queues: POST joins the queue for ``book``, DELETE leaves it, and
+    ``position`` is 1 at the head of the queue and 0 once a copy is reserved.
+    List filters: ``?book=`` and ``?patron=``.
+    """
+    serializer_class = HoldSerializer
+    cursor_ordering = ('id',)
+
+    def get_queryset(self):
+        queryset = Hold.objects.order_by('id')
+        for name in ('book', 'patron'):
+            value = self.request.query_params.get(name)
+            if value:
+                if not value.isdigit():
+                    raise serializers.ValidationError({name: 'Must be an id.'})
+                queryset = queryset.filter(**{name: value})
+        return holds.with_positions(queryset)
+
+    def perform_create(self, serializer):
+        data = serializer.validated_data
+        try:
+            serializer.instance = holds.place(data['book'], data['patron'])
+        except holds.HoldError as exc:
+            raise serializers.ValidationError({'detail': str(exc)})
+
+    def perform_destroy(self, instance):
+        holds.cancel(instance)
+
+
+class JobViewSet(mixins.CreateModelMixin,
+                 mixins.RetrieveModelMixin,
+                 mixins.ListModelMixin,
+                 viewsets.GenericViewSet):
+    """
+    Background jobs, for staff: POST queues task ``name`` with ``kwargs``
+    and answers 202 at once; poll the job for its ``status`` and ``result``.
+    List filter: ``?status=``.
+    """
+    serializer_class = JobSerializer
+    permission_classes = (permissions.IsAdminUser,)
+    cursor_ordering = ('-id',)
+
+    def get_queryset(self):
+        queryset = Job.objects.order_by('-id')
+        value = self.request.query_params.get('status')
+        if value:
+            queryset = queryset.filter(status=value)
+        return queryset
 
+    def create(self, request, *args, **kwargs):
+        response = super(JobViewSet, self).create(request, *args, **kwargs)
+        response.status_code = status.HTTP_202_ACCEPTED
+        return response
 
-class BookInstanceViewSet(viewsets.ModelViewSet):
-    queryset = BookInstance.objects.all()
-    serializer_class = BookInstanceSerializer
\ No newline at end of file
+    def perform_create(self, serializer):
+        data = serializer.validated_data
+        try:
+            serializer.instance = jobs.enqueue(
+                data['name'],
+                data.get('kwargs'),
+                run_at=data.get('run_at'),
+                max_attempts=data.get('max_attempts'),
+            )
+        except jobs.JobError as exc:
+            raise serializers.ValidationError({'kwargs': str(exc)})
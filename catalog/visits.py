@@ -0,0 +1,235 @@
+"""
+Per-visitor page view counting for the index page.
+
+Three modes are available through the ``VISITS_MODE`` setting:
+
+* ``session`` - the original behaviour, one session write per page view.
+* ``cookie`` - the count lives in a signed cookie; nothing is written on
+  the server.
+* ``buffered`` - visitors are identified by a signed cookie and their
+  counts are kept in the ``VisitCount`` table. Increments are buffered in
+  process memory and flushed in batches of ``VISITS_FLUSH_SIZE`` or every
+  ``VISITS_FLUSH_INTERVAL`` seconds, whichever comes first.
+"""
+import atexit
+import logging
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, transaction
+from django.db.models import F
+
+from .models import VisitCount
+
+
+SESSION_MODE = 'session'
+COOKIE_MODE = 'cookie'
+BUFFERED_MODE = 'buffered'
+MODES = (SESSION_MODE, COOKIE_MODE, BUFFERED_MODE)
+
+COOKIE_NAME = 'num_visits'
+VISITOR_COOKIE_NAME = 'visitor'
+COOKIE_SALT = 'catalog.visits'
+COOKIE_MAX_AGE = 365 * 24 * 60 * 60
+
+logger = logging.getLogger(__name__)
+
+
+def get_mode():
+    mode = getattr(settings, 'VISITS_MODE', COOKIE_MODE)
+    if mode not in MODES:
+        raise ValueError('Unknown VISITS_MODE: {}'.format(mode))
+    return mode
+
+
+class VisitBuffer(object):
+    """
+    Thread-safe in-memory buffer of pending increments per visitor.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = Counter()
+        self._buffered_visits = 0
+        self._last_flush = time.time()
+        self.visits = 0
+        self.writes = 0
+
+    def pending(self, visitor_id):
+        with self._lock:
+            return self._pending[visitor_id]
+
+    def add(self, visitor_id):
+        with self._lock:
+            self._pending[visitor_id] += 1
+            self._buffered_visits += 1
+            self.visits += 1
+            flush_size = getattr(settings, 'VISITS_FLUSH_SIZE', 100)
+            flush_interval = getattr(settings, 'VISITS_FLUSH_INTERVAL', 10)
+            due = (
+                self._buffered_visits >= flush_size or
+                time.time() - self._last_flush >= flush_interval
+            )
+        if due:
+            # a visit counter must never fail the page; the increments wait for the next flush
+            try:
+                self.flush()
+            except DatabaseError:
+                logger.exception('Could not flush the buffered visits.')
+
+    def flush(self):
+        """
+        Write all pending increments in one transaction.
+
+        If the write fails, the increments are put back for the next flush,
+        which happens after another batch or interval rather than on the very
+        next visit.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+            self._buffered_visits = 0
+            self._last_flush = time.time()
+        if not pending:
+            return
+
+        try:
+            with transaction.atomic():
+                writes = self._write(pending)
+        except Exception:
+            with self._lock:
+                self._pending.update(pending)
+            raise
+
+        with self._lock:
+            self.writes += writes
+
+    def _write(self, pending):
+        """
+        Add ``pending`` increments to the stored counts and return the
+        number of statements issued: one update per distinct increment and
+        one insert for the new visitors.
+
+        Another process may insert some of the new visitors between the
+        select and the insert, which then fails; the new visitors are
+        looked up again and those now stored are updated instead.
+        """
+        writes = 0
+        while True:
+            existing = set(
+                VisitCount.objects
+                          .filter(visitor_id__in=list(pending))
+                          .values_list('visitor_id', flat=True)
+            )
+            by_increment = {}
+            for visitor_id in existing:
+                by_increment.setdefault(pending[visitor_id], []).append(visitor_id)
+            for increment, visitor_ids in by_increment.items():
+                VisitCount.objects \
+                          .filter(visitor_id__in=visitor_ids) \
+                          .update(count=F('count') + increment)
+                writes += 1
+            new = [
+                VisitCount(visitor_id=visitor_id, count=increment)
+                for visitor_id, increment in pending.items()
+                if visitor_id not in existing
+            ]
+            if not new:
+                return writes
+            try:
+                with transaction.atomic():
+                    VisitCount.objects.bulk_create(new)
+            except IntegrityError:
+                pending = Counter({visit_count.visitor_id: visit_count.count for visit_count in new})
+                continue
+            return writes + 1
+
+    def reset(self):
+        with self._lock:
+            self._pending = Counter()
+            self._buffered_visits = 0
+            self._last_flush = time.time()
+            self.visits = 0
+            self.writes = 0
+
+
+buffer = VisitBuffer()
+
+
+def _flush_on_exit():
+    try:
+        buffer.flush()
+    except Exception:
+        pass
+
+atexit.register(_flush_on_exit)
+
+
+def _visitor_id(request):
+    visitor_id = request.get_signed_cookie(VISITOR_COOKIE_NAME, default=None, salt=COOKIE_SALT)
+    try:
+        return uuid.UUID(visitor_id)
+    except (TypeError, ValueError):
+        return None
+
+
+def previous_visits(request):
+    """
+    Return how many times this visitor has seen the page before.
+    """
+    mode = get_mode()
+
+    if mode == SESSION_MODE:
+        return request.session.get('num_visits', 0)
+
+    if mode == COOKIE_MODE:
+        value = request.get_signed_cookie(COOKIE_NAME, default='0', salt=COOKIE_SALT)
+        try:
+            return max(int(value), 0)
+        except ValueError:
+            return 0
+
+    visitor_id = _visitor_id(request)
+    if visitor_id is None:
+        return 0
+    stored = VisitCount.objects \
+                       .filter(visitor_id=visitor_id) \
+                       .values_list('count', flat=True) \
+                       .first()
+    return (stored or 0) + buffer.pending(visitor_id)
+
+
+def record_visit(request, response, num_visits):
+    """
+    Count the current page view; ``num_visits`` is the previous total.
+    """
+    mode = get_mode()
+
+    if mode == SESSION_MODE:
+        request.session['num_visits'] = num_visits + 1
+
+    elif mode == COOKIE_MODE:
+        response.set_signed_cookie(
+            COOKIE_NAME,
+            num_visits + 1,
+            salt=COOKIE_SALT,
+            max_age=COOKIE_MAX_AGE,
+            httponly=True,
+        )
+
+    else:
+        visitor_id = _visitor_id(request)
+        if visitor_id is None:
+            visitor_id = uuid.uuid4()
+            response.set_signed_cookie(
+                VISITOR_COOKIE_NAME,
+                str(visitor_id),
+                salt=COOKIE_SALT,
+                max_age=COOKIE_MAX_AGE,
+                httponly=True,
+            )
+        buffer.add(visitor_id)
+
+    return response
@@ -19,6 +19,27 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 env = environ.Env(
     SECRET_KEY=str,
     DEBUG=(bool, False),
+    VISITS_MODE=(str, 'cookie'),
+    VISITS_FLUSH_SIZE=(int, 100),
+    VISITS_FLUSH_INTERVAL=(int, 10),
+    BULK_MAX_BATCH_SIZE=(int, 5000),
+    COPIES_CACHE_TIMEOUT=(int, 3600),
+    CONN_MAX_AGE=(int, 60),
+    SQLITE_JOURNAL_MODE=(str, 'wal'),
+    SQLITE_SYNCHRONOUS=(str, 'normal'),
+    SQLITE_MMAP_SIZE=(int, 256 * 1024 * 1024),
+    SQLITE_CACHE_SIZE=(int, -64000),
+    SQLITE_BUSY_TIMEOUT=(int, 5000),
+    SQLITE_TRANSACTION_MODE=(str, 'deferred'),
+    DATABASE_REPLICAS=(list, []),
+    REPLICA_PIN_SECONDS=(int, 10),
+    NPLUSONE_MODE=(str, 'off'),
+    NPLUSONE_THRESHOLD=(int, 5),
+    JOBS_VISIBILITY_TIMEOUT=(int, 300),
+    JOBS_MAX_ATTEMPTS=(int, 5),
+    JOBS_RETRY_DELAY=(int, 10),
+    JOBS_RETRY_MAX_DELAY=(int, 3600),
+    EXPORT_ROOT=(str, os.path.join(BASE_DIR, 'exports')),
 )
 environ.Env.read_env(os.path.join(BASE_DIR, '.env'))
 
@@ -48,7 +69,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'catalog.timing.TimingMiddleware',
+    'catalog.nplusone.NPlusOneMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'catalog.middleware.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -61,7 +85,7 @@ ROOT_URLCONF = 'config.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'catalog.timing.TimedDjangoTemplates',
         'DIRS': [
             './templates',
         ],
@@ -83,13 +107,50 @@ WSGI_APPLICATION = 'config.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/1.10/ref/settings/#databases
 
+# config.sqlite3 applies the PRAGMAs below to every new connection; see
+# config/sqlite3/base.py. SQLITE_CACHE_SIZE is in pages, or KiB when negative.
+# SQLITE_TRANSACTION_MODE=immediate makes every atomic block take the write
+# lock, read-only ones such as the admin's change forms included.
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'config.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'CONN_MAX_AGE': env('CONN_MAX_AGE'),
+        'OPTIONS': {
+            'pragmas': {
+                'journal_mode': env('SQLITE_JOURNAL_MODE'),
+                'synchronous': env('SQLITE_SYNCHRONOUS'),
+                'mmap_size': env('SQLITE_MMAP_SIZE'),
+                'cache_size': env('SQLITE_CACHE_SIZE'),
+                'busy_timeout': env('SQLITE_BUSY_TIMEOUT'),
+            },
+            'transaction_mode': env('SQLITE_TRANSACTION_MODE'),
+        },
     }
 }
 
+# Read replicas, given as comma-separated SQLite file names (e.g.
+# DATABASE_REPLICAS=replica.sqlite3); refresh them with `sync_replicas`.
+# catalog.routers sends catalog reads of GET requests to them, and a client
+# stays on the primary for REPLICA_PIN_SECONDS after each write.
+DATABASE_REPLICAS = []
+for index, name in enumerate(env('DATABASE_REPLICAS'), start=1):
+    alias = 'replica_{}'.format(index)
+    DATABASES[alias] = dict(
+        DATABASES['default'],
+        NAME=os.path.join(BASE_DIR, name),
+        TEST={'MIRROR': 'default'},
+    )
+    DATABASE_REPLICAS.append(alias)
+DATABASE_ROUTERS = ['catalog.routers.ReplicaRouter']
+REPLICA_PIN_SECONDS = env('REPLICA_PIN_SECONDS')
+
+# Use a shared cache (e.g. CACHE_URL=memcache://127.0.0.1:11211) when running
+# several processes so cached fragments and their statistics are shared.
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/1.10/ref/settings/#auth-password-validators
@@ -132,3 +193,33 @@ STATIC_URL = '/static/'
 LOGIN_REDIRECT_URL = '/'
 
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+
+# Index page visit counting: 'session', 'cookie' or 'buffered' (see catalog.visits)
+VISITS_MODE = env('VISITS_MODE')
+VISITS_FLUSH_SIZE = env('VISITS_FLUSH_SIZE')
+VISITS_FLUSH_INTERVAL = env('VISITS_FLUSH_INTERVAL')
+
+# Largest list accepted by the bulk API endpoints
+BULK_MAX_BATCH_SIZE = env('BULK_MAX_BATCH_SIZE')
+
+# Seconds a rendered copies section of a book page stays cached (see catalog.fragments)
+COPIES_CACHE_TIMEOUT = env('COPIES_CACHE_TIMEOUT')
+
+# Repeated query detection: 'off', 'log' or 'raise' (see catalog.nplusone)
+NPLUSONE_MODE = env('NPLUSONE_MODE')
+NPLUSONE_THRESHOLD = env('NPLUSONE_THRESHOLD')
+
+# Background jobs (see catalog.jobs): seconds a worker leases a job for,
+# runs per job, and the first and longest delay between retries
+JOBS_VISIBILITY_TIMEOUT = env('JOBS_VISIBILITY_TIMEOUT')
+JOBS_MAX_ATTEMPTS = env('JOBS_MAX_ATTEMPTS')
+JOBS_RETRY_DELAY = env('JOBS_RETRY_DELAY')
+JOBS_RETRY_MAX_DELAY = env('JOBS_RETRY_MAX_DELAY')
+
+# Where the export_catalog job writes its files
+EXPORT_ROOT = env('EXPORT_ROOT')
+
+REST_FRAMEWORK = {
+    'DEFAULT_PAGINATION_CLASS': 'catalog.pagination_api.CatalogPagination',
+    'PAGE_SIZE': 50,
+}
@@ -20,11 +20,14 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.views.generic import RedirectView
 
+from catalog import views as catalog_views
+
 urlpatterns = [
     url(r'^admin/', admin.site.urls),
     url(r'^catalog/', include('catalog.urls')),
     url(r'^api/catalog/', include('catalog.urls_api')),
     url(r'^accounts/', include('django.contrib.auth.urls')),
+    url(r'^metrics$', catalog_views.metrics, name='metrics'),
     url(r'^$', RedirectView.as_view(url='/catalog/', permanent=True)),
 ]
 